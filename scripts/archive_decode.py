@@ -0,0 +1,68 @@
+"""Decode telemetry archive records received with ``receive_archive``.
+
+Prints one line per record with its time and, for beacons, the decoded
+fields. Records that fail their CRC are counted and skipped.
+
+Usage:
+    python scripts/archive_decode.py archive.bin
+    python scripts/archive_decode.py archive.bin --json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4 import beacon_codec  # noqa: E402
+from proveskit_rp2040_v4.telemetry_archive import (  # noqa: E402
+    KIND_BEACON,
+    RECORD_LENGTH,
+    unpack_record,
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--json", action="store_true", help="One JSON per line")
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as f:
+        data = f.read()
+
+    corrupt = 0
+    for offset in range(0, len(data) - RECORD_LENGTH + 1, RECORD_LENGTH):
+        unpacked = unpack_record(data[offset : offset + RECORD_LENGTH])
+        if unpacked is None:
+            corrupt += 1
+            continue
+        timestamp, kind, payload = unpacked
+        fields = beacon_codec.decode(payload) if kind == KIND_BEACON else None
+        if args.json:
+            print(
+                json.dumps(
+                    {
+                        "time": timestamp,
+                        "kind": kind,
+                        "fields": fields,
+                        "payload": None if fields else payload.hex(),
+                    }
+                )
+            )
+        else:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(timestamp))
+            print(f"{when} kind {kind} {fields if fields else payload.hex()}")
+
+    print(
+        f"{len(data) // RECORD_LENGTH} records, {corrupt} corrupt",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""Benchmark bulk transfer throughput over a simulated lossy, delayed channel.
+
+Runs the flight software's selective-repeat sender and receiver against each
+other on a half-duplex channel. Packets take their LoRa time on air, with the
+settings from config.json, then ``--delay`` seconds more to arrive, and each
+is lost with the given probability. An acknowledgement that arrives while the
+sender is transmitting is lost too. A window of 1 is stop-and-wait, which is
+how the ``PacketManager`` moves multi-packet messages.
+
+Usage:
+    python scripts/arq_benchmark.py
+    python scripts/arq_benchmark.py --size 50000 --delay 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4 import bulk_transfer  # noqa: E402
+from proveskit_rp2040_v4.airtime import (  # noqa: E402
+    RADIOHEAD_HEADER_LENGTH,
+    time_on_air,
+)
+
+LOSS_RATES = (0.0, 0.05, 0.15, 0.3)
+WINDOWS = (1, 4, 8, 16, 32)
+
+
+def simulate(
+    data: bytes,
+    segment_size: int,
+    window: int,
+    loss: float,
+    delay: float,
+    airtime,
+    seed: int,
+) -> tuple[float, bulk_transfer.SelectiveRepeatSender]:
+    """Returns the seconds the transfer took and the finished sender."""
+    rng = random.Random(seed)
+    received = []
+    sender = bulk_transfer.SelectiveRepeatSender(
+        bulk_transfer.BytesSegments(data, segment_size), 1, window
+    )
+    receiver = bulk_transfer.SelectiveRepeatReceiver(received.append)
+
+    now = 0.0
+    # (arrival time, ack) on the way to the sender
+    acks = []
+    while not sender.done:
+        burst_started = now
+        for packet in sender.packets_due(now):
+            now += airtime(len(packet))
+            if rng.random() < loss:
+                continue
+            ack = receiver.on_packet(packet)
+            if ack is not None and rng.random() >= loss:
+                acks.append((now + delay + airtime(len(ack)) + delay, ack))
+        sender.burst_sent(now)
+
+        # Half duplex: the sender cannot hear while it is transmitting
+        acks = [(t, a) for t, a in acks if not burst_started < t < now]
+        acks.sort()
+
+        deadline = sender.next_deadline()
+        if acks and (deadline is None or acks[0][0] <= deadline):
+            arrival, ack = acks.pop(0)
+            now = max(now, arrival)
+            sender.on_ack(ack, now)
+        elif deadline is not None:
+            now = max(now, deadline)
+
+    assert b"".join(received) == data
+    return now, sender
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"))
+    parser.add_argument("--size", type=int, default=20000, help="Bytes to send")
+    parser.add_argument("--segment", type=int, default=200, help="Bytes per packet")
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=0.1,
+        help="One-way latency on top of time on air, in seconds",
+    )
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        lora = json.load(f)["radio"]["lora"]
+
+    def airtime(length: int) -> float:
+        return time_on_air(
+            length + RADIOHEAD_HEADER_LENGTH,
+            lora["spreading_factor"],
+            lora["coding_rate"],
+            lora["cyclic_redundancy_check"],
+        )
+
+    data = bytes(random.Random(0).randrange(256) for _ in range(args.size))
+    capacity = args.segment / airtime(args.segment + bulk_transfer.DATA_HEADER_LENGTH)
+    print(
+        f"{args.size} bytes in {args.segment} byte segments, "
+        f"SF{lora['spreading_factor']} CR4/{lora['coding_rate']}, "
+        f"{args.delay * 1000:.0f} ms latency, channel capacity {capacity:.0f} B/s"
+    )
+    print(
+        f"{'loss':>5} {'window':>6} {'seconds':>8} {'B/s':>7} {'of cap':>7} "
+        f"{'retx':>6} {'timeout':>8}"
+    )
+    for loss in LOSS_RATES:
+        for window in WINDOWS:
+            seconds = retransmissions = timeout = 0.0
+            for run in range(args.runs):
+                elapsed, sender = simulate(
+                    data, args.segment, window, loss, args.delay, airtime, run
+                )
+                seconds += elapsed / args.runs
+                retransmissions += sender.stats.retransmissions / args.runs
+                timeout += sender.timeout / args.runs
+
+            throughput = args.size / seconds
+            print(
+                f"{loss:>5.0%} {window:>6} {seconds:>8.1f} {throughput:>7.0f} "
+                f"{throughput / capacity:>7.0%} {retransmissions:>6.0f} {timeout:>8.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Compare beacon encodings in bytes and LoRa time on air, or decode a beacon.
+
+Besides single beacons, a simulated run of delta beacons is compared with
+sending every beacon in full.
+
+The JSON reference mirrors what ``pysquared.beacon.Beacon`` sends for the
+sensors wired up in the flight software. Time on air uses the LoRa settings
+from config.json.
+
+Usage:
+    python scripts/beacon_report.py
+    python scripts/beacon_report.py --decode 0105...
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4 import beacon_codec  # noqa: E402
+from proveskit_rp2040_v4.airtime import (  # noqa: E402
+    RADIOHEAD_HEADER_LENGTH,
+    time_on_air,
+)
+
+# Header pysquared's PacketManager adds to every packet
+PACKET_MANAGER_HEADER_LENGTH = 4
+
+
+def sample_fields(name: str) -> tuple:
+    boot_time = time.time() - 5000
+    return (
+        beacon_codec.FLAG_IMU_VALID | beacon_codec.FLAG_MAGNETOMETER_VALID,
+        boot_time,
+        5000.4,
+        42,
+        3,
+        (0.12, -9.79, 0.35),
+        (0.012, -0.004, 0.101),
+        (-21.3, 4.5, -38.7),
+        name.encode("utf-8"),
+    )
+
+
+def json_beacon(fields: tuple) -> bytes:
+    state = {
+        "name": fields[8].decode("utf-8"),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "uptime": fields[2],
+        "LSM6DSOXManager_0_acceleration": list(fields[5]),
+        "LSM6DSOXManager_0_angular_velocity": list(fields[6]),
+        "LIS2MDLManager_1_magnetic_field": list(fields[7]),
+        "RFM9xManager_2_modulation": "LoRa",
+        "error_count_3": fields[4],
+        "boot_count_4": fields[3],
+    }
+    return json.dumps(state, separators=(",", ":")).encode("utf-8")
+
+
+def report(config_path: str) -> None:
+    with open(config_path) as f:
+        lora = json.load(f)["radio"]["lora"]
+
+    fields = sample_fields("PROVES-MY_SATELLITE_NAME")
+    buffer = bytearray(256)
+    encodings = {
+        "json (pysquared)": json_beacon(fields),
+        "struct with name": bytes(
+            buffer[: beacon_codec.encode_struct(buffer, *fields)]
+        ),
+        "struct": bytes(buffer[: beacon_codec.encode_struct(buffer, *fields[:-1])]),
+    }
+    if beacon_codec.msgpack is not None:
+        encodings["msgpack"] = beacon_codec.encode_msgpack(*fields[:-1])
+
+    print(
+        f"SF{lora['spreading_factor']} CR4/{lora['coding_rate']} "
+        f"CRC {'on' if lora['cyclic_redundancy_check'] else 'off'}"
+    )
+    print(f"{'encoding':<18} {'bytes':>6} {'on air':>8} {'airtime':>10}")
+    reference = None
+    for name, payload in encodings.items():
+        on_air = len(payload) + PACKET_MANAGER_HEADER_LENGTH + RADIOHEAD_HEADER_LENGTH
+        seconds = time_on_air(
+            on_air,
+            lora["spreading_factor"],
+            lora["coding_rate"],
+            lora["cyclic_redundancy_check"],
+        )
+        if reference is None:
+            reference = seconds
+        print(
+            f"{name:<18} {len(payload):>6} {on_air:>8} {seconds * 1000:>8.1f} ms"
+            f" ({100 * seconds / reference:.0f}%)"
+        )
+
+
+def delta_report(config_path: str, beacons: int, keyframe_interval: int) -> None:
+    """Average airtime of delta beacons over a simulated run of slow drift."""
+    with open(config_path) as f:
+        lora = json.load(f)["radio"]["lora"]
+
+    def airtime(length: int) -> float:
+        return time_on_air(
+            length + PACKET_MANAGER_HEADER_LENGTH + RADIOHEAD_HEADER_LENGTH,
+            lora["spreading_factor"],
+            lora["coding_rate"],
+            lora["cyclic_redundancy_check"],
+        )
+
+    rng = random.Random(0)
+    encoder = beacon_codec.DeltaBeaconEncoder(keyframe_interval)
+    decoder = beacon_codec.DeltaBeaconDecoder()
+    buffer = bytearray(256)
+    fields = list(sample_fields("PROVES-MY_SATELLITE_NAME"))
+
+    full = delta = 0.0
+    full_bytes = delta_bytes = 0
+    for i in range(beacons):
+        fields[2] += 25
+        fields[5] = tuple(v + rng.gauss(0, 0.01) for v in fields[5])
+        fields[6] = tuple(v + rng.gauss(0, 0.002) for v in fields[6])
+        fields[7] = tuple(v + rng.gauss(0, 0.5) for v in fields[7])
+        if rng.random() < 0.05:
+            fields[4] += 1
+        name = fields[8] if i % keyframe_interval == 0 else None
+
+        length = beacon_codec.encode_struct(buffer, *fields[:-1], name)
+        full += airtime(length)
+        full_bytes += length
+
+        length = encoder.encode(buffer, *fields[:-1], name)
+        decoder.decode(bytes(buffer[:length]))
+        delta += airtime(length)
+        delta_bytes += length
+
+    print(
+        f"{beacons} beacons, keyframe every {keyframe_interval}: "
+        f"struct {full_bytes / beacons:.1f} bytes {full * 1000 / beacons:.1f} ms, "
+        f"delta {delta_bytes / beacons:.1f} bytes {delta * 1000 / beacons:.1f} ms "
+        f"({100 * (1 - delta / full):.0f}% less airtime)"
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"))
+    parser.add_argument("--decode", metavar="HEX", help="Decode a beacon payload")
+    parser.add_argument("--beacons", type=int, default=1000)
+    parser.add_argument("--keyframe-interval", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.decode:
+        print(beacon_codec.DeltaBeaconDecoder().decode(bytes.fromhex(args.decode)))
+    else:
+        report(args.config)
+        delta_report(args.config, args.beacons, args.keyframe_interval)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
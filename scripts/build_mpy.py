@@ -0,0 +1,196 @@
+"""Compile CircuitPython libraries to .mpy in parallel with a content-hash cache.
+
+Every ``.py`` file under the given library directories is compiled with
+mpy-cross and the ``.mpy`` is written next to the source, exactly where the
+Makefile expects it. Compiled outputs are cached under ``.mpy-cache`` keyed by
+the source content, its path, the mpy-cross version and the compiler flags, so
+an unchanged file is never compiled twice, even after ``download-libraries``
+reinstalls it.
+
+Per-module optimisation levels are read from ``[tool.mpy-cross]`` in
+pyproject.toml:
+
+    [tool.mpy-cross]
+    optimization = 0
+
+    [tool.mpy-cross.module-optimization]
+    "arducam/*" = 2
+
+Patterns are matched against the path relative to the library directory and
+the first matching pattern wins.
+
+Usage:
+    python scripts/build_mpy.py --mpy-cross tools/mpy-cross-9.0.5 src/flight-software/lib
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import time
+import tomllib
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_DIR = ".mpy-cache"
+PYPROJECT = "pyproject.toml"
+
+
+def load_optimization_config(pyproject: str) -> tuple[int, list[tuple[str, int]]]:
+    """Read the default and per-module optimisation levels from pyproject.toml."""
+    if not os.path.exists(pyproject):
+        return 0, []
+
+    with open(pyproject, "rb") as f:
+        section = tomllib.load(f).get("tool", {}).get("mpy-cross", {})
+
+    default = int(section.get("optimization", 0))
+    overrides = [
+        (pattern, int(level))
+        for pattern, level in section.get("module-optimization", {}).items()
+    ]
+    return default, overrides
+
+
+def optimization_for(
+    relative_path: str, default: int, overrides: list[tuple[str, int]]
+) -> int:
+    """Return the optimisation level for a module path relative to lib."""
+    for pattern, level in overrides:
+        if fnmatch.fnmatch(relative_path, pattern):
+            return level
+    return default
+
+
+def mpy_cross_version(mpy_cross: str) -> str:
+    """Return the version string reported by mpy-cross."""
+    result = subprocess.run(
+        [mpy_cross, "--version"], capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def cache_key(source: bytes, path: str, version: str, flags: list[str]) -> str:
+    """Hash everything that influences the compiled output."""
+    h = hashlib.sha256()
+    h.update(version.encode())
+    h.update(b"\0")
+    h.update(" ".join(flags).encode())
+    h.update(b"\0")
+    # The path is embedded in the .mpy as the source name for tracebacks
+    h.update(path.encode())
+    h.update(b"\0")
+    h.update(source)
+    return h.hexdigest()
+
+
+def find_sources(lib_dirs: list[str]) -> list[tuple[str, str]]:
+    """Return (path, path relative to its lib dir) for every .py file."""
+    sources = []
+    for lib_dir in lib_dirs:
+        for root, _, files in os.walk(lib_dir):
+            for file in sorted(files):
+                if file.endswith(".py"):
+                    path = os.path.join(root, file)
+                    sources.append((path, os.path.relpath(path, lib_dir)))
+    return sources
+
+
+def compile_one(
+    mpy_cross: str,
+    version: str,
+    path: str,
+    optimization: int,
+    cache_dir: str,
+) -> tuple[str, bool, float, str]:
+    """Compile one file, or restore it from the cache.
+
+    Returns:
+        The path, whether it was a cache hit, the elapsed seconds and any
+        compiler error output (empty on success).
+    """
+    start = time.perf_counter()
+    flags = [f"-O{optimization}"]
+
+    with open(path, "rb") as f:
+        key = cache_key(f.read(), path, version, flags)
+
+    cached = os.path.join(cache_dir, key + ".mpy")
+    output = path[: -len(".py")] + ".mpy"
+
+    if os.path.exists(cached):
+        shutil.copyfile(cached, output)
+        return path, True, time.perf_counter() - start, ""
+
+    tmp = cached + f".{os.getpid()}.{id(path)}.tmp"
+    result = subprocess.run(
+        [mpy_cross, *flags, "-o", tmp, path], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return path, False, time.perf_counter() - start, result.stderr.strip()
+
+    os.replace(tmp, cached)
+    shutil.copyfile(cached, output)
+    return path, False, time.perf_counter() - start, ""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("lib_dirs", nargs="+", help="Library directories to compile")
+    parser.add_argument("--mpy-cross", required=True, help="Path to mpy-cross")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--pyproject", default=PYPROJECT)
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Parallel jobs"
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="Only print the summary"
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    version = mpy_cross_version(args.mpy_cross)
+    default, overrides = load_optimization_config(args.pyproject)
+    sources = find_sources(args.lib_dirs)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        results = list(
+            executor.map(
+                lambda source: compile_one(
+                    args.mpy_cross,
+                    version,
+                    source[0],
+                    optimization_for(source[1], default, overrides),
+                    args.cache_dir,
+                ),
+                sources,
+            )
+        )
+    elapsed = time.perf_counter() - start
+
+    hits = 0
+    failures = 0
+    for path, hit, seconds, error in results:
+        hits += hit
+        if error:
+            failures += 1
+            print(f"FAILED {path}\n{error}", file=sys.stderr)
+        elif not args.quiet:
+            print(
+                f"{'cached' if hit else 'compiled':>8} {seconds * 1000:8.1f} ms  {path}"
+            )
+
+    total = len(results)
+    hit_rate = 100.0 * hits / total if total else 100.0
+    print(
+        f"mpy-cross: {total} files in {elapsed:.2f} s with {args.jobs} jobs, "
+        f"{hits} cached ({hit_rate:.0f}% hit rate), {failures} failed"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
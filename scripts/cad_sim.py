@@ -0,0 +1,306 @@
+"""Simulate duty-cycled CAD listening against continuous receive.
+
+Runs the flight loop's listen windows for a number of days: each window
+starts with a beacon, after which the satellite either listens continuously
+or probes with CAD every ``--probe-interval`` seconds, as ``CadListener``
+does. Ground station passes come at random; during a pass commands arrive
+as a Poisson process and the ground station decides on a wake preamble the
+way ``WakePreamble`` does. Per-packet loss applies to every mode alike, so
+the difference between modes is what CAD costs.
+
+Reports the fraction of listening time the receiver is on, the fraction of
+command uplinks the satellite misses, and the extra ground station airtime
+the wake preambles take. Time on air uses the LoRa settings from
+config.json.
+
+Usage:
+    python scripts/cad_sim.py
+    python scripts/cad_sim.py --probe-interval 0.5 1 2 --detect 0.95
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4.airtime import (  # noqa: E402
+    DEFAULT_PREAMBLE_LENGTH,
+    RADIOHEAD_HEADER_LENGTH,
+    symbol_time,
+    time_on_air,
+)
+from proveskit_rp2040_v4.cad_listen import (  # noqa: E402
+    RX_WINDOW,
+    cad_time,
+    max_probe_interval,
+    wake_preamble_length,
+)
+
+# Header pysquared's PacketManager adds to every packet
+PACKET_MANAGER_HEADER_LENGTH = 4
+
+# The flight loop listens this long after its first beacon, then for
+# sleep_duration after its second
+FIRST_LISTEN = 10.0
+
+DAY = 86400.0
+
+
+class Result:
+    def __init__(self) -> None:
+        self.listen_time = 0.0
+        self.on_time = 0.0
+        self.commands = 0
+        self.received = 0
+        self.wakes = 0
+        self.probes = 0
+        self.false_alarms = 0
+
+
+def packet_time(length: int, lora: dict, preamble_length: int) -> float:
+    return time_on_air(
+        length + PACKET_MANAGER_HEADER_LENGTH + RADIOHEAD_HEADER_LENGTH,
+        lora["spreading_factor"],
+        lora["coding_rate"],
+        lora["cyclic_redundancy_check"],
+        preamble_length=preamble_length,
+    )
+
+
+def listen_windows(args, lora: dict) -> list:
+    """(start, end) of every listen window in ``args.days``, each after a
+    beacon."""
+    beacon = packet_time(args.beacon_length, lora, DEFAULT_PREAMBLE_LENGTH)
+    windows = []
+    t = 0.0
+    while t < args.days * DAY:
+        for listen in (FIRST_LISTEN, args.sleep_duration):
+            t += beacon
+            windows.append((t, t + listen))
+            t += listen
+    return windows
+
+
+def command_times(args, rng: random.Random) -> list:
+    times = []
+    for _ in range(int(args.passes * args.days)):
+        start = rng.uniform(0.0, args.days * DAY - args.pass_duration)
+        t = start + rng.expovariate(1.0 / args.command_interval)
+        while t < start + args.pass_duration:
+            times.append(t)
+            t += rng.expovariate(1.0 / args.command_interval)
+    times.sort()
+    return times
+
+
+class Ground:
+    """Sends commands one after another, picking each one's preamble as
+    ``WakePreamble`` does from what it has heard by then."""
+
+    def __init__(self, args, lora: dict, interval, rng: random.Random) -> None:
+        self.args = args
+        self.lora = lora
+        self.rng = rng
+        self.t_sym = symbol_time(lora["spreading_factor"])
+        self.wake = (
+            wake_preamble_length(interval, lora["spreading_factor"])
+            if interval
+            else DEFAULT_PREAMBLE_LENGTH
+        )
+        self.times = command_times(args, rng)
+        self.next = 0
+        self.last_end = -DAY
+        self.sent: float | None = None
+        self.awake_until = 0.0
+        self.wakes = 0
+
+    def peek(self) -> float:
+        """When the next command starts."""
+        if self.next >= len(self.times):
+            return float("inf")
+        return max(self.times[self.next], self.last_end + self.args.turnaround)
+
+    def take(self) -> tuple:
+        """Send the next command. Returns its start, preamble seconds and
+        end."""
+        start = self.peek()
+        self.next += 1
+        preamble_length = DEFAULT_PREAMBLE_LENGTH
+        if start >= self.awake_until:
+            preamble_length = self.wake
+        if preamble_length != DEFAULT_PREAMBLE_LENGTH:
+            self.wakes += 1
+        end = start + packet_time(self.args.command_length, self.lora, preamble_length)
+        self.last_end = self.sent = end
+        return start, (preamble_length + 4.25) * self.t_sym, end
+
+    def hear(self, t: float) -> None:
+        """The satellite sent a packet ending at ``t``."""
+        if self.rng.random() < self.args.loss:
+            return
+        self.awake_until = max(self.awake_until, t + self.args.ground_reply_window)
+        if self.sent is not None and t - self.sent < self.args.ground_reply_window:
+            self.awake_until = max(self.awake_until, self.sent + self.args.awake_time)
+
+
+def simulate(args, lora: dict, interval, seed: int) -> Result:
+    rng = random.Random(seed)
+    ground = Ground(args, lora, interval, rng)
+    cad = cad_time(lora["spreading_factor"])
+    result = Result()
+
+    def arrives(end: float) -> bool:
+        """Whether a command ending at ``end`` gets through; the satellite
+        answers one that does."""
+        if rng.random() < args.loss:
+            return False
+        result.received += 1
+        ground.hear(end + args.turnaround)
+        return True
+
+    awake_until = 0.0
+    for start, end in listen_windows(args, lora):
+        result.listen_time += end - start
+        # Sent while the satellite was transmitting its beacon
+        while ground.peek() < start:
+            ground.take()
+        # The beacon that opens the window keeps the receiver on for a reply
+        awake_until = max(awake_until, start + args.reply_window)
+        ground.hear(start)
+
+        if interval is None:
+            result.on_time += end - start
+            while ground.peek() < end:
+                _, _, c_end = ground.take()
+                if c_end <= end:
+                    arrives(c_end)
+            continue
+
+        t = start
+        # A command that started while the receiver slept
+        current = None
+        while t < end:
+            if t < awake_until and current is None:
+                stop = min(awake_until, end)
+                while ground.peek() < stop:
+                    _, _, c_end = ground.take()
+                    if c_end <= end and arrives(c_end):
+                        awake_until = max(awake_until, c_end + args.linger)
+                        stop = min(awake_until, end)
+                result.on_time += stop - t
+                t = stop
+                continue
+
+            result.probes += 1
+            result.on_time += cad
+            if current is None and ground.peek() <= t:
+                current = ground.take()
+            if current is not None and t + cad > current[0] + current[1]:
+                # Its preamble went by between probes
+                current = None
+                if ground.peek() <= t:
+                    current = ground.take()
+
+            if current is not None and rng.random() < args.detect:
+                c_end = current[2]
+                current = None
+                stop = min(t + RX_WINDOW + interval, end)
+                if c_end <= stop and arrives(c_end):
+                    awake_until = c_end + args.linger
+                    stop = c_end
+                result.on_time += stop - t
+                t = stop
+            elif current is None and rng.random() < args.false_alarm:
+                result.false_alarms += 1
+                stop = min(t + RX_WINDOW + interval, end)
+                result.on_time += stop - t
+                t = stop
+            else:
+                t += interval
+
+    while ground.peek() < float("inf"):
+        ground.take()
+    result.commands = ground.next
+    result.wakes = ground.wakes
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"))
+    parser.add_argument(
+        "--probe-interval", type=float, nargs="+", default=[0.5, 1.0, 2.0, 4.0]
+    )
+    parser.add_argument("--days", type=float, default=2.0)
+    parser.add_argument("--passes", type=float, default=4.0, help="Per day")
+    parser.add_argument("--pass-duration", type=float, default=480.0, help="s")
+    parser.add_argument(
+        "--command-interval", type=float, default=20.0, help="Mean s in a pass"
+    )
+    parser.add_argument("--command-length", type=int, default=100, help="Bytes")
+    parser.add_argument("--beacon-length", type=int, default=60, help="Bytes")
+    parser.add_argument("--loss", type=float, default=0.1, help="Per packet")
+    parser.add_argument("--detect", type=float, default=0.99, help="CAD P(detect)")
+    parser.add_argument(
+        "--false-alarm", type=float, default=0.001, help="Per probe without signal"
+    )
+    parser.add_argument(
+        "--turnaround", type=float, default=0.5, help="Between packets, s"
+    )
+    parser.add_argument("--linger", type=float, default=10.0, help="s")
+    parser.add_argument("--reply-window", type=float, default=2.0, help="s")
+    parser.add_argument("--awake-time", type=float, default=8.0, help="Ground, s")
+    parser.add_argument(
+        "--ground-reply-window", type=float, default=1.5, help="Ground, s"
+    )
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    lora = config["radio"]["lora"]
+    args.sleep_duration = config["sleep_duration"]
+    sf = lora["spreading_factor"]
+    t_sym = symbol_time(sf)
+
+    print(
+        f"SF{sf} CR4/{lora['coding_rate']}, CAD {1000 * cad_time(sf):.1f} ms, "
+        f"{args.passes:g} passes a day, a command every {args.command_interval:g} s "
+        f"in a pass, {args.loss:.0%} packet loss"
+    )
+    print(
+        f"{'mode':<12} {'on time':>8} {'missed':>8} {'wake':>6} {'wakes/day':>10}"
+        f" {'extra s/day':>12}"
+    )
+    for interval in [None] + args.probe_interval:
+        total = Result()
+        for seed in range(args.runs):
+            result = simulate(args, lora, interval, seed)
+            total.listen_time += result.listen_time
+            total.on_time += result.on_time
+            total.commands += result.commands
+            total.received += result.received
+            total.wakes += result.wakes
+
+        name = "continuous" if interval is None else f"CAD {interval:g} s"
+        wake = (
+            wake_preamble_length(interval, sf) if interval else DEFAULT_PREAMBLE_LENGTH
+        )
+        wakes = total.wakes / (args.runs * args.days)
+        extra = wakes * (wake - DEFAULT_PREAMBLE_LENGTH) * t_sym
+        print(
+            f"{name:<12} {total.on_time / total.listen_time:>8.1%}"
+            f" {1 - total.received / max(1, total.commands):>8.1%} {wake:>6}"
+            f" {wakes:>10.1f} {extra:>12.1f}"
+        )
+        if interval and max_probe_interval(wake, sf) < interval:
+            print(f"  wake preamble of {wake} symbols is too short", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
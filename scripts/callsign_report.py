@@ -0,0 +1,132 @@
+"""Airtime per day spent identifying the station, before and after folding the
+callsign into the message framing.
+
+Before, every pass of the nominal loop sent the callsign as a packet of its
+own. Now ``FramedPacketManager`` adds it to the first message of each
+transmission burst. The loop is replayed for a day against the real
+``FramedPacketManager`` with a simulated clock, so the number of bursts that
+carry the callsign matches what the flight software does. Time on air uses the
+LoRa settings, callsign and sleep duration from config.json.
+
+Usage:
+    python scripts/callsign_report.py
+    python scripts/callsign_report.py --beacon-length 12 --sleep-duration 60
+"""
+
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4 import beacon_codec  # noqa: E402
+from proveskit_rp2040_v4.airtime import (  # noqa: E402
+    RADIOHEAD_HEADER_LENGTH,
+    time_on_air,
+)
+from proveskit_rp2040_v4.framing import FramedPacketManager  # noqa: E402
+
+# Header pysquared's PacketManager adds to every packet
+PACKET_MANAGER_HEADER_LENGTH = 4
+
+SECONDS_PER_DAY = 86400
+
+# Seconds the nominal loop listens between its two beacons
+FIRST_LISTEN = 10
+
+
+class RecordingPacketManager:
+    def __init__(self) -> None:
+        self.sent: list = []
+
+    def send(self, data: bytes) -> bool:
+        self.sent.append(len(data))
+        return True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"))
+    parser.add_argument(
+        "--beacon-length",
+        type=int,
+        default=beacon_codec.KEYFRAME_SIZE,
+        help="Bytes per beacon",
+    )
+    parser.add_argument(
+        "--sleep-duration", type=float, help="Overrides config.json, seconds"
+    )
+    parser.add_argument("--burst-gap", type=float, default=5.0, help="s")
+    parser.add_argument("--id-interval", type=float, default=600.0, help="s")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    lora = config["radio"]["lora"]
+    license = config["radio"]["license"]
+    sleep_duration = (
+        args.sleep_duration
+        if args.sleep_duration is not None
+        else config["sleep_duration"]
+    )
+
+    def airtime(length: int) -> float:
+        return time_on_air(
+            length + PACKET_MANAGER_HEADER_LENGTH + RADIOHEAD_HEADER_LENGTH,
+            lora["spreading_factor"],
+            lora["coding_rate"],
+            lora["cyclic_redundancy_check"],
+        )
+
+    # A beacon's first byte is its schema, which never looks like a frame
+    beacon = bytes((beacon_codec.SCHEMA_KEYFRAME_V1,)) + bytes(args.beacon_length - 1)
+    beacon_airtime = airtime(len(beacon))
+    license_airtime = airtime(len(license.encode("utf-8")))
+
+    now = [0.0]
+    recorder = RecordingPacketManager()
+    framed = FramedPacketManager(
+        None,
+        recorder,
+        callsign=license,
+        burst_gap=args.burst_gap,
+        id_interval=args.id_interval,
+        clock=lambda: now[0],
+    )
+
+    loops = 0
+    before = after = 0.0
+    while now[0] < SECONDS_PER_DAY:
+        loops += 1
+        before += license_airtime + 2 * beacon_airtime
+        for listen in (FIRST_LISTEN, sleep_duration):
+            framed.send(beacon)
+            after += airtime(recorder.sent[-1])
+            now[0] += beacon_airtime + listen
+
+    identified = framed.stats.identified
+    print(
+        f"SF{lora['spreading_factor']} CR4/{lora['coding_rate']} "
+        f"CRC {'on' if lora['cyclic_redundancy_check'] else 'off'}, "
+        f"callsign {license!r}, {args.beacon_length} byte beacons, "
+        f"{loops} loops per day"
+    )
+    print(
+        f"separate packet: {loops} callsign packets of "
+        f"{license_airtime * 1000:.1f} ms, {before:.1f} s per day"
+    )
+    print(
+        f"in framing:      {identified} of {2 * loops} beacons identified, "
+        f"{after:.1f} s per day"
+    )
+    print(
+        f"saved:           {before - after:.1f} s per day "
+        f"({100 * (1 - after / before):.1f}% of identification and beacon airtime)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
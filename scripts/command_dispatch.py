@@ -0,0 +1,131 @@
+"""Measure what decoding and dispatching a command costs, JSON versus opcode.
+
+Feeds the flight software's ``CommandRouter`` the same commands as JSON and
+as binary opcode commands, plus messages it must reject: a wrong password,
+an unknown command and, for opcodes, arguments of the wrong length. Prints
+the mean host time per message and the uplinked size, then how often each
+registered command ran and how long its handler took. The handlers do
+nothing, so the times are the router's own overhead.
+
+Usage:
+    python scripts/command_dispatch.py
+    python scripts/command_dispatch.py --count 100000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4.commands import (  # noqa: E402
+    COMMAND_DOWNLINK,
+    DOWNLINK_ARGS,
+    OPCODE_DOWNLINK,
+    CommandRouter,
+    opcode_command,
+)
+
+
+class Config:
+    cubesat_name = "PROVES-MY_SATELLITE_NAME"
+    super_secret_code = "ABCD"
+
+
+class WrongPassword(Config):
+    super_secret_code = "WXYZ"
+
+
+class NullLogger:
+    def info(self, *args, **kwargs) -> None:
+        pass
+
+    def error(self, *args, **kwargs) -> None:
+        pass
+
+
+class Inbox:
+    """Hands the router the same message on every listen."""
+
+    def __init__(self) -> None:
+        self.message: bytes | None = None
+
+    def listen(self, timeout=None) -> bytes | None:
+        return self.message
+
+    def send(self, data: bytes) -> bool:
+        return True
+
+
+def json_command(config, command: str, args: list) -> bytes:
+    return json.dumps(
+        {
+            "name": config.cubesat_name,
+            "password": config.super_secret_code,
+            "command": command,
+            "args": args,
+        }
+    ).encode("utf-8")
+
+
+def cases() -> list:
+    start, end = 1700000000, 1700003600
+    return [
+        ("json", json_command(Config, COMMAND_DOWNLINK, [start, end])),
+        (
+            "opcode",
+            opcode_command(Config, OPCODE_DOWNLINK, DOWNLINK_ARGS, start, end),
+        ),
+        (
+            "json, wrong password",
+            json_command(WrongPassword, COMMAND_DOWNLINK, [start, end]),
+        ),
+        (
+            "opcode, wrong password",
+            opcode_command(WrongPassword, OPCODE_DOWNLINK, DOWNLINK_ARGS, start, end),
+        ),
+        ("json, unknown", json_command(Config, "no_such_command", [])),
+        ("opcode, unknown", opcode_command(Config, 0xFE, "")),
+        (
+            "opcode, malformed",
+            opcode_command(Config, OPCODE_DOWNLINK, "<I", start),
+        ),
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=20000, help="Per case")
+    args = parser.parse_args()
+
+    inbox = Inbox()
+    router = CommandRouter(NullLogger(), Config(), inbox)
+    router.register(
+        COMMAND_DOWNLINK, lambda start, end: True, OPCODE_DOWNLINK, DOWNLINK_ARGS
+    )
+
+    print(f"{'message':<24} {'bytes':>6} {'us':>8}")
+    for name, message in cases():
+        inbox.message = message
+        start = time.perf_counter_ns()
+        for _ in range(args.count):
+            router.listen()
+        elapsed = time.perf_counter_ns() - start
+        print(f"{name:<24} {len(message):>6} {elapsed / args.count / 1000:>8.2f}")
+
+    status = router.status()
+    print(f"\nrejected {status['rejected']}")
+    print(f"{'command':<24} {'count':>8} {'failed':>6} {'mean us':>8} {'max us':>8}")
+    for command, timing in status["timings"].items():
+        print(
+            f"{command:<24} {timing['count']:>8} {timing['failed']:>6} "
+            f"{timing['mean_ms'] * 1000:>8.2f} {timing['longest_ms'] * 1000:>8.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""Compare the time a pass spends commanding, one command per uplink versus
+batched.
+
+Runs the flight software's ``CommandRouter`` against the ground station's
+``CommandBatcher`` over a simulated half-duplex link. Every uplink is
+answered by one response, and a lost uplink or response costs the ground
+station ``--response-timeout`` before it resends. Messages longer than a
+packet are split the way the ``PacketManager`` does, and one lost fragment
+loses the message. Time on air uses the LoRa settings from config.json.
+
+Usage:
+    python scripts/command_latency.py
+    python scripts/command_latency.py --commands 30 --loss 0.2
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4.airtime import (  # noqa: E402
+    RADIOHEAD_HEADER_LENGTH,
+    time_on_air,
+)
+from proveskit_rp2040_v4.commands import CommandBatcher, CommandRouter  # noqa: E402
+
+# Header pysquared's PacketManager adds to every packet
+PACKET_MANAGER_HEADER_LENGTH = 4
+
+# Payload of one RFM9x packet after the RadioHead header
+MAX_PACKET_LENGTH = 252 - RADIOHEAD_HEADER_LENGTH
+
+# What a single command's acknowledgement costs
+SINGLE_RESPONSE_LENGTH = 16
+
+# Commands of a typical pass, with arguments
+TYPICAL_COMMANDS = (
+    ("set_mode", ["nominal"]),
+    ("set_sleep_duration", [30]),
+    ("downlink_archive", [1700000000, 1700003600]),
+    ("set_heater", [False]),
+    ("set_beacon_interval", [10]),
+    ("clear_errors", []),
+)
+
+
+class Config:
+    cubesat_name = "PROVES-MY_SATELLITE_NAME"
+    super_secret_code = "ABCD"
+
+
+class NullLogger:
+    def info(self, *args, **kwargs) -> None:
+        pass
+
+    def error(self, *args, **kwargs) -> None:
+        pass
+
+
+class Link:
+    """Half-duplex link with a clock, per-packet loss and fragmentation."""
+
+    def __init__(self, lora: dict, loss: float, turnaround: float, seed: int) -> None:
+        self.lora = lora
+        self.loss = loss
+        self.turnaround = turnaround
+        self.rng = random.Random(seed)
+        self.now = 0.0
+        self.uplinks = 0
+
+    def transmit(self, length: int) -> bool:
+        """Send a message, advancing the clock. Returns whether it arrived."""
+        payload = MAX_PACKET_LENGTH - PACKET_MANAGER_HEADER_LENGTH
+        delivered = True
+        for _ in range(max(1, math.ceil(length / payload))):
+            fragment = min(length, payload)
+            length -= fragment
+            self.now += self.turnaround + time_on_air(
+                fragment + PACKET_MANAGER_HEADER_LENGTH + RADIOHEAD_HEADER_LENGTH,
+                self.lora["spreading_factor"],
+                self.lora["coding_rate"],
+                self.lora["cyclic_redundancy_check"],
+            )
+            delivered = delivered and self.rng.random() >= self.loss
+        return delivered
+
+
+class SatellitePacketManager:
+    def __init__(self) -> None:
+        self.inbox: bytes | None = None
+        self.outbox: list = []
+
+    def listen(self, timeout=None) -> bytes | None:
+        message, self.inbox = self.inbox, None
+        return message
+
+    def send(self, data: bytes) -> bool:
+        self.outbox.append(data)
+        return True
+
+
+def satellite() -> tuple[CommandRouter, SatellitePacketManager]:
+    packet_manager = SatellitePacketManager()
+    router = CommandRouter(NullLogger(), Config(), packet_manager)
+    for command, _ in TYPICAL_COMMANDS:
+        router.register(command, lambda *args: True)
+    return router, packet_manager
+
+
+def commands(count: int) -> list:
+    return [TYPICAL_COMMANDS[i % len(TYPICAL_COMMANDS)] for i in range(count)]
+
+
+def run_single(args, lora: dict, seed: int) -> tuple[float, int]:
+    link = Link(lora, args.loss, args.turnaround, seed)
+    router, packet_manager = satellite()
+    for command, command_args in commands(args.commands):
+        message = json.dumps(
+            {
+                "name": Config.cubesat_name,
+                "password": Config.super_secret_code,
+                "command": command,
+                "args": command_args,
+            }
+        ).encode("utf-8")
+        while True:
+            link.uplinks += 1
+            if link.transmit(len(message)):
+                packet_manager.inbox = message
+                router.listen()
+                if link.transmit(SINGLE_RESPONSE_LENGTH):
+                    break
+            link.now += args.response_timeout
+    return link.now, link.uplinks
+
+
+def run_batched(args, lora: dict, seed: int) -> tuple[float, int]:
+    link = Link(lora, args.loss, args.turnaround, seed)
+    router, packet_manager = satellite()
+    batcher = CommandBatcher(
+        Config(), MAX_PACKET_LENGTH - PACKET_MANAGER_HEADER_LENGTH, session=seed
+    )
+    for command, command_args in commands(args.commands):
+        batcher.add(command, command_args)
+
+    while batcher.pending():
+        envelope = batcher.envelope()
+        link.uplinks += 1
+        if link.transmit(len(envelope)):
+            packet_manager.inbox = envelope
+            router.listen()
+            response = packet_manager.outbox.pop()
+            if link.transmit(len(response)):
+                batcher.on_response(response)
+                continue
+        link.now += args.response_timeout
+    return link.now, link.uplinks
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"))
+    parser.add_argument("--commands", type=int, default=12)
+    parser.add_argument("--loss", type=float, default=0.1, help="Per packet")
+    parser.add_argument("--turnaround", type=float, default=0.3, help="s")
+    parser.add_argument("--response-timeout", type=float, default=3.0, help="s")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        lora = json.load(f)["radio"]["lora"]
+
+    print(
+        f"SF{lora['spreading_factor']} CR4/{lora['coding_rate']}, "
+        f"{args.commands} commands, {args.loss:.0%} packet loss"
+    )
+    print(f"{'mode':<8} {'seconds':>8} {'uplinks':>8}")
+    reference = None
+    for name, run in (("single", run_single), ("batched", run_batched)):
+        seconds = uplinks = 0.0
+        for seed in range(args.runs):
+            elapsed, sent = run(args, lora, seed)
+            seconds += elapsed
+            uplinks += sent
+        seconds /= args.runs
+        if reference is None:
+            reference = seconds
+        print(
+            f"{name:<8} {seconds:>8.1f} {uplinks / args.runs:>8.1f}"
+            f" ({100 * seconds / reference:.0f}%)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Report bytes saved against CPU time for message compression.
+
+Runs the flight software's pure-Python DEFLATE encoder, the one the board
+uses, over typical downlink messages at each window size. Times are host CPU
+times; scale them by ``--cpu-factor`` for an estimate of the RP2040 cost. Use
+the output to tune ``compress_threshold`` and ``window_bits`` of
+``FramedPacketManager``.
+
+Usage:
+    python scripts/compression_report.py
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4 import deflate  # noqa: E402
+
+
+def sample_messages() -> dict[str, bytes]:
+    with open(os.path.join(ROOT, "config.json"), "rb") as f:
+        config = f.read()
+
+    log_line = json.dumps(
+        {
+            "time": "2025-05-01 12:00:00",
+            "level": "INFO",
+            "msg": "FC Board Stats",
+            "bytes_remaining": 81234,
+        },
+        separators=(",", ":"),
+    ).encode()
+
+    return {
+        "log line": log_line,
+        "10 log lines": b"\n".join([log_line] * 10),
+        "joke": json.loads(config)["jokes"][0].encode(),
+        "config dump": config,
+        "config radio": json.dumps(json.loads(config)["radio"]).encode(),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--cpu-factor",
+        type=float,
+        default=100.0,
+        help="How many times slower the board is than this host",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'message':<14} {'window':>6} {'in':>6} {'out':>6} {'saved':>6} "
+        f"{'host us':>8} {'board ms':>9} {'us/saved B':>11}"
+    )
+    for name, data in sample_messages().items():
+        for window_bits in (9, 10, 12):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                compressed = deflate._compress_fixed(data, window_bits)
+            seconds = (time.perf_counter() - start) / args.repeat
+
+            assert zlib.decompress(compressed, -window_bits) == data
+
+            # Two header bytes: the frame byte and the window size
+            saved = len(data) - (len(compressed) + 2)
+            per_byte = f"{seconds * 1e6 / saved:.1f}" if saved > 0 else "-"
+            print(
+                f"{name:<14} {window_bits:>6} {len(data):>6} {len(compressed) + 2:>6} "
+                f"{saved:>6} {seconds * 1e6:>8.0f} "
+                f"{seconds * args.cpu_factor * 1000:>9.1f} {per_byte:>11}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
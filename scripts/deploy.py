@@ -0,0 +1,181 @@
+"""Copy only the changed files of a build artifact onto a mounted board.
+
+Writes to the CIRCUITPY FAT filesystem are slow and wear the flash, so instead
+of copying the whole artifact every time this script keeps a manifest of
+content hashes on the board. On the next install it reads the manifest back,
+copies only files whose hash changed, removes files that were deployed before
+but are no longer part of the artifact, and then writes the new manifest.
+
+Files are written libraries first and ``main.py`` last, so that when
+CircuitPython auto-reloads mid-copy the entry point never runs against a
+half-updated library tree. The manifest is written after everything else, so
+an interrupted deploy is simply redone on the next run.
+
+Usage:
+    python scripts/deploy.py artifacts/proves/flight-software /media/CIRCUITPY
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+MANIFEST = ".deploy-manifest.json"
+
+# Used to estimate time saved when nothing was written and no throughput
+# could be measured
+DEFAULT_WRITE_RATE = 64 * 1024
+
+# Written last, in this order, because they are what CircuitPython runs
+ENTRY_POINTS = ("boot.py", "code.py", "main.py")
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def build_manifest(artifact: str) -> dict:
+    """Hash every file in the artifact, keyed by its relative path."""
+    files = {}
+    for root, dirs, names in os.walk(artifact):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, artifact).replace(os.sep, "/")
+            files[rel] = {"sha256": file_hash(path), "size": os.path.getsize(path)}
+    return {"version": 1, "files": files}
+
+
+def read_board_manifest(board: str, verify: bool, paths) -> dict:
+    """Return the manifest stored on the board.
+
+    With ``verify`` the deployed files and ``paths`` are hashed on the board
+    instead of trusting the stored hashes, which catches files edited by hand.
+    Files that were never deployed, such as logs, are left out either way.
+    """
+    try:
+        with open(os.path.join(board, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {"version": 1, "files": {}}
+
+    if verify:
+        files = {}
+        for rel in set(manifest["files"]) | set(paths):
+            path = os.path.join(board, rel)
+            if os.path.isfile(path):
+                files[rel] = {"sha256": file_hash(path), "size": os.path.getsize(path)}
+        manifest["files"] = files
+
+    return manifest
+
+
+def write_order(path: str) -> tuple[int, str]:
+    """Sort key that puts libraries first and entry points last."""
+    if path in ENTRY_POINTS:
+        return 2 + ENTRY_POINTS.index(path), path
+    if path.startswith("lib/"):
+        return 0, path
+    return 1, path
+
+
+def copy_file(src: str, dst: str) -> None:
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        shutil.copyfileobj(fsrc, fdst)
+        fdst.flush()
+        os.fsync(fdst.fileno())
+
+
+def deploy(artifact: str, board: str, verify: bool = False, dry_run: bool = False):
+    """Synchronise the board with the artifact and return a summary dict."""
+    new = build_manifest(artifact)
+    old = read_board_manifest(board, verify, new["files"])["files"]
+
+    changed = [
+        path
+        for path, entry in new["files"].items()
+        if old.get(path, {}).get("sha256") != entry["sha256"]
+        or not os.path.exists(os.path.join(board, path))
+    ]
+    removed = [path for path in old if path not in new["files"] and path != MANIFEST]
+
+    bytes_written = 0
+    start = time.monotonic()
+
+    if not dry_run:
+        # A stale code.py would shadow main.py
+        code_py = os.path.join(board, "code.py")
+        if "code.py" not in new["files"] and os.path.exists(code_py):
+            os.remove(code_py)
+
+        for path in sorted(changed, key=write_order):
+            print(f"  write  {path}")
+            copy_file(os.path.join(artifact, path), os.path.join(board, path))
+            bytes_written += new["files"][path]["size"]
+
+        for path in removed:
+            target = os.path.join(board, path)
+            if os.path.exists(target):
+                print(f"  remove {path}")
+                os.remove(target)
+
+        tmp = os.path.join(board, MANIFEST + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(new, f, separators=(",", ":"), sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(board, MANIFEST))
+
+    elapsed = time.monotonic() - start
+    total_bytes = sum(entry["size"] for entry in new["files"].values())
+    rate = bytes_written / elapsed if bytes_written and elapsed else DEFAULT_WRITE_RATE
+
+    return {
+        "files_total": len(new["files"]),
+        "files_written": len(changed),
+        "files_removed": len(removed),
+        "bytes_total": total_bytes,
+        "bytes_written": bytes_written,
+        "seconds": elapsed,
+        "seconds_saved": (total_bytes - bytes_written) / rate,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("artifact", help="Artifact directory to deploy")
+    parser.add_argument("board", help="Mount point of the board")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Hash the files on the board instead of trusting its manifest",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only report what would change"
+    )
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.board):
+        print(f"Board mount point {args.board!r} does not exist", file=sys.stderr)
+        return 1
+
+    summary = deploy(args.artifact, args.board, args.verify, args.dry_run)
+    print(
+        f"Deployed {summary['files_written']}/{summary['files_total']} files, "
+        f"removed {summary['files_removed']}, "
+        f"wrote {summary['bytes_written']} of {summary['bytes_total']} bytes "
+        f"in {summary['seconds']:.1f} s, saving about {summary['seconds_saved']:.1f} s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
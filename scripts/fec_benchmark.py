@@ -0,0 +1,154 @@
+"""Benchmark Reed-Solomon FEC: encode cost and packets recovered under bit errors.
+
+Encode times are host CPU times of the flight software's pure-Python encoder;
+scale them by ``--cpu-factor`` for an estimate of the RP2040 cost. Recovery is
+simulated by flipping every bit of each packet on air, FEC parity and CRC
+included, with probability ``BER``. Without FEC a packet survives only with no
+bit errors at all, as the radio CRC drops anything else; with FEC the radio
+CRC is off. Goodput is delivered payload per second of airtime, with the LoRa
+settings from config.json.
+
+Usage:
+    python scripts/fec_benchmark.py
+    python scripts/fec_benchmark.py --payload 200 --packets 2000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4 import fec  # noqa: E402
+from proveskit_rp2040_v4.airtime import (  # noqa: E402
+    RADIOHEAD_HEADER_LENGTH,
+    time_on_air,
+)
+
+# Header pysquared's PacketManager adds to every packet
+PACKET_MANAGER_HEADER_LENGTH = 4
+
+BIT_ERROR_RATES = (1e-4, 5e-4, 1e-3, 2e-3, 5e-3)
+
+
+def corrupt(packet: bytes, ber: float, rng: random.Random) -> tuple[bytes, int]:
+    """Flip each bit with probability ``ber``. Returns the packet and bit errors."""
+    out = bytearray(packet)
+    errors = 0
+    # Jump straight to the next flipped bit rather than drawing once per bit
+    position = int(rng.expovariate(ber)) if ber else len(out) * 8
+    while position < len(out) * 8:
+        out[position // 8] ^= 1 << (position % 8)
+        errors += 1
+        position += 1 + int(rng.expovariate(ber))
+    return bytes(out), errors
+
+
+def encode_cost(payload: int, repeat: int, cpu_factor: float) -> None:
+    data = bytes(random.Random(0).randrange(256) for _ in range(payload))
+    print(f"encode, {payload} byte payload")
+    print(f"{'rate':<8} {'parity':>6} {'host us':>8} {'board ms':>9}")
+    for name, parity in fec.CODE_RATES.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fec.encode(data, parity)
+        seconds = (time.perf_counter() - start) / repeat
+        print(
+            f"{name:<8} {parity:>6} {seconds * 1e6:>8.0f} "
+            f"{seconds * cpu_factor * 1000:>9.1f}"
+        )
+
+
+def recovery(payload: int, packets: int, lora: dict) -> None:
+    rng = random.Random(1)
+    messages = [
+        bytes(rng.randrange(256) for _ in range(payload)) for _ in range(packets)
+    ]
+
+    def airtime(length: int, crc: bool) -> float:
+        return time_on_air(
+            length + PACKET_MANAGER_HEADER_LENGTH + RADIOHEAD_HEADER_LENGTH,
+            lora["spreading_factor"],
+            lora["coding_rate"],
+            crc,
+        )
+
+    print(
+        f"\nrecovery, {packets} packets of {payload} bytes, "
+        f"SF{lora['spreading_factor']} CR4/{lora['coding_rate']}, "
+        f"decoder {'numpy' if fec.numpy is not None else 'pure python'}"
+    )
+    print(
+        f"{'BER':>7} {'rate':<8} {'on air':>6} {'delivered':>10} "
+        f"{'goodput B/s':>12} {'decode ms':>10}"
+    )
+    for ber in BIT_ERROR_RATES:
+        # The same channel for every code rate, one bit error stream per packet
+        seeds = [rng.random() for _ in range(packets)]
+
+        delivered = sum(
+            corrupt(m, ber, random.Random(seed))[1] == 0
+            for m, seed in zip(messages, seeds)
+        )
+        length = payload
+        print(
+            f"{ber:>7.0e} {'none':<8} {length:>6} {delivered / packets:>10.1%} "
+            f"{delivered * payload / (packets * airtime(length, True)):>12.1f} {'-':>10}"
+        )
+
+        for name, parity in fec.CODE_RATES.items():
+            codewords = [
+                corrupt(
+                    fec.encode(m + fec._check(m), parity), ber, random.Random(seed)
+                )[0]
+                for m, seed in zip(messages, seeds)
+            ]
+            start = time.perf_counter()
+            results = fec.decode_batch(codewords, parity)
+            seconds = time.perf_counter() - start
+
+            delivered = sum(
+                result is not None and result[0] == m + fec._check(m)
+                for m, result in zip(messages, results)
+            )
+            length = payload + fec.CHECK_LENGTH + parity
+            print(
+                f"{'':>7} {name:<8} {length:>6} {delivered / packets:>10.1%} "
+                f"{delivered * payload / (packets * airtime(length, False)):>12.1f} "
+                f"{seconds * 1000:>10.0f}"
+            )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"))
+    parser.add_argument("--payload", type=int, default=100)
+    parser.add_argument("--packets", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument(
+        "--cpu-factor",
+        type=float,
+        default=100.0,
+        help="How many times slower the board is than this host",
+    )
+    args = parser.parse_args()
+
+    if args.payload + fec.CHECK_LENGTH + max(fec.CODE_RATES.values()) > (
+        fec.MAX_CODEWORD_LENGTH
+    ):
+        parser.error("payload too long for the heaviest code rate")
+
+    with open(args.config) as f:
+        lora = json.load(f)["radio"]["lora"]
+
+    encode_cost(args.payload, args.repeat, args.cpu_factor)
+    recovery(args.payload, args.packets, lora)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
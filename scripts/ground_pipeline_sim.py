@@ -0,0 +1,226 @@
+"""Compare the ground station's sequential receive loop with the pipeline.
+
+Plays bursts of packets back-to-back, as the satellite sends them during a
+downlink, into a simulated radio that, like the RFM9x, keeps only the last
+packet it received. Each packet is decoded with ``MessageDecoder``, stored
+with a write that takes ``--write-ms`` and now and then stalls for
+``--stall-ms``, as flash does, and displayed. A batch of records is one
+write.
+
+Modes:
+    sequential: receive, then decode, store and display before receiving
+        again, as ``GroundStation.run`` does.
+    pipeline: ``ground_pipeline.Pipeline`` with plain handlers.
+    pipeline+defer: the same with the store deferred until the receiver is
+        quiet.
+    pipeline+batch: deferred, and every record waiting stored in one write,
+        as on the ground station board.
+    pipeline+thread: the store handed to a thread instead, as on a host.
+
+Runs in real time and prints the packets lost and each stage's metrics.
+Time on air uses the LoRa settings from config.json.
+
+Usage:
+    python scripts/ground_pipeline_sim.py
+    python scripts/ground_pipeline_sim.py --bursts 5 --burst 50 --stall-ms 500
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4.airtime import (  # noqa: E402
+    RADIOHEAD_HEADER_LENGTH,
+    time_on_air,
+)
+from proveskit_rp2040_v4.ground_pipeline import (  # noqa: E402
+    RX,
+    MessageDecoder,
+    Pipeline,
+)
+
+# Header pysquared's PacketManager adds to every packet
+PACKET_MANAGER_HEADER_LENGTH = 4
+
+
+class NullLogger:
+    def info(self, *args, **kwargs) -> None:
+        pass
+
+    def error(self, *args, **kwargs) -> None:
+        pass
+
+
+class Radio:
+    """Packets arrive at set times; one not taken before the next arrives is
+    lost."""
+
+    def __init__(self, times: list, length: int) -> None:
+        self.start = time.monotonic()
+        self.times = times
+        self.length = length
+        self.next = 0
+        self.lost = 0
+
+    def done(self) -> bool:
+        return self.next >= len(self.times)
+
+    def receive(self, timeout: float) -> bytes | None:
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic() - self.start
+            arrived = self.next
+            while arrived < len(self.times) and self.times[arrived] <= now:
+                arrived += 1
+            if arrived > self.next:
+                self.lost += arrived - self.next - 1
+                sequence = arrived - 1
+                self.next = arrived
+                message = json.dumps({"seq": sequence, "pad": ""}).encode()
+                return message + b" " * max(0, self.length - len(message))
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.0005)
+
+
+class Store:
+    def __init__(self, write_ms: float, stall_ms: float, stall_every: int) -> None:
+        self.write = write_ms / 1000
+        self.stall = stall_ms / 1000
+        self.stall_every = stall_every
+        self.writes = 0
+        self.records = 0
+
+    def __call__(self, records):
+        self.writes += 1
+        self.records += len(records) if isinstance(records, list) else 1
+        stalled = self.stall_every and self.writes % self.stall_every == 0
+        time.sleep(self.stall if stalled else self.write)
+        return records
+
+
+def display(record: dict) -> None:
+    time.sleep(0.001)
+
+
+def arrival_times(args, packet_time: float) -> list:
+    times = []
+    t = 0.1
+    for _ in range(args.bursts):
+        for _ in range(args.burst):
+            t += packet_time
+            times.append(t)
+        t += args.gap
+    return times
+
+
+def run_sequential(radio: Radio, store: Store) -> dict:
+    decoder = MessageDecoder()
+    while not radio.done():
+        message = radio.receive(1.0)
+        if message is not None:
+            display(store(decoder(message)))
+    return {}
+
+
+async def run_pipeline(radio: Radio, store: Store, mode: str) -> dict:
+    pipeline = Pipeline(NullLogger(), lambda: radio.receive(0.005))
+    pipeline.add("decode", MessageDecoder())
+
+    async def store_in_thread(record: dict) -> dict:
+        return await asyncio.to_thread(store, record)
+
+    if mode == "pipeline+thread":
+        pipeline.add("persist", store_in_thread, after="decode")
+    elif mode == "pipeline+defer":
+        # Room for a whole burst
+        pipeline.add("persist", store, after="decode", queue_size=64, defer=0.5)
+    elif mode == "pipeline+batch":
+        pipeline.add(
+            "persist", store, after="decode", queue_size=64, defer=0.5, batch=True
+        )
+    else:
+        pipeline.add("persist", store, after="decode")
+    pipeline.add("display", display, after="decode")
+
+    task = asyncio.create_task(pipeline.run())
+    # Until every packet is in and every stage has caught up
+    while not radio.done() or any(
+        stage.stats.items < pipeline.rx.stats.items
+        for name, stage in pipeline.stages.items()
+        if name != RX
+    ):
+        await asyncio.sleep(0.1)
+    task.cancel()
+    return pipeline.status()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"))
+    parser.add_argument("--bursts", type=int, default=3)
+    parser.add_argument("--burst", type=int, default=30, help="Packets")
+    parser.add_argument("--gap", type=float, default=1.0, help="Between bursts, s")
+    parser.add_argument("--length", type=int, default=60, help="Bytes")
+    parser.add_argument("--write-ms", type=float, default=5.0)
+    parser.add_argument("--stall-ms", type=float, default=1000.0)
+    parser.add_argument("--stall-every", type=int, default=10, help="Writes")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        lora = json.load(f)["radio"]["lora"]
+    packet_time = time_on_air(
+        args.length + PACKET_MANAGER_HEADER_LENGTH + RADIOHEAD_HEADER_LENGTH,
+        lora["spreading_factor"],
+        lora["coding_rate"],
+        lora["cyclic_redundancy_check"],
+    )
+    times = arrival_times(args, packet_time)
+    print(
+        f"{len(times)} packets of {args.length} bytes, {1000 * packet_time:.0f} ms "
+        f"apart in bursts of {args.burst}; store {args.write_ms:g} ms, "
+        f"{args.stall_ms:g} ms every {args.stall_every} writes"
+    )
+
+    modes = (
+        "sequential",
+        "pipeline",
+        "pipeline+defer",
+        "pipeline+batch",
+        "pipeline+thread",
+    )
+    for mode in modes:
+        store = Store(args.write_ms, args.stall_ms, args.stall_every)
+        radio = Radio(times, args.length)
+        if mode == "sequential":
+            status = run_sequential(radio, store)
+        else:
+            status = asyncio.run(run_pipeline(radio, store, mode))
+        print(
+            f"{mode:<16} lost {radio.lost:>4} ({radio.lost / len(times):.1%}), "
+            f"stored {store.records} in {store.writes} writes"
+        )
+        for name, stage in status.items():
+            if name == RX:
+                print(
+                    f"  {name:<8} items {stage['items']:>4} "
+                    f"dropped {stage['dropped']:>3} longest {stage['longest_ms']:>6.1f} ms"
+                )
+                continue
+            print(
+                f"  {name:<8} items {stage['items']:>4} max depth "
+                f"{stage['max_depth']:>3} wait {stage['mean_wait_ms']:>6.1f} ms "
+                f"service {stage['mean_service_ms']:>6.1f} ms "
+                f"latency {stage['mean_latency_ms']:>6.1f} ms"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""Simulate bytes delivered per pass with fixed and adaptive LoRa settings.
+
+Runs the flight software's ``LinkController`` on both ends of a simulated
+pass. The satellite sends bulk data back to back and the ground station sends
+a short command every ``--command-interval`` seconds, which is what the
+satellite measures the link on. SNR follows free-space loss over the pass
+geometry plus slow fading from a tumbling antenna and per-packet noise. A
+packet only arrives when both ends use the same settings, with a probability
+that rises steeply around the profile's demodulation floor.
+
+Usage:
+    python scripts/link_sim.py
+    python scripts/link_sim.py --fading 6 --margin 4
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4 import link_control  # noqa: E402
+from proveskit_rp2040_v4.airtime import (  # noqa: E402
+    RADIOHEAD_HEADER_LENGTH,
+    time_on_air,
+)
+
+EARTH_RADIUS_KM = 6371.0
+ORBIT_PERIOD = 5550.0
+MAX_ELEVATIONS = (10, 30, 60, 85)
+DATA_LENGTH = 200
+COMMAND_LENGTH = 24
+
+
+class NullLogger:
+    def info(self, *args, **kwargs) -> None:
+        pass
+
+
+def elevation_and_range(
+    theta: float, offset: float, altitude: float
+) -> tuple[float, float]:
+    """Elevation in degrees and slant range in km of a satellite ``theta``
+    radians along its track, whose track passes ``offset`` radians off the
+    station."""
+    r = EARTH_RADIUS_KM + altitude
+    sat = (
+        r * math.cos(offset) * math.cos(theta),
+        r * math.cos(offset) * math.sin(theta),
+        r * math.sin(offset),
+    )
+    rel = (sat[0] - EARTH_RADIUS_KM, sat[1], sat[2])
+    distance = math.sqrt(sum(v * v for v in rel))
+    return math.degrees(math.asin(rel[0] / distance)), distance
+
+
+def track_offset(max_elevation: float, altitude: float) -> float:
+    low, high = 0.0, 0.5
+    for _ in range(60):
+        middle = (low + high) / 2
+        if elevation_and_range(0.0, middle, altitude)[0] > max_elevation:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+class Channel:
+    """A half-duplex link between two :class:`SimRadio` ends."""
+
+    def __init__(self, args, max_elevation: float, seed: int) -> None:
+        self.rng = random.Random(seed)
+        self.args = args
+        self.now = 0.0
+        self.offset = track_offset(max_elevation, args.altitude)
+        self.angular_rate = 2 * math.pi / ORBIT_PERIOD
+        # Start and end of the pass, above the minimum elevation
+        theta = 0.0
+        while (
+            elevation_and_range(theta, self.offset, args.altitude)[0]
+            > args.min_elevation
+        ):
+            theta += 0.001
+        self.duration = 2 * theta / self.angular_rate
+        self.theta_start = -theta
+        noise_dbm = -174 + 10 * math.log10(125000) + args.noise_figure
+        self.snr_offset = args.tx_power + args.ground_gain - args.losses - noise_dbm
+
+    def snr(self) -> float:
+        theta = self.theta_start + self.now * self.angular_rate
+        _, distance = elevation_and_range(theta, self.offset, self.args.altitude)
+        path_loss = 20 * math.log10(distance) + 20 * math.log10(437.4) + 32.44
+        tumble = self.args.fading * (
+            0.5 + 0.5 * math.sin(2 * math.pi * self.now / self.args.tumble_period)
+        )
+        return self.snr_offset - path_loss - tumble + self.rng.gauss(0, 1.0)
+
+    def transmit(self, sender: "SimRadio", receiver: "SimRadio", packet) -> None:
+        sf, cr = sender.profile
+        self.now += time_on_air(len(packet) + RADIOHEAD_HEADER_LENGTH, sf, cr)
+        if receiver.profile != sender.profile:
+            return
+        snr = self.snr()
+        required = link_control.required_snr(sf, cr)
+        if self.rng.random() < 1 / (1 + math.exp(-(snr - required) / 0.5)):
+            receiver.inbox.append((bytes(packet), snr))
+
+
+class SimRadio:
+    """One end of the channel, with the radio and modem interfaces."""
+
+    def __init__(self, channel: Channel, profile: tuple[int, int]) -> None:
+        self.channel = channel
+        self.peer: SimRadio | None = None
+        self.profile = profile
+        self.inbox: list = []
+        self._signal = (0.0, 0.0)
+
+    def send(self, packet) -> bool:
+        self.channel.transmit(self, self.peer, packet)
+        return True
+
+    def receive(self, timeout=None):
+        if not self.inbox:
+            return None
+        packet, snr = self.inbox.pop(0)
+        self._signal = (snr - 117.0, snr)
+        return packet
+
+    def signal(self) -> tuple[float, float]:
+        return self._signal
+
+    def apply(self, spreading_factor: int, coding_rate: int) -> None:
+        self.profile = (spreading_factor, coding_rate)
+
+
+def simulate(
+    args, max_elevation: float, default: tuple[int, int], adaptive: bool, seed: int
+) -> tuple[int, link_control.LinkController]:
+    """Returns bytes delivered to the ground and the satellite's controller."""
+    channel = Channel(args, max_elevation, seed)
+    sat_radio = SimRadio(channel, default)
+    ground_radio = SimRadio(channel, default)
+    sat_radio.peer, ground_radio.peer = ground_radio, sat_radio
+
+    def controller(radio: SimRadio, propose: bool) -> link_control.LinkController:
+        return link_control.LinkController(
+            NullLogger(),
+            radio,
+            radio,
+            default,
+            propose=propose,
+            margin=args.margin,
+            silence_timeout=args.silence_timeout,
+            clock=lambda: channel.now,
+        )
+
+    sat = controller(sat_radio, adaptive)
+    ground = controller(ground_radio, False)
+
+    delivered = 0
+    next_command = 0.0
+    while channel.now < channel.duration:
+        if channel.now >= next_command:
+            ground.send(bytes(COMMAND_LENGTH))
+            next_command += args.command_interval
+
+        while sat_radio.inbox:
+            sat.receive()
+        sat.update()
+
+        sat.send(bytes(DATA_LENGTH))
+
+        while ground_radio.inbox:
+            packet = ground.receive()
+            if packet is not None and len(packet) == DATA_LENGTH:
+                delivered += DATA_LENGTH
+        ground.update()
+
+    return delivered, sat
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"))
+    parser.add_argument("--altitude", type=float, default=500.0, help="km")
+    parser.add_argument("--min-elevation", type=float, default=5.0, help="degrees")
+    parser.add_argument("--tx-power", type=float, default=23.0, help="dBm")
+    parser.add_argument("--ground-gain", type=float, default=12.0, help="dBi")
+    parser.add_argument(
+        "--losses", type=float, default=6.0, help="Polarisation, cable etc, dB"
+    )
+    parser.add_argument("--noise-figure", type=float, default=6.0, help="dB")
+    parser.add_argument("--fading", type=float, default=8.0, help="Tumble depth, dB")
+    parser.add_argument("--tumble-period", type=float, default=40.0, help="s")
+    parser.add_argument("--margin", type=float, default=1.0, help="dB")
+    parser.add_argument("--command-interval", type=float, default=10.0, help="s")
+    parser.add_argument("--silence-timeout", type=float, default=60.0, help="s")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        lora = json.load(f)["radio"]["lora"]
+    default = (lora["spreading_factor"], lora["coding_rate"])
+
+    strategies = {
+        f"fixed SF{default[0]} 4/{default[1]}": (default, False),
+        "fixed SF7 4/5": ((7, 5), False),
+        "fixed SF10 4/8": ((10, 8), False),
+        "adaptive": (default, True),
+    }
+
+    print(
+        f"{'max elev':>8} {'strategy':<16} {'kB/pass':>8} {'changes':>8} "
+        f"{'reverts':>8} {'fallbacks':>9}"
+    )
+    for max_elevation in MAX_ELEVATIONS:
+        for name, (profile, adaptive) in strategies.items():
+            total = 0
+            changes = reverts = fallbacks = 0
+            for seed in range(args.runs):
+                delivered, sat = simulate(args, max_elevation, profile, adaptive, seed)
+                total += delivered
+                changes += sat.stats.changes
+                reverts += sat.stats.reverts
+                fallbacks += sat.stats.fallbacks
+            print(
+                f"{max_elevation:>8} {name:<16} {total / args.runs / 1000:>8.1f} "
+                f"{changes / args.runs:>8.1f} {reverts / args.runs:>8.1f} "
+                f"{fallbacks / args.runs:>9.1f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""Build an over-the-air update bundle from one artifact to the next.
+
+Compares the artifact last deployed to the satellite with a new build of
+``make build-flight-software`` and writes a bundle for the flight software's
+``ota.Updater``: for each file that changed, the operations that rebuild it
+from the copy on the satellite, copying unchanged runs of bytes and adding
+the rest. Removed files are deleted. Each patch is DEFLATE compressed where
+that makes it smaller, and checked by applying it back before it is written.
+
+With ``--manifest`` the old artifact is first checked against the deploy
+manifest of what is on the satellite, such as the ``.deploy-manifest.json``
+``scripts/deploy.py`` left on the board before launch, so the bundle is
+never built against the wrong files.
+
+Prints what each file costs and the bytes and packets uplinked for the
+whole bundle against uplinking the changed files whole.
+
+Usage:
+    python scripts/make_patch.py artifacts/deployed/flight-software artifacts/proves/flight-software -o update.ota
+    python scripts/make_patch.py OLD NEW -o update.ota --manifest /media/CIRCUITPY/.deploy-manifest.json
+"""
+
+import argparse
+import binascii
+import hashlib
+import io
+import json
+import math
+import os
+import struct
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from deploy import MANIFEST, build_manifest  # noqa: E402
+from proveskit_rp2040_v4 import deflate  # noqa: E402
+from proveskit_rp2040_v4.airtime import (  # noqa: E402
+    RADIOHEAD_HEADER_LENGTH,
+    time_on_air,
+)
+from proveskit_rp2040_v4.bulk_transfer import DATA_HEADER_LENGTH  # noqa: E402
+from proveskit_rp2040_v4.ota import (  # noqa: E402
+    BUNDLE_FORMAT,
+    ENTRY_FORMAT,
+    FLAG_DEFLATE,
+    KIND_DELETE,
+    KIND_PATCH,
+    MAGIC,
+    OP_ADD,
+    OP_COPY,
+    WINDOW_BITS,
+    apply_delta,
+    write_varint,
+)
+
+# Positions of each run of bytes remembered in the old file; later ones are
+# dropped
+MAX_CANDIDATES = 8
+
+# Largest payload the RFM9x driver sends, after RadioHead's header
+DEFAULT_PACKET_SIZE = 252
+
+
+def _copy(offset: int, length: int, expected: int) -> bytes:
+    distance = offset - expected
+    zigzag = distance << 1 if distance >= 0 else (-distance << 1) - 1
+    return bytes([OP_COPY]) + write_varint(zigzag) + write_varint(length)
+
+
+def _add(data: bytes) -> bytes:
+    return bytes([OP_ADD]) + write_varint(len(data)) + data
+
+
+def diff(old: bytes, new: bytes, min_match: int = 8) -> bytes:
+    """Operations that rebuild ``new`` from ``old``, see ``ota``.
+
+    Runs of at least ``min_match`` bytes found in ``old`` are copied, the
+    longest first and the one continuing the previous copy on a tie; the
+    rest is added.
+    """
+    index = {}
+    for i in range(len(old) - min_match + 1):
+        positions = index.setdefault(old[i : i + min_match], [])
+        if len(positions) < MAX_CANDIDATES:
+            positions.append(i)
+
+    ops = bytearray()
+    pending = bytearray()
+    expected = 0
+    i = 0
+    while i < len(new):
+        best, best_length = -1, 0
+        for j in index.get(new[i : i + min_match], ()):
+            length = min_match
+            while (
+                i + length < len(new)
+                and j + length < len(old)
+                and new[i + length] == old[j + length]
+            ):
+                length += 1
+            if length > best_length or (length == best_length and j == expected):
+                best, best_length = j, length
+        if not best_length:
+            pending.append(new[i])
+            i += 1
+            continue
+
+        # Take back bytes the match also covers
+        i += best_length
+        while pending and best > 0 and old[best - 1] == pending[-1]:
+            pending.pop()
+            best -= 1
+            best_length += 1
+        if pending:
+            ops += _add(bytes(pending))
+            pending = bytearray()
+        ops += _copy(best, best_length, expected)
+        expected = best + best_length
+    if pending:
+        ops += _add(bytes(pending))
+    return bytes(ops)
+
+
+def _read(path: str) -> bytes:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return b""
+
+
+def _entry(kind: int, path: str, old: bytes, new: bytes, body: bytes = b"") -> bytes:
+    flags = 0
+    if body:
+        compressed = deflate.compress(body, WINDOW_BITS)
+        if len(compressed) < len(body):
+            body, flags = compressed, FLAG_DEFLATE
+    name = path.encode("utf-8")
+    return (
+        struct.pack(
+            ENTRY_FORMAT,
+            kind,
+            flags,
+            len(name),
+            len(old),
+            binascii.crc32(old),
+            len(new),
+            binascii.crc32(new),
+            hashlib.sha256(new).digest(),
+            len(body),
+        )
+        + name
+        + body
+    )
+
+
+def build_bundle(old_dir: str, new_dir: str, min_match: int) -> tuple:
+    """Returns the bundle and ``(path, old size, new size, entry size)`` for
+    every file in it."""
+    old_files = build_manifest(old_dir)["files"]
+    new_files = build_manifest(new_dir)["files"]
+    old_files.pop(MANIFEST, None)
+    new_files.pop(MANIFEST, None)
+
+    entries = []
+    rows = []
+    for path in sorted(set(old_files) | set(new_files)):
+        if old_files.get(path, {}).get("sha256") == new_files.get(path, {}).get(
+            "sha256"
+        ):
+            continue
+        old = _read(os.path.join(old_dir, path))
+        if path not in new_files:
+            entry = _entry(KIND_DELETE, path, old, b"")
+            rows.append((path, len(old), 0, len(entry)))
+            entries.append(entry)
+            continue
+
+        new = _read(os.path.join(new_dir, path))
+        ops = diff(old, new, min_match)
+        rebuilt = io.BytesIO()
+        apply_delta(ops, io.BytesIO(old) if old else None, rebuilt)
+        if rebuilt.getvalue() != new:
+            raise RuntimeError(f"patch for {path} does not rebuild it")
+        entry = _entry(KIND_PATCH, path, old, new, ops)
+        rows.append((path, len(old), len(new), len(entry)))
+        entries.append(entry)
+
+    if len(entries) > 0xFF:
+        raise RuntimeError("too many changed files for one bundle")
+    bundle = struct.pack(BUNDLE_FORMAT, MAGIC, len(entries)) + b"".join(entries)
+    return bundle, rows
+
+
+def check_manifest(old_dir: str, manifest_path: str) -> list:
+    """Files of the old artifact that differ from what the manifest says is
+    on the satellite."""
+    with open(manifest_path) as f:
+        deployed = json.load(f)["files"]
+    built = build_manifest(old_dir)["files"]
+    return sorted(
+        path
+        for path in set(deployed) | set(built)
+        if path != MANIFEST
+        and deployed.get(path, {}).get("sha256") != built.get(path, {}).get("sha256")
+    )
+
+
+def uplink_cost(size: int, packet_size: int, lora: dict) -> tuple:
+    """Packets, bytes on air and seconds on air to upload ``size`` bytes,
+    without retransmissions or acknowledgements."""
+    chunk = packet_size - DATA_HEADER_LENGTH
+    packets = math.ceil(size / chunk)
+    on_air = size + packets * (DATA_HEADER_LENGTH + RADIOHEAD_HEADER_LENGTH)
+    seconds = 0.0
+    for i in range(packets):
+        seconds += time_on_air(
+            min(chunk, size - i * chunk) + DATA_HEADER_LENGTH + RADIOHEAD_HEADER_LENGTH,
+            lora["spreading_factor"],
+            lora["coding_rate"],
+            lora["cyclic_redundancy_check"],
+        )
+    return packets, on_air, seconds
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old", help="Artifact directory deployed on the satellite")
+    parser.add_argument("new", help="Artifact directory to update it to")
+    parser.add_argument("-o", "--output", help="Where to write the bundle")
+    parser.add_argument(
+        "--manifest", help="Deploy manifest of what is on the satellite"
+    )
+    parser.add_argument("--min-match", type=int, default=8, help="Bytes")
+    parser.add_argument(
+        "--packet-size", type=int, default=DEFAULT_PACKET_SIZE, help="Bytes"
+    )
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"))
+    args = parser.parse_args()
+
+    if args.manifest:
+        mismatched = check_manifest(args.old, args.manifest)
+        if mismatched:
+            print(
+                f"{args.old} is not what the manifest says is deployed: "
+                + ", ".join(mismatched),
+                file=sys.stderr,
+            )
+            return 1
+
+    bundle, rows = build_bundle(args.old, args.new, args.min_match)
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(bundle)
+
+    with open(args.config) as f:
+        lora = json.load(f)["radio"]["lora"]
+
+    print(f"{'file':<48} {'old':>7} {'new':>7} {'patch':>7}")
+    for path, old_size, new_size, entry_size in rows:
+        print(f"{path:<48} {old_size:>7} {new_size:>7} {entry_size:>7}")
+
+    whole = sum(new_size for _, _, new_size, _ in rows)
+    print(f"{'':<12} {'bytes':>8} {'packets':>8} {'on air':>8} {'seconds':>8}")
+    for name, size in (("whole files", whole), ("bundle", len(bundle))):
+        packets, on_air, seconds = uplink_cost(size, args.packet_size, lora)
+        print(f"{name:<12} {size:>8} {packets:>8} {on_air:>8} {seconds:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+"""Report the flash and heap footprint of a build artifact and enforce budgets.
+
+For every file in an artifact directory the report lists its size and the
+space it occupies on the board's FAT filesystem. For every library module it
+also measures, on the host, how much heap importing the module costs, less
+what importing an empty module costs and without the modules it imports, so
+the number is the module's own rather than CPython's import machinery. Modules
+that cannot be imported on the host (because they need ``board``, ``busio``
+and friends) fall back to the heap cost of compiling and loading their code
+objects, which is the dominant part of an import on the board.
+
+The report is saved next to the artifact as ``<artifact>.size.json`` and the
+next run prints a diff against it.
+
+Budgets are configured per project in pyproject.toml and any violation makes
+the script exit non-zero, failing the build:
+
+    [tool.size-report.flight-software]
+    flash-total = 2000000
+    file-max = 65536
+    module-heap-max = 131072
+
+    [tool.size-report.flight-software.files]
+    "lib/arducam/OV5642_reg.mpy" = 40000
+
+Usage:
+    python scripts/size_report.py --source src/flight-software artifacts/proves/flight-software
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tomllib
+
+PYPROJECT = "pyproject.toml"
+
+# Allocation unit of the CIRCUITPY FAT filesystem
+CLUSTER_SIZE = 512
+
+# Runs every module in one fresh interpreter, away from this script's own
+# imports. The first import CPython runs allocates a couple of hundred
+# kilobytes of its own, so an empty module is imported before anything is
+# traced, and so is everything a module imports, library and standard library
+# alike, which it would otherwise be charged for. Modules are measured
+# dependencies first, so each is traced the first time it is imported: run
+# again, it would share the names its first run interned and look cheaper.
+# Each import is traced only once its path finders, directory caches and
+# parent package exist, and the cost of importing an empty module is
+# subtracted, so what is left is the module's own.
+_MEASURE_IMPORTS = """
+import ast, importlib, importlib.util, json, os, sys, tempfile, tracemalloc
+sys.path.insert(0, sys.argv[1])
+empty_dir = tempfile.mkdtemp()
+for name in ("_size_report_warm", "_size_report_empty"):
+    open(os.path.join(empty_dir, name + ".py"), "w").close()
+sys.path.append(empty_dir)
+importlib.import_module("_size_report_warm")
+
+def traced(name):
+    parent = name.rpartition(".")[0]
+    if parent:
+        importlib.import_module(parent)
+    importlib.util.find_spec(name)
+    tracemalloc.start()
+    try:
+        importlib.import_module(name)
+        return tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+def dependencies(name, path):
+    package = name if path.endswith("__init__.py") else name.rpartition(".")[0]
+    with open(path, "rb") as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            yield from (alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            try:
+                yield importlib.util.resolve_name(module, package)
+            except ImportError:
+                continue
+            for alias in node.names:
+                yield importlib.util.resolve_name(module, package) + "." + alias.name
+
+def measure(name, path):
+    for dependency in dependencies(name, path):
+        if dependency != name:
+            try:
+                importlib.import_module(dependency)
+            except BaseException:
+                pass
+
+    sys.modules.pop("_size_report_empty", None)
+    base = traced("_size_report_empty")
+    sys.modules.pop(name, None)
+    try:
+        size, peak = traced(name)
+        mode = "import"
+    except BaseException:
+        sys.modules.pop(name, None)
+        with open(path, "rb") as f:
+            source = f.read()
+        tracemalloc.start()
+        compile(b"", path, "exec")
+        base = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        tracemalloc.start()
+        code = compile(source, path, "exec")
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        mode = "compile"
+    return {
+        "mode": mode,
+        "heap": max(0, size - base[0]),
+        "peak": max(0, peak - base[1]),
+    }
+
+sources = dict(json.load(sys.stdin))
+order = []
+
+def visit(name, seen):
+    if name in seen or name not in sources:
+        return
+    seen.add(name)
+    visit(name.rpartition(".")[0], seen)
+    for dependency in dependencies(name, sources[name]):
+        visit(dependency, seen)
+    order.append(name)
+
+seen = set()
+for name in sources:
+    visit(name, seen)
+print(json.dumps({name: measure(name, sources[name]) for name in order}))
+"""
+
+
+def on_disk(size: int, cluster_size: int) -> int:
+    """Round a file size up to whole filesystem clusters."""
+    return -(-size // cluster_size) * cluster_size
+
+
+def measure_heaps(lib_dir: str, modules: list) -> dict:
+    """Measure the heap retained by importing each ``(module, source)``, less
+    what importing an empty module costs, in one fresh interpreter."""
+    if not modules:
+        return {}
+    result = subprocess.run(
+        [sys.executable, "-c", _MEASURE_IMPORTS, lib_dir],
+        input=json.dumps(modules),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return {
+            module: {"mode": "failed", "heap": 0, "peak": 0} for module, _ in modules
+        }
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def collect(artifact: str, source: str | None, cluster_size: int) -> dict:
+    """Build the report for an artifact directory."""
+    files = {}
+    # (module, source) of every library module, by artifact path
+    modules = {}
+    for root, dirs, names in os.walk(artifact):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, artifact).replace(os.sep, "/")
+            size = os.path.getsize(path)
+            entry = {"size": size, "on_disk": on_disk(size, cluster_size)}
+
+            if source and rel.startswith("lib/") and rel.endswith((".mpy", ".py")):
+                module_path = rel[len("lib/") :].rsplit(".", 1)[0]
+                py = os.path.join(source, "lib", module_path + ".py")
+                if os.path.exists(py):
+                    module = module_path.replace("/", ".")
+                    if module.endswith(".__init__"):
+                        module = module[: -len(".__init__")]
+                    modules[rel] = (module, py)
+
+            files[rel] = entry
+
+    if modules:
+        heaps = measure_heaps(os.path.join(source, "lib"), list(modules.values()))
+        for rel, (module, _) in modules.items():
+            files[rel].update(heaps[module])
+
+    return {
+        "cluster_size": cluster_size,
+        "files": files,
+        "flash_total": sum(f["on_disk"] for f in files.values()),
+        "heap_total": sum(f.get("heap", 0) for f in files.values()),
+    }
+
+
+def load_budgets(pyproject: str, name: str) -> dict:
+    """Read the budget table for a project from pyproject.toml."""
+    if not os.path.exists(pyproject):
+        return {}
+    with open(pyproject, "rb") as f:
+        return tomllib.load(f).get("tool", {}).get("size-report", {}).get(name, {})
+
+
+def check_budgets(report: dict, budgets: dict) -> list[str]:
+    """Return a message for every budget the report exceeds."""
+    violations = []
+
+    limit = budgets.get("flash-total")
+    if limit is not None and report["flash_total"] > limit:
+        violations.append(f"flash total {report['flash_total']} > {limit}")
+
+    file_max = budgets.get("file-max")
+    heap_max = budgets.get("module-heap-max")
+    per_file = budgets.get("files", {})
+    for path, entry in report["files"].items():
+        limit = per_file.get(path, file_max)
+        if limit is not None and entry["on_disk"] > limit:
+            violations.append(f"{path} uses {entry['on_disk']} bytes > {limit}")
+        if heap_max is not None and entry.get("heap", 0) > heap_max:
+            violations.append(f"{path} import heap {entry['heap']} > {heap_max}")
+
+    return violations
+
+
+def _delta(new: int, old: int | None) -> str:
+    if old is None:
+        return "new"
+    if new == old:
+        return ""
+    return f"{new - old:+d}"
+
+
+def print_report(report: dict, previous: dict | None) -> None:
+    old_files = previous["files"] if previous else {}
+
+    print(f"{'file':<56} {'flash':>9} {'delta':>8} {'heap':>9} {'delta':>8}")
+    for path, entry in sorted(
+        report["files"].items(), key=lambda item: -item[1]["on_disk"]
+    ):
+        old = old_files.get(path, {})
+        heap = entry.get("heap")
+        mode = entry.get("mode", "")
+        print(
+            f"{path:<56} {entry['on_disk']:>9} "
+            f"{_delta(entry['on_disk'], old.get('on_disk')) if previous else '':>8} "
+            f"{heap if heap is not None else '':>9} "
+            f"{_delta(heap, old.get('heap')) if previous and heap is not None else '':>8}"
+            f"{' (' + mode + ')' if mode and mode != 'import' else ''}"
+        )
+
+    for path in sorted(set(old_files) - set(report["files"])):
+        print(f"{path:<56} {'removed':>9} {-old_files[path]['on_disk']:>+8d}")
+
+    totals = f"total flash {report['flash_total']} bytes"
+    if previous:
+        totals += f" ({_delta(report['flash_total'], previous['flash_total']) or '+0'})"
+    totals += f", host-measured import heap {report['heap_total']} bytes"
+    if previous:
+        totals += f" ({_delta(report['heap_total'], previous['heap_total']) or '+0'})"
+    print(totals)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "artifact", help="Artifact directory, e.g. artifacts/proves/flight-software"
+    )
+    parser.add_argument("--source", help="Source tree used to measure import heap cost")
+    parser.add_argument(
+        "--name", help="Budget table name, defaults to the artifact directory name"
+    )
+    parser.add_argument("--pyproject", default=PYPROJECT)
+    parser.add_argument("--cluster-size", type=int, default=CLUSTER_SIZE)
+    args = parser.parse_args()
+
+    artifact = args.artifact.rstrip("/")
+    name = args.name or os.path.basename(artifact)
+    report_path = artifact + ".size.json"
+
+    previous = None
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            previous = json.load(f)
+
+    report = collect(artifact, args.source, args.cluster_size)
+    print_report(report, previous)
+
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    violations = check_budgets(report, load_budgets(args.pyproject, name))
+    for violation in violations:
+        print(f"BUDGET EXCEEDED: {violation}", file=sys.stderr)
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+"""Store decoded telemetry in an indexed SQLite database, query and export it.
+
+Frames come from the ground station pipeline's ``received.jsonl``, one
+``MessageDecoder`` record per line, and from telemetry archive downlinks
+received with ``receive_archive``. Each frame is one row of ``frames``:
+
+    received     ground receive time, seconds since the epoch
+    sat_time     the satellite's time, seconds since the epoch: boot time
+                 plus uptime for beacons, the record time for archives
+    boot_count   the satellite's boot counter
+    kind         beacon, json, text, binary or archive<kind>
+    ...          every beacon field, vectors as _x, _y and _z columns
+    data         anything else, as JSON
+
+Rows are appended in batches, each one transaction, and indexed on receive
+time, satellite time, boot count and kind, so a query by time range or boot
+count reads only the rows it returns. Other fields filter the rows that
+range selects.
+
+Usage:
+    python scripts/telemetry_db.py ingest telemetry.db received.jsonl archive.bin
+    python scripts/telemetry_db.py query telemetry.db --start 2026-10-01 --end 2026-10-02
+    python scripts/telemetry_db.py query telemetry.db --boot-count 42 --field error_count --min 1
+    python scripts/telemetry_db.py export telemetry.db beacons.csv --kind beacon
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, "src", "flight-software", "lib"))
+
+from proveskit_rp2040_v4 import beacon_codec  # noqa: E402
+from proveskit_rp2040_v4.telemetry_archive import (  # noqa: E402
+    KIND_BEACON,
+    RECORD_LENGTH,
+    unpack_record,
+)
+
+# Beacon fields with a column of their own
+SCALARS = ("schema", "flags", "boot_time", "uptime", "error_count", "name")
+VECTORS = ("acceleration", "angular_velocity", "magnetic_field")
+BEACON_COLUMNS = SCALARS + tuple(
+    f"{vector}_{axis}" for vector in VECTORS for axis in "xyz"
+)
+COLUMNS = ("received", "sat_time", "boot_count", "kind") + BEACON_COLUMNS + ("data",)
+
+# Index names and the columns they cover
+INDEXES = (
+    ("frames_received", "received"),
+    ("frames_sat_time", "sat_time"),
+    ("frames_boot_count", "boot_count, sat_time"),
+    ("frames_kind", "kind, received"),
+)
+
+DEFAULT_BATCH = 10000
+
+
+def _schema() -> str:
+    columns = ["id INTEGER PRIMARY KEY", "received REAL", "sat_time REAL"]
+    columns += ["boot_count INTEGER", "kind TEXT"]
+    columns += [f"{column} {_type(column)}" for column in BEACON_COLUMNS]
+    columns.append("data TEXT")
+    return f"CREATE TABLE IF NOT EXISTS frames ({', '.join(columns)})"
+
+
+def _type(column: str) -> str:
+    if column == "name":
+        return "TEXT"
+    if column in ("schema", "flags", "boot_time", "uptime", "error_count"):
+        return "INTEGER"
+    return "REAL"
+
+
+def beacon_row(received, beacon: dict) -> tuple:
+    """Row for a decoded beacon received at ``received``."""
+    row = [
+        received,
+        None,
+        beacon.get("boot_count"),
+        "beacon",
+    ]
+    row += [beacon.get(field) for field in SCALARS]
+    for vector in VECTORS:
+        row += beacon.get(vector) or (None, None, None)
+    # What else the decoder says, such as frames_lost for delta beacons
+    extra = {
+        key: value
+        for key, value in beacon.items()
+        if key not in SCALARS + VECTORS + ("boot_count",)
+    }
+    row.append(json.dumps(extra) if extra else None)
+    if beacon.get("boot_time") is not None and beacon.get("uptime") is not None:
+        row[1] = beacon["boot_time"] + beacon["uptime"]
+    return tuple(row)
+
+
+def record_row(record: dict) -> tuple:
+    """Row for a ``ground_pipeline.MessageDecoder`` record."""
+    if record.get("kind") == "beacon":
+        return beacon_row(record.get("received"), record["beacon"])
+    data = {
+        key: value
+        for key, value in record.items()
+        if key not in ("received", "kind", "size")
+    }
+    empty = (None,) * len(BEACON_COLUMNS)
+    return (
+        (record.get("received"), None, None, record.get("kind"))
+        + empty
+        + (json.dumps(data),)
+    )
+
+
+def archive_rows(data: bytes, received=None):
+    """Rows for the records of a telemetry archive downlink. Records that
+    fail their CRC are skipped."""
+    for offset in range(0, len(data) - RECORD_LENGTH + 1, RECORD_LENGTH):
+        unpacked = unpack_record(data[offset : offset + RECORD_LENGTH])
+        if unpacked is None:
+            continue
+        timestamp, kind, payload = unpacked
+        if kind == KIND_BEACON:
+            try:
+                row = beacon_row(received, beacon_codec.decode(payload))
+            except beacon_codec.BeaconDecodeError:
+                row = None
+            if row is not None:
+                yield (row[0], timestamp) + row[2:]
+                continue
+        empty = (None,) * len(BEACON_COLUMNS)
+        yield (
+            (received, timestamp, None, f"archive{kind}")
+            + empty
+            + (json.dumps({"hex": payload.hex()}),)
+        )
+
+
+def parse_time(value: str) -> float:
+    """Seconds since the epoch, or an ISO 8601 date and time, UTC unless it
+    says otherwise."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    when = datetime.datetime.fromisoformat(value)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return when.timestamp()
+
+
+class TelemetryStore:
+    """An SQLite telemetry database that rows are appended to in batches.
+
+    Args:
+        path: The database file, created if it does not exist.
+        batch: Rows buffered before they are written.
+    """
+
+    def __init__(self, path: str, batch: int = DEFAULT_BATCH) -> None:
+        self.path = path
+        self.batch = batch
+        self._pending: list = []
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(_schema())
+        for name, columns in INDEXES:
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON frames ({columns})")
+        self.db.commit()
+        self._insert = (
+            f"INSERT INTO frames ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(COLUMNS))})"
+        )
+
+    def __enter__(self) -> "TelemetryStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def append(self, row: tuple) -> None:
+        """Queue a row, writing the batch once it is full."""
+        self._pending.append(row)
+        if len(self._pending) >= self.batch:
+            self.flush()
+
+    def extend(self, rows) -> None:
+        for row in rows:
+            self.append(row)
+
+    def add(self, record: dict) -> dict:
+        """Queue a ``MessageDecoder`` record. Returns it, so this can be a
+        ground pipeline stage."""
+        self.append(record_row(record))
+        return record
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        with self.db:
+            self.db.executemany(self._insert, self._pending)
+        self._pending = []
+
+    def close(self) -> None:
+        self.flush()
+        self.db.close()
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+
+    def query(
+        self,
+        start: float | None = None,
+        end: float | None = None,
+        by: str = "received",
+        boot_count: int | None = None,
+        kind: str | None = None,
+        field: str | None = None,
+        minimum: float | None = None,
+        maximum: float | None = None,
+        columns=COLUMNS,
+        limit: int | None = None,
+    ):
+        """Rows in time order, as tuples of ``columns``.
+
+        Args:
+            start: Earliest time, inclusive.
+            end: Latest time, exclusive.
+            by: ``received`` or ``sat_time``, the time ``start`` and ``end``
+                are in and rows are ordered by.
+            boot_count: Only rows from this boot.
+            kind: Only rows of this kind.
+            field: A column to filter on with ``minimum`` and ``maximum``.
+            minimum: Least value of ``field``, inclusive.
+            maximum: Greatest value of ``field``, inclusive.
+            columns: Columns to return.
+            limit: Most rows to return.
+
+        Raises:
+            ValueError: For a column that does not exist.
+        """
+        for column in (by, field, *columns):
+            if column is not None and column not in COLUMNS:
+                raise ValueError(f"no column {column!r}")
+        if by not in ("received", "sat_time"):
+            raise ValueError("rows are ordered by received or sat_time")
+
+        where = []
+        params = []
+        for clause, value in (
+            (f"{by} >= ?", start),
+            (f"{by} < ?", end),
+            ("boot_count = ?", boot_count),
+            ("kind = ?", kind),
+            (f"{field} >= ?", minimum),
+            (f"{field} <= ?", maximum),
+        ):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+
+        sql = f"SELECT {', '.join(columns)} FROM frames"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {by}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        self.flush()
+        return self.db.execute(sql, params)
+
+    def export_csv(self, path: str, **query) -> int:
+        """Write the rows of :meth:`query` to a CSV file with a header.
+
+        Returns:
+            The number of rows written.
+        """
+        columns = query.pop("columns", COLUMNS)
+        rows = 0
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            cursor = self.query(columns=columns, **query)
+            while True:
+                chunk = cursor.fetchmany(self.batch)
+                if not chunk:
+                    return rows
+                writer.writerows(chunk)
+                rows += len(chunk)
+
+
+def ingest(store: TelemetryStore, path: str) -> int:
+    """Append the frames in a ``received.jsonl`` or archive file. Returns
+    how many rows there were."""
+    store.flush()
+    before = store.count()
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    store.add(json.loads(line))
+    else:
+        with open(path, "rb") as f:
+            # Archives are stamped by the satellite; when the ground station
+            # received them is not recorded
+            store.extend(archive_rows(f.read()))
+    store.flush()
+    return store.count() - before
+
+
+def _query_args(args) -> dict:
+    return {
+        "start": parse_time(args.start) if args.start else None,
+        "end": parse_time(args.end) if args.end else None,
+        "by": args.by,
+        "boot_count": args.boot_count,
+        "kind": args.kind,
+        "field": args.field,
+        "minimum": args.min,
+        "maximum": args.max,
+        "limit": args.limit,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Append frames")
+    ingest_parser.add_argument("db")
+    ingest_parser.add_argument("paths", nargs="+", help=".jsonl or archive files")
+
+    query_parser = commands.add_parser("query", help="Print frames")
+    export_parser = commands.add_parser("export", help="Write frames to CSV")
+    query_parser.add_argument("db")
+    export_parser.add_argument("db")
+    export_parser.add_argument("csv")
+    for sub in (query_parser, export_parser):
+        sub.add_argument("--start", help="Seconds since the epoch or ISO 8601")
+        sub.add_argument("--end", help="Seconds since the epoch or ISO 8601")
+        sub.add_argument("--by", choices=("received", "sat_time"), default="received")
+        sub.add_argument("--boot-count", type=int)
+        sub.add_argument("--kind")
+        sub.add_argument("--field", help="Column to filter with --min and --max")
+        sub.add_argument("--min", type=float)
+        sub.add_argument("--max", type=float)
+        sub.add_argument("--limit", type=int)
+        sub.add_argument("--columns", help="Comma separated, all by default")
+    args = parser.parse_args()
+
+    with TelemetryStore(args.db) as store:
+        if args.command == "ingest":
+            for path in args.paths:
+                print(f"{path}: {ingest(store, path)} frames")
+            return 0
+
+        query = _query_args(args)
+        if args.columns:
+            query["columns"] = tuple(args.columns.split(","))
+        try:
+            if args.command == "export":
+                print(f"{store.export_csv(args.csv, **query)} frames")
+                return 0
+            cursor = store.query(**query)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        names = [description[0] for description in cursor.description]
+        for row in cursor:
+            print(json.dumps({k: v for k, v in zip(names, row) if v is not None}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Measure ingest rate and query latency of the telemetry database.
+
+Appends ``--records`` synthetic frames to a fresh ``telemetry_db``
+database in batches, about a year of passes at one frame every three
+seconds: mostly beacons, one in twenty a JSON message, and a reboot every
+few thousand frames. Then times the queries operators run, each from
+random starting points, and an export of one day to CSV.
+
+Prints rows per second over the whole ingest and over its last tenth, when
+the indexes are largest, then the median and 95th percentile latency of
+each query and the rows it returned.
+
+Usage:
+    python scripts/telemetry_db_benchmark.py
+    python scripts/telemetry_db_benchmark.py --records 1000000 --db /tmp/bench.db
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from telemetry_db import BEACON_COLUMNS, TelemetryStore
+
+EPOCH = 1767225600.0
+INTERVAL = 3.0
+FRAMES_PER_BOOT = 5000
+
+HOUR = 3600.0
+DAY = 86400.0
+
+
+def frames(count: int, seed: int):
+    rng = random.Random(seed)
+    empty = (None,) * len(BEACON_COLUMNS)
+    boot_time = EPOCH
+    for i in range(count):
+        received = EPOCH + i * INTERVAL
+        boot_count = i // FRAMES_PER_BOOT
+        if i % FRAMES_PER_BOOT == 0:
+            boot_time = received
+        sat_time = received - rng.random()
+        if i % 20 == 19:
+            yield (received, None, None, "json") + empty + ('{"json": {"ok": 1}}',)
+            continue
+        uptime = int(sat_time - boot_time)
+        yield (
+            received,
+            sat_time,
+            boot_count,
+            "beacon",
+            1,
+            0,
+            int(boot_time),
+            uptime,
+            rng.random() < 0.01,
+            None,
+            rng.gauss(0, 0.1),
+            rng.gauss(0, 0.1),
+            9.8 + rng.gauss(0, 0.1),
+            rng.gauss(0, 0.01),
+            rng.gauss(0, 0.01),
+            rng.gauss(0, 0.01),
+            20 + rng.gauss(0, 1),
+            5 + rng.gauss(0, 1),
+            -30 + rng.gauss(0, 1),
+            None,
+        )
+
+
+def timed(function, repeats: int) -> tuple:
+    """Median and 95th percentile milliseconds of ``function()``, and the
+    rows it returned the last time."""
+    times = []
+    rows = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        rows = function()
+        times.append(1000 * (time.perf_counter() - start))
+    times.sort()
+    return statistics.median(times), times[int(0.95 * (len(times) - 1))], rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=10_000_000)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--db", help="Database to create, a temporary file by default")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    directory = None
+    path = args.db
+    if path is None:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "telemetry.db")
+    elif os.path.exists(path):
+        print(f"{path} exists", file=sys.stderr)
+        return 1
+
+    store = TelemetryStore(path, args.batch)
+    tail = args.records - args.records // 10
+    start = time.perf_counter()
+    tail_start = start
+    for i, row in enumerate(frames(args.records, args.seed)):
+        if i == tail:
+            store.flush()
+            tail_start = time.perf_counter()
+        store.append(row)
+    store.flush()
+    end = time.perf_counter()
+    size = os.path.getsize(path) + os.path.getsize(path + "-wal")
+
+    print(
+        f"ingested {args.records} frames in {end - start:.1f} s, "
+        f"{args.records / (end - start):,.0f} frames/s, last tenth "
+        f"{(args.records - tail) / (end - tail_start):,.0f} frames/s, "
+        f"{size / 1e6:.0f} MB"
+    )
+
+    rng = random.Random(args.seed)
+    span = args.records * INTERVAL
+    boots = args.records // FRAMES_PER_BOOT + 1
+
+    def window(length: float) -> tuple:
+        first = EPOCH + rng.uniform(0, max(0.0, span - length))
+        return first, first + length
+
+    def fetch(**query) -> int:
+        return len(store.query(**query).fetchall())
+
+    def export() -> int:
+        first, last = window(DAY)
+        return store.export_csv(
+            os.path.join(tempfile.gettempdir(), "telemetry_benchmark.csv"),
+            start=first,
+            end=last,
+        )
+
+    queries = (
+        (
+            "received, 1 hour",
+            lambda: fetch(**dict(zip(("start", "end"), window(HOUR)))),
+        ),
+        (
+            "sat_time, 1 day",
+            lambda: fetch(by="sat_time", **dict(zip(("start", "end"), window(DAY)))),
+        ),
+        ("one boot", lambda: fetch(boot_count=rng.randrange(boots))),
+        (
+            "json, 1 day",
+            lambda: fetch(kind="json", **dict(zip(("start", "end"), window(DAY)))),
+        ),
+        (
+            "errors, 1 week",
+            lambda: fetch(
+                field="error_count",
+                minimum=1,
+                columns=("sat_time", "boot_count", "error_count"),
+                **dict(zip(("start", "end"), window(7 * DAY))),
+            ),
+        ),
+        ("latest 100", lambda: fetch(start=EPOCH + span - HOUR, limit=100)),
+        ("export 1 day to CSV", export),
+    )
+    print(f"{'query':<22} {'median ms':>10} {'p95 ms':>10} {'rows':>8}")
+    for name, function in queries:
+        median, p95, rows = timed(function, args.repeats)
+        print(f"{name:<22} {median:>10.2f} {p95:>10.2f} {rows:>8}")
+
+    store.close()
+    if directory is not None:
+        directory.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -169,6 +169,12 @@ class ArducamClass(object):
         self.SPI_CS=digitalio.DigitalInOut(board.GP5)
         self.SPI_CS.direction = digitalio.Direction.OUTPUT
         self.I2cAddress=0x30
+        # Scratch buffers reused by every register access so polling the
+        # camera does not allocate on the heap
+        self._buf1=bytearray(1)
+        self._buf2=bytearray(2)
+        self._buf3=bytearray(3)
+        self._rt=bytearray(1)
         self.spi = busio.SPI(clock=board.GP2, MOSI=board.GP3, MISO=board.GP4)
         while not self.spi.try_lock():
             pass
@@ -210,7 +216,7 @@ class ArducamClass(object):
         self.CameraMode=mode
     
     def wrSensorReg16_8(self,addr,val):
-        buffer=bytearray(3)
+        buffer=self._buf3
         buffer[0]=(addr>>8)&0xff
         buffer[1]=addr&0xff
         buffer[2]=val
@@ -218,8 +224,8 @@ class ArducamClass(object):
         utime.sleep(0.003)
 
     def rdSensorReg16_8(self,addr):
-        buffer=bytearray(2)
-        rt=bytearray(1)
+        buffer=self._buf2
+        rt=self._rt
         buffer[0]=(addr>>8)&0xff
         buffer[1]=addr&0xff
         self.iic_write(buffer)
@@ -227,7 +233,7 @@ class ArducamClass(object):
         return rt[0]
     
     def wrSensorReg8_8(self,addr,val):
-        buffer=bytearray(2)
+        buffer=self._buf2
         buffer[0]=addr
         buffer[1]=val
         self.iic_write(buffer)
@@ -243,7 +249,7 @@ class ArducamClass(object):
         self.i2c.readfrom_into(self.I2cAddress, buf, start=start, end=end)
         
     def rdSensorReg8_8(self,addr):
-        buffer=bytearray(1)
+        buffer=self._buf1
         buffer[0]=addr
         self.iic_write(buffer)
         self.iic_readinto(buffer)
@@ -304,7 +310,7 @@ class ArducamClass(object):
         
     def Spi_write(self,address,value):
         maskbits = 0x80
-        buffer=bytearray(2)
+        buffer=self._buf2
         buffer[0]=address | maskbits
         buffer[1]=value
         self.SPI_CS_LOW()
@@ -312,8 +318,10 @@ class ArducamClass(object):
         self.SPI_CS_HIGH()
         
     def Spi_read(self,address):
+        # The returned buffer is reused by the next register access, read the
+        # value out of it before touching the camera again
         maskbits = 0x7f
-        buffer=bytearray(1)
+        buffer=self._buf1
         buffer[0]=address & maskbits
         self.SPI_CS_LOW()
         self.spi_write(buffer)
@@ -342,9 +350,20 @@ class ArducamClass(object):
         self.SPI_CS.value=True
         
     def set_fifo_burst(self):
-        buffer=bytearray(1)
+        buffer=self._buf1
         buffer[0]=0x3c
         self.spi.write(buffer, start=0, end=1)
+
+    def read_fifo_burst_into(self,buf,length=None):
+        # Read the next chunk of image data into a caller owned buffer, such
+        # as a bytearray allocated once. Returns the number of bytes read
+        if length is None:
+            length=len(buf)
+        self.SPI_CS_LOW()
+        self.set_fifo_burst()
+        self.spi_readinto(buf,start=0,end=length)
+        self.SPI_CS_HIGH()
+        return length
         
     def clear_fifo_flag(self):
         self.Spi_write(0x04,0x01)
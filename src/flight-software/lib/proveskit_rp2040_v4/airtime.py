@@ -0,0 +1,85 @@
+"""LoRa time-on-air calculation.
+
+Implements the Semtech SX127x time-on-air formula so that packet sizes can be
+compared in airtime rather than bytes. The defaults match what the RFM9x
+driver configures unless told otherwise: 125 kHz bandwidth, an 8 symbol
+preamble and an explicit header.
+"""
+
+import math
+
+DEFAULT_BANDWIDTH = 125000
+DEFAULT_PREAMBLE_LENGTH = 8
+
+# adafruit_rfm prepends a RadioHead header (destination, node, identifier,
+# flags) to every packet
+RADIOHEAD_HEADER_LENGTH = 4
+
+
+def symbol_time(spreading_factor: int, bandwidth: int = DEFAULT_BANDWIDTH) -> float:
+    """Duration of one LoRa symbol in seconds."""
+    return (1 << spreading_factor) / bandwidth
+
+
+def time_on_air(
+    payload_length: int,
+    spreading_factor: int,
+    coding_rate: int,
+    crc: bool = True,
+    bandwidth: int = DEFAULT_BANDWIDTH,
+    preamble_length: int = DEFAULT_PREAMBLE_LENGTH,
+    explicit_header: bool = True,
+    low_data_rate_optimize: bool | None = None,
+) -> float:
+    """Time on air in seconds of a single LoRa packet.
+
+    Args:
+        payload_length: Bytes handed to the modem, including any driver header.
+        spreading_factor: Spreading factor, 6 to 12.
+        coding_rate: Coding rate denominator as in config.json, 5 to 8 for 4/5
+            to 4/8.
+        crc: Whether the payload CRC is enabled.
+        bandwidth: Bandwidth in Hz.
+        preamble_length: Programmed preamble length in symbols.
+        explicit_header: Whether the explicit LoRa header is sent.
+        low_data_rate_optimize: Force low data rate optimisation on or off. By
+            default it is enabled when a symbol lasts longer than 16 ms, as the
+            driver does.
+    """
+    t_sym = symbol_time(spreading_factor, bandwidth)
+    if low_data_rate_optimize is None:
+        low_data_rate_optimize = t_sym > 0.016
+
+    de = 1 if low_data_rate_optimize else 0
+    ih = 0 if explicit_header else 1
+    cr = coding_rate - 4
+
+    numerator = 8 * payload_length - 4 * spreading_factor + 28 + 16 * int(crc) - 20 * ih
+    denominator = 4 * (spreading_factor - 2 * de)
+    payload_symbols = 8 + max(math.ceil(numerator / denominator) * (cr + 4), 0)
+
+    return (preamble_length + 4.25) * t_sym + payload_symbols * t_sym
+
+
+def lora_time_on_air(
+    payload_length: int,
+    lora,
+    spreading_factor: int | None = None,
+    coding_rate: int | None = None,
+) -> float:
+    """Time on air in seconds of a packet sent with ``config.radio.lora``.
+
+    Args:
+        payload_length: Bytes handed to the radio manager, without the
+            RadioHead header the driver adds.
+        lora: ``config.radio.lora``.
+        spreading_factor: Use this instead of the configured spreading factor,
+            for instance after link adaptation changed it.
+        coding_rate: Use this instead of the configured coding rate.
+    """
+    return time_on_air(
+        payload_length + RADIOHEAD_HEADER_LENGTH,
+        spreading_factor or lora.spreading_factor,
+        coding_rate or lora.coding_rate,
+        lora.cyclic_redundancy_check,
+    )
@@ -0,0 +1,278 @@
+"""Airtime accounting per message class, and duty-cycle and energy budgets.
+
+:class:`AirtimeMeter` wraps the radio manager, underneath everything else that
+sends, so every packet the ``PacketManager`` produces is measured at the
+length that actually goes on air, FEC parity and link control included. The
+time on air is computed from ``config.radio.lora`` with
+:func:`airtime.lora_time_on_air` and charged to the class of the message
+being sent, which the ``TxQueue`` sets while it sends. Anything sent outside
+the queue is charged to ``OTHER`` unless the sender sets a class.
+
+Lifetime totals are kept in RAM and written to NVM every ``persist_interval``
+seconds, since the NVM is flash and wears with every write. A reset loses at
+most that much accounting.
+
+Each :class:`Budget` limits what is spent in a rolling window: seconds on air
+for a duty cycle, or joules for an energy budget. When one runs out, the
+meter stops allowing its low priority classes, and the ``TxQueue`` keeps
+those messages queued until the window has moved on. A budget can also be
+limited to what one class spends, such as :func:`repeat_budget`.
+
+NVM record at ``Register.airtime``:
+    ``RECORD_FORMAT``: lifetime tenths of a second on air per class, followed
+    by the CRC-16 of those bytes from ``binascii.crc32``.
+"""
+
+import binascii
+import struct
+import time
+
+from .airtime import lora_time_on_air
+from .tx_queue import CLASS_NAMES, PRIORITY_REPEAT, PRIORITY_TELEMETRY
+
+# Charged for anything sent outside the TxQueue, such as link control
+OTHER = len(CLASS_NAMES)
+
+METER_CLASS_NAMES = CLASS_NAMES + ("other",)
+
+_TOTALS_FORMAT = "<" + "I" * len(METER_CLASS_NAMES)
+RECORD_FORMAT = _TOTALS_FORMAT + "H"
+RECORD_LENGTH = struct.calcsize(RECORD_FORMAT)
+
+# Default limit of the duty-cycle budget, as a fraction of the window
+DEFAULT_DUTY_CYCLE = 0.1
+
+# Default share of airtime repeated messages may take
+DEFAULT_REPEAT_DUTY_CYCLE = 0.02
+
+# Power the radio draws while transmitting at +20 dBm, about 120 mA at 3.3 V
+# from the RFM9x datasheet
+DEFAULT_TRANSMIT_POWER_DRAW = 0.4
+
+
+def _crc16(data: bytes) -> int:
+    return binascii.crc32(data) & 0xFFFF
+
+
+class Budget:
+    """A limit on what may be spent in a rolling window.
+
+    The window is split into ``buckets`` slots so that old spending expires
+    gradually without remembering every packet.
+
+    Args:
+        name: Name used in logs and stats.
+        limit: Most that may be spent in the window, in the budget's unit.
+        window: Length of the window in seconds.
+        per_second: Units one second on air costs, 1 for a duty cycle or the
+            transmit power draw in watts for an energy budget.
+        defer_from: Classes of this priority and lower are deferred once the
+            budget is spent.
+        only: Charge only what this class sends, or None to charge
+            everything.
+        buckets: Number of slots the window is split into.
+        clock: Returns the time in seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: float,
+        window: float,
+        per_second: float = 1.0,
+        defer_from: int = PRIORITY_TELEMETRY,
+        only: int | None = None,
+        buckets: int = 12,
+        clock=time.monotonic,
+    ) -> None:
+        self.name: str = name
+        self.limit: float = limit
+        self.window: float = window
+        self.per_second: float = per_second
+        self.defer_from: int = defer_from
+        self.only: int | None = only
+        self._clock = clock
+        self._slot_length: float = window / buckets
+        self._slots: list = [0.0] * buckets
+        self._slot: int = int(clock() // self._slot_length)
+
+    def _advance(self) -> None:
+        slot = int(self._clock() // self._slot_length)
+        for expired in range(
+            max(self._slot + 1, slot - len(self._slots) + 1), slot + 1
+        ):
+            self._slots[expired % len(self._slots)] = 0.0
+        self._slot = max(self._slot, slot)
+
+    def charge(self, airtime: float) -> None:
+        self._advance()
+        self._slots[self._slot % len(self._slots)] += airtime * self.per_second
+
+    def used(self) -> float:
+        self._advance()
+        return sum(self._slots)
+
+    def exhausted(self) -> bool:
+        return self.used() >= self.limit
+
+    def allows(self, priority: int) -> bool:
+        return priority < self.defer_from or not self.exhausted()
+
+    def to_dict(self) -> dict:
+        return {"used": self.used(), "limit": self.limit, "window": self.window}
+
+
+def duty_cycle_budget(
+    duty_cycle: float = DEFAULT_DUTY_CYCLE, window: float = 3600.0, **kwargs
+) -> Budget:
+    """A :class:`Budget` of ``duty_cycle`` of every ``window`` seconds on air."""
+    return Budget("duty_cycle", duty_cycle * window, window, **kwargs)
+
+
+def energy_budget(
+    joules: float,
+    window: float = 86400.0,
+    transmit_power_draw: float = DEFAULT_TRANSMIT_POWER_DRAW,
+    **kwargs,
+) -> Budget:
+    """A :class:`Budget` of ``joules`` spent transmitting every ``window``
+    seconds."""
+    return Budget("energy", joules, window, transmit_power_draw, **kwargs)
+
+
+def repeat_budget(
+    duty_cycle: float = DEFAULT_REPEAT_DUTY_CYCLE, window: float = 3600.0, **kwargs
+) -> Budget:
+    """A :class:`Budget` of ``duty_cycle`` of every ``window`` seconds for
+    repeated messages only, which leaves everything else unaffected."""
+    return Budget(
+        "repeat",
+        duty_cycle * window,
+        window,
+        defer_from=PRIORITY_REPEAT,
+        only=PRIORITY_REPEAT,
+        **kwargs,
+    )
+
+
+class AirtimeMeter:
+    """Wraps a radio manager and accounts for the airtime of every packet.
+
+    Anything other than ``send`` is passed through to the wrapped radio.
+
+    Args:
+        logger: Logger instance.
+        radio: The radio manager to wrap.
+        lora: ``config.radio.lora``.
+        budgets: :class:`Budget` instances to charge and enforce.
+        nvm: Byte array the lifetime totals persist in, such as
+            ``microcontroller.nvm``, or None to keep them in RAM only.
+        offset: Where in ``nvm`` the record starts.
+        persist_interval: Seconds between writes to ``nvm``.
+        profile: Returns the ``(spreading_factor, coding_rate)`` in use, when
+            link adaptation may have changed them from ``lora``.
+        clock: Returns the time in seconds.
+    """
+
+    def __init__(
+        self,
+        logger,
+        radio,
+        lora,
+        budgets: tuple = (),
+        nvm=None,
+        offset: int = 0,
+        persist_interval: float = 3600.0,
+        profile=None,
+        clock=time.monotonic,
+    ) -> None:
+        self._log = logger
+        self._radio = radio
+        self._lora = lora
+        self._nvm = nvm
+        self._offset = offset
+        self._profile = profile
+        self._clock = clock
+        self.budgets: tuple = budgets
+        self.persist_interval: float = persist_interval
+        self._last_persisted: float = clock()
+
+        # Class the next packets are charged to, set by the TxQueue and bulk
+        # transfers
+        self.message_class: int = OTHER
+
+        self.packets: list = [0] * len(METER_CLASS_NAMES)
+        self.session: list = [0.0] * len(METER_CLASS_NAMES)
+        self.lifetime: list = self._load()
+        self._dirty: bool = False
+
+    def __getattr__(self, name: str):
+        return getattr(self._radio, name)
+
+    def _load(self) -> list:
+        if self._nvm is None:
+            return [0.0] * len(METER_CLASS_NAMES)
+        record = bytes(self._nvm[self._offset : self._offset + RECORD_LENGTH])
+        values = struct.unpack(RECORD_FORMAT, record)
+        if values[-1] != _crc16(record[:-2]):
+            self._log.info("No valid airtime record in NVM, starting from zero")
+            return [0.0] * len(METER_CLASS_NAMES)
+        return [tenths / 10 for tenths in values[:-1]]
+
+    def persist(self) -> None:
+        """Write the lifetime totals to NVM if they changed."""
+        self._last_persisted = self._clock()
+        if self._nvm is None or not self._dirty:
+            return
+        totals = struct.pack(
+            _TOTALS_FORMAT,
+            *(min(int(seconds * 10), 0xFFFFFFFF) for seconds in self.lifetime),
+        )
+        record = totals + struct.pack("<H", _crc16(totals))
+        self._nvm[self._offset : self._offset + RECORD_LENGTH] = record
+        self._dirty = False
+
+    def update(self) -> None:
+        """Persist the totals if ``persist_interval`` has passed."""
+        if self._clock() - self._last_persisted >= self.persist_interval:
+            self.persist()
+
+    def airtime(self, length: int) -> float:
+        """Seconds on air of a packet of ``length`` bytes at the current
+        settings."""
+        if self._profile is None:
+            return lora_time_on_air(length, self._lora)
+        return lora_time_on_air(length, self._lora, *self._profile())
+
+    def allows(self, priority: int) -> bool:
+        """Whether every budget leaves room for a class of ``priority``."""
+        for budget in self.budgets:
+            if not budget.allows(priority):
+                return False
+        return True
+
+    def send(self, data) -> bool:
+        airtime = self.airtime(len(data))
+        message_class = self.message_class
+        self.packets[message_class] += 1
+        self.session[message_class] += airtime
+        self.lifetime[message_class] += airtime
+        self._dirty = True
+        for budget in self.budgets:
+            if budget.only is None or budget.only == message_class:
+                budget.charge(airtime)
+        return self._radio.send(data)
+
+    def stats(self) -> dict:
+        """Airtime per class and budget use, for logging."""
+        stats = {
+            name: {
+                "packets": self.packets[index],
+                "session": self.session[index],
+                "lifetime": self.lifetime[index],
+            }
+            for index, name in enumerate(METER_CLASS_NAMES)
+        }
+        for budget in self.budgets:
+            stats[budget.name] = budget.to_dict()
+        return stats
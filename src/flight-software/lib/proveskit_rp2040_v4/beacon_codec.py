@@ -0,0 +1,714 @@
+"""Binary beacon encoding shared by the flight software and the ground station.
+
+Every beacon starts with a schema byte. Schema ``SCHEMA_STRUCT_V1`` is a fixed
+layout of little-endian fixed-point ``struct`` fields:
+
+    offset  format  field
+    0       B       schema
+    1       B       flags, see the FLAG_* constants
+    2       I       boot_time, seconds since the epoch
+    6       I       uptime, seconds since boot
+    10      H       boot_count
+    12      H       error_count
+    14      3h      acceleration, 0.01 m/s^2 per LSB
+    20      3h      angular_velocity, 0.001 rad/s per LSB
+    26      3h      magnetic_field, 0.1 uT per LSB
+    32      B       name length, only when FLAG_NAME is set
+    33      ...     name, UTF-8
+
+Schemas ``SCHEMA_KEYFRAME_V1`` and ``SCHEMA_DELTA_V1`` form the delta beacon
+mode. A keyframe is the struct layout above with the flags byte preceded by a
+``key`` byte holding the keyframe id in its high nibble. The frames between
+keyframes carry only what differs from the last keyframe:
+
+    offset  format  field
+    0       B       schema
+    1       B       key, keyframe id << 4 | frame number since the keyframe
+    2       H       uptime minus the keyframe's uptime
+    4       B       mask, see the DELTA_* constants
+    5       ...     changed fields in mask bit order: flags (B), boot_count
+                    (H), error_count (H), then each changed vector as 3b
+                    quantised deltas from the keyframe, or 3h absolute values
+                    when DELTA_WIDE is set
+
+In a keyframe, the low nibble of the key byte holds the number of frames
+sent since the previous keyframe minus one, so the decoder can count frames
+lost across a keyframe. The name flag is left out of delta frames, which
+never carry the name, so a keyframe with the name does not make every delta
+after it carry the flags.
+
+Deltas are taken against the keyframe rather than the previous frame, so a
+lost delta frame costs only itself. Losing a keyframe makes the following
+delta frames undecodable until the next keyframe, which the decoder reports.
+
+Schema ``SCHEMA_MSGPACK_V1`` carries the same fields as a msgpack list for
+when the fixed layout cannot represent a value, see :func:`fits_struct`. Both ``msgpack`` and
+``struct`` are part of the CircuitPython board build; on the host ``msgpack``
+is the pip package of the same name.
+
+This module has no hardware dependencies so the ground station and host tools
+can import it.
+"""
+
+import struct
+
+from .markers import (
+    SCHEMA_DELTA_V1,
+    SCHEMA_KEYFRAME_V1,
+    SCHEMA_MSGPACK_V1,
+    SCHEMA_STRUCT_V1,
+)
+
+try:
+    from io import BytesIO
+except ImportError:
+    BytesIO = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FLAG_IMU_VALID = 0x01
+FLAG_MAGNETOMETER_VALID = 0x02
+FLAG_NAME = 0x04
+FLAG_FSK = 0x08
+
+STRUCT_V1_FORMAT = "<BBIIHH3h3h3h"
+STRUCT_V1_SIZE = struct.calcsize(STRUCT_V1_FORMAT)
+
+KEYFRAME_PREFIX_FORMAT = "<BB"
+KEYFRAME_BODY_FORMAT = "<BIIHH3h3h3h"
+KEYFRAME_SIZE = struct.calcsize(KEYFRAME_PREFIX_FORMAT) + struct.calcsize(
+    KEYFRAME_BODY_FORMAT
+)
+DELTA_HEADER_FORMAT = "<BBHB"
+DELTA_HEADER_SIZE = struct.calcsize(DELTA_HEADER_FORMAT)
+
+DELTA_FLAGS = 0x01
+DELTA_BOOT_COUNT = 0x02
+DELTA_ERROR_COUNT = 0x04
+DELTA_ACCELERATION = 0x08
+DELTA_ANGULAR_VELOCITY = 0x10
+DELTA_MAGNETIC_FIELD = 0x20
+DELTA_WIDE = 0x40
+
+# The frame number shares a byte with the keyframe id
+MAX_KEYFRAME_INTERVAL = 16
+
+ACCELERATION_SCALE = 100
+ANGULAR_VELOCITY_SCALE = 1000
+MAGNETIC_FIELD_SCALE = 10
+
+FIELDS = (
+    "flags",
+    "boot_time",
+    "uptime",
+    "boot_count",
+    "error_count",
+    "acceleration",
+    "angular_velocity",
+    "magnetic_field",
+    "name",
+)
+
+
+class BeaconDecodeError(ValueError):
+    """Raised when a payload is not a beacon this module understands."""
+
+
+def _fixed(value: float, scale: int) -> int:
+    """Convert to a saturating signed 16 bit fixed-point integer."""
+    scaled = int(round(value * scale))
+    if scaled > 32767:
+        return 32767
+    if scaled < -32768:
+        return -32768
+    return scaled
+
+
+def _u32(value: float) -> int:
+    value = int(value)
+    if value < 0:
+        return 0
+    return value & 0xFFFFFFFF
+
+
+def _u16(value: int) -> int:
+    if value < 0:
+        return 0
+    if value > 0xFFFF:
+        return 0xFFFF
+    return value
+
+
+def fits_struct(
+    flags: int,
+    boot_time: float,
+    uptime: float,
+    boot_count: int,
+    error_count: int,
+    acceleration: tuple,
+    angular_velocity: tuple,
+    magnetic_field: tuple,
+    name: bytes | None = None,
+) -> bool:
+    """Whether :func:`encode_struct` packs a beacon without clipping any
+    field, to within its fixed-point resolution."""
+    if not (0 <= boot_time <= 0xFFFFFFFF and 0 <= uptime <= 0xFFFFFFFF):
+        return False
+    if not (0 <= boot_count <= 0xFFFF and 0 <= error_count <= 0xFFFF):
+        return False
+    for vector, scale in (
+        (acceleration, ACCELERATION_SCALE),
+        (angular_velocity, ANGULAR_VELOCITY_SCALE),
+        (magnetic_field, MAGNETIC_FIELD_SCALE),
+    ):
+        for value in vector:
+            if not -32768 <= round(value * scale) <= 32767:
+                return False
+    return True
+
+
+def encode_struct(
+    buffer: bytearray,
+    flags: int,
+    boot_time: float,
+    uptime: float,
+    boot_count: int,
+    error_count: int,
+    acceleration: tuple,
+    angular_velocity: tuple,
+    magnetic_field: tuple,
+    name: bytes | None = None,
+) -> int:
+    """Pack a beacon into ``buffer`` and return the number of bytes used.
+
+    Packing into a caller owned buffer, such as a radio slab from the buffer
+    pool, keeps beacon encoding free of heap allocations apart from the
+    ``struct`` call itself.
+    """
+    if name:
+        flags |= FLAG_NAME
+    else:
+        flags &= ~FLAG_NAME
+
+    struct.pack_into(
+        STRUCT_V1_FORMAT,
+        buffer,
+        0,
+        SCHEMA_STRUCT_V1,
+        flags,
+        _u32(boot_time),
+        _u32(uptime),
+        _u16(boot_count),
+        _u16(error_count),
+        _fixed(acceleration[0], ACCELERATION_SCALE),
+        _fixed(acceleration[1], ACCELERATION_SCALE),
+        _fixed(acceleration[2], ACCELERATION_SCALE),
+        _fixed(angular_velocity[0], ANGULAR_VELOCITY_SCALE),
+        _fixed(angular_velocity[1], ANGULAR_VELOCITY_SCALE),
+        _fixed(angular_velocity[2], ANGULAR_VELOCITY_SCALE),
+        _fixed(magnetic_field[0], MAGNETIC_FIELD_SCALE),
+        _fixed(magnetic_field[1], MAGNETIC_FIELD_SCALE),
+        _fixed(magnetic_field[2], MAGNETIC_FIELD_SCALE),
+    )
+
+    length = STRUCT_V1_SIZE
+    if name:
+        name = name[:255]
+        buffer[length] = len(name)
+        buffer[length + 1 : length + 1 + len(name)] = name
+        length += 1 + len(name)
+
+    return length
+
+
+def encode_msgpack(
+    flags: int,
+    boot_time: float,
+    uptime: float,
+    boot_count: int,
+    error_count: int,
+    acceleration: tuple,
+    angular_velocity: tuple,
+    magnetic_field: tuple,
+    name: bytes | None = None,
+) -> bytes:
+    """Encode a beacon with full precision as msgpack.
+
+    Raises:
+        RuntimeError: If msgpack is not available.
+    """
+    if msgpack is None or BytesIO is None:
+        raise RuntimeError("msgpack is not available")
+
+    if name:
+        flags |= FLAG_NAME
+    else:
+        flags &= ~FLAG_NAME
+
+    stream = BytesIO()
+    stream.write(bytes((SCHEMA_MSGPACK_V1,)))
+    msgpack.pack(
+        [
+            flags,
+            int(boot_time),
+            int(uptime),
+            boot_count,
+            error_count,
+            list(acceleration),
+            list(angular_velocity),
+            list(magnetic_field),
+            name.decode("utf-8") if name else None,
+        ],
+        stream,
+    )
+    return stream.getvalue()
+
+
+def _read_name(payload: bytes, offset: int) -> str:
+    if len(payload) <= offset:
+        raise BeaconDecodeError("truncated beacon name")
+    length = payload[offset]
+    return bytes(payload[offset + 1 : offset + 1 + length]).decode("utf-8")
+
+
+def _struct_beacon(schema: int, values: tuple, name: str | None) -> dict:
+    """Build a decoded beacon from the fixed-point struct body values."""
+    return {
+        "schema": schema,
+        "flags": values[0],
+        "boot_time": values[1],
+        "uptime": values[2],
+        "boot_count": values[3],
+        "error_count": values[4],
+        "acceleration": tuple(v / ACCELERATION_SCALE for v in values[5:8]),
+        "angular_velocity": tuple(v / ANGULAR_VELOCITY_SCALE for v in values[8:11]),
+        "magnetic_field": tuple(v / MAGNETIC_FIELD_SCALE for v in values[11:14]),
+        "name": name,
+    }
+
+
+class DeltaBeaconEncoder:
+    """Encodes beacons as periodic keyframes and delta frames in between.
+
+    Args:
+        keyframe_interval: Frames per keyframe, including the keyframe.
+        acceleration_step: Quantisation step of acceleration deltas in LSBs.
+        angular_velocity_step: Quantisation step of angular velocity deltas in
+            LSBs.
+        magnetic_field_step: Quantisation step of magnetic field deltas in
+            LSBs.
+    """
+
+    def __init__(
+        self,
+        keyframe_interval: int = 10,
+        acceleration_step: int = 2,
+        angular_velocity_step: int = 2,
+        magnetic_field_step: int = 4,
+    ) -> None:
+        if not 1 <= keyframe_interval <= MAX_KEYFRAME_INTERVAL:
+            raise ValueError("keyframe_interval must be between 1 and 16")
+
+        self._interval: int = keyframe_interval
+        self._steps: tuple = (
+            acceleration_step,
+            angular_velocity_step,
+            magnetic_field_step,
+        )
+        self._key_id: int = 0
+        # Frames sent since the last keyframe, the keyframe included
+        self._frame: int = 0
+        self._force: bool = False
+        self._key: list | None = None
+        # Reused between frames so that delta encoding does not allocate
+        self._current: list = [0] * 14
+        self._deltas: list = [0] * 9
+
+    def force_keyframe(self) -> None:
+        """Make the next beacon a keyframe."""
+        self._force = True
+
+    def _fixed_fields(
+        self,
+        flags: int,
+        boot_time: float,
+        uptime: float,
+        boot_count: int,
+        error_count: int,
+        acceleration: tuple,
+        angular_velocity: tuple,
+        magnetic_field: tuple,
+    ) -> list:
+        current = self._current
+        current[0] = flags
+        current[1] = _u32(boot_time)
+        current[2] = _u32(uptime)
+        current[3] = _u16(boot_count)
+        current[4] = _u16(error_count)
+        for i in range(3):
+            current[5 + i] = _fixed(acceleration[i], ACCELERATION_SCALE)
+            current[8 + i] = _fixed(angular_velocity[i], ANGULAR_VELOCITY_SCALE)
+            current[11 + i] = _fixed(magnetic_field[i], MAGNETIC_FIELD_SCALE)
+        return current
+
+    def encode(
+        self,
+        buffer: bytearray,
+        flags: int,
+        boot_time: float,
+        uptime: float,
+        boot_count: int,
+        error_count: int,
+        acceleration: tuple,
+        angular_velocity: tuple,
+        magnetic_field: tuple,
+        name: bytes | None = None,
+    ) -> int:
+        """Pack the next keyframe or delta frame into ``buffer``.
+
+        Passing a name always produces a keyframe, because delta frames cannot
+        carry one.
+
+        Returns:
+            The number of bytes used.
+        """
+        if name:
+            flags |= FLAG_NAME
+        else:
+            flags &= ~FLAG_NAME
+
+        current = self._fixed_fields(
+            flags,
+            boot_time,
+            uptime,
+            boot_count,
+            error_count,
+            acceleration,
+            angular_velocity,
+            magnetic_field,
+        )
+        key = self._key
+
+        if (
+            key is None
+            or name
+            or self._force
+            or self._frame >= self._interval
+            or current[1] != key[1]
+            or not 0 <= current[2] - key[2] <= 0xFFFF
+        ):
+            return self._encode_keyframe(buffer, current, name)
+
+        mask = 0
+        if current[0] != key[0] & ~FLAG_NAME:
+            mask |= DELTA_FLAGS
+        if current[3] != key[3]:
+            mask |= DELTA_BOOT_COUNT
+        if current[4] != key[4]:
+            mask |= DELTA_ERROR_COUNT
+
+        deltas = self._deltas
+        for vector in range(3):
+            step = self._steps[vector]
+            changed = False
+            for axis in range(3):
+                index = 5 + 3 * vector + axis
+                # Round half away from zero so that small drifts still register
+                difference = current[index] - key[index]
+                if difference >= 0:
+                    delta = (difference + step // 2) // step
+                else:
+                    delta = -((-difference + step // 2) // step)
+                deltas[3 * vector + axis] = delta
+                if delta:
+                    changed = True
+                if not -128 <= delta <= 127:
+                    mask |= DELTA_WIDE
+            if changed:
+                mask |= DELTA_ACCELERATION << vector
+
+        struct.pack_into(
+            DELTA_HEADER_FORMAT,
+            buffer,
+            0,
+            SCHEMA_DELTA_V1,
+            (self._key_id << 4) | self._frame,
+            current[2] - key[2],
+            mask,
+        )
+        length = DELTA_HEADER_SIZE
+
+        if mask & DELTA_FLAGS:
+            buffer[length] = current[0]
+            length += 1
+        if mask & DELTA_BOOT_COUNT:
+            struct.pack_into("<H", buffer, length, current[3])
+            length += 2
+        if mask & DELTA_ERROR_COUNT:
+            struct.pack_into("<H", buffer, length, current[4])
+            length += 2
+
+        for vector in range(3):
+            if not mask & (DELTA_ACCELERATION << vector):
+                continue
+            base = 3 * vector
+            if mask & DELTA_WIDE:
+                struct.pack_into(
+                    "<3h",
+                    buffer,
+                    length,
+                    current[5 + base],
+                    current[6 + base],
+                    current[7 + base],
+                )
+                length += 6
+            else:
+                struct.pack_into(
+                    "<3b",
+                    buffer,
+                    length,
+                    deltas[base],
+                    deltas[base + 1],
+                    deltas[base + 2],
+                )
+                length += 3
+
+        self._frame += 1
+        return length
+
+    def _encode_keyframe(
+        self, buffer: bytearray, current: list, name: bytes | None
+    ) -> int:
+        previous = 0
+        if self._key is not None:
+            self._key_id = (self._key_id + 1) & 0x0F
+            previous = self._frame - 1
+        self._frame = 1
+        self._force = False
+
+        if self._key is None:
+            self._key = [0] * len(current)
+        key = self._key
+        for i in range(len(current)):
+            key[i] = current[i]
+
+        struct.pack_into(
+            KEYFRAME_PREFIX_FORMAT,
+            buffer,
+            0,
+            SCHEMA_KEYFRAME_V1,
+            (self._key_id << 4) | previous,
+        )
+        struct.pack_into(KEYFRAME_BODY_FORMAT, buffer, 2, *current)
+
+        length = KEYFRAME_SIZE
+        if name:
+            name = name[:255]
+            buffer[length] = len(name)
+            buffer[length + 1 : length + 1 + len(name)] = name
+            length += 1 + len(name)
+
+        return length
+
+
+class DeltaBeaconDecoder:
+    """Rebuilds full beacons from keyframes and delta frames.
+
+    Decoded beacons carry two extra keys: ``keyframe_missing`` is True when a
+    delta frame refers to a keyframe that was never received, in which case
+    only the schema, that flag and ``frames_lost`` are returned, and
+    ``frames_lost`` counts frames skipped since the previous beacon.
+
+    Args:
+        keyframe_interval: Must match the encoder. Used to count the frames of
+            keyframes that were lost along with all their delta frames.
+        acceleration_step: Must match the encoder.
+        angular_velocity_step: Must match the encoder.
+        magnetic_field_step: Must match the encoder.
+    """
+
+    def __init__(
+        self,
+        keyframe_interval: int = 10,
+        acceleration_step: int = 2,
+        angular_velocity_step: int = 2,
+        magnetic_field_step: int = 4,
+    ) -> None:
+        self._interval: int = keyframe_interval
+        self._steps: tuple = (
+            acceleration_step,
+            angular_velocity_step,
+            magnetic_field_step,
+        )
+        self._key_id: int | None = None
+        self._key: tuple | None = None
+        self._name: str | None = None
+        # (keyframe id, frame number) of the last keyframe or delta frame
+        self._last: tuple | None = None
+
+        self.keyframes: int = 0
+        self.deltas: int = 0
+        self.keyframes_missing: int = 0
+
+    def _lost(self, key_id: int, frame: int, previous: int | None = None) -> int:
+        """Frames skipped between the previous beacon and this one.
+
+        Args:
+            key_id: Keyframe id of this beacon.
+            frame: Its frame number, 0 for a keyframe.
+            previous: Frames the keyframe before this one had, when this is
+                a keyframe.
+        """
+        last = self._last
+        self._last = (key_id, frame)
+        if last is None:
+            return 0
+        last_key, last_frame = last
+        if key_id == last_key:
+            return max(0, frame - last_frame - 1)
+
+        # Whole keyframes lost in between, taken to be keyframe_interval long
+        skipped = (key_id - last_key - 1) & 0x0F
+        if skipped or previous is None:
+            previous = self._interval
+        return max(0, previous - last_frame - 1) + skipped * self._interval + frame
+
+    def decode(self, payload: bytes) -> dict:
+        """Decode any beacon schema, tracking keyframe state.
+
+        Raises:
+            BeaconDecodeError: If the payload is not a supported beacon.
+        """
+        if not payload:
+            raise BeaconDecodeError("empty payload")
+
+        schema = payload[0]
+
+        if schema == SCHEMA_KEYFRAME_V1:
+            if len(payload) < KEYFRAME_SIZE:
+                raise BeaconDecodeError("truncated keyframe")
+            key_id = payload[1] >> 4
+            values = struct.unpack_from(KEYFRAME_BODY_FORMAT, payload, 2)
+            name = None
+            if values[0] & FLAG_NAME:
+                name = _read_name(payload, KEYFRAME_SIZE)
+                self._name = name
+
+            lost = self._lost(key_id, 0, (payload[1] & 0x0F) + 1)
+            self._key_id = key_id
+            self._key = values
+            self.keyframes += 1
+
+            beacon = _struct_beacon(schema, values, name or self._name)
+            beacon["keyframe_missing"] = False
+            beacon["frames_lost"] = lost
+            return beacon
+
+        if schema == SCHEMA_DELTA_V1:
+            if len(payload) < DELTA_HEADER_SIZE:
+                raise BeaconDecodeError("truncated delta beacon")
+            _, key_byte, uptime, mask = struct.unpack_from(
+                DELTA_HEADER_FORMAT, payload, 0
+            )
+            key_id, frame = key_byte >> 4, key_byte & 0x0F
+
+            key = self._key
+            if key is None or key_id != self._key_id:
+                self.keyframes_missing += 1
+                return {
+                    "schema": schema,
+                    "keyframe_missing": True,
+                    "frames_lost": self._lost(key_id, frame),
+                }
+
+            values = list(key)
+            # Delta frames leave the name out of the flags, see the encoder
+            values[0] = key[0] & ~FLAG_NAME
+            values[2] = key[2] + uptime
+            offset = DELTA_HEADER_SIZE
+            try:
+                if mask & DELTA_FLAGS:
+                    values[0] = payload[offset]
+                    offset += 1
+                if mask & DELTA_BOOT_COUNT:
+                    values[3] = struct.unpack_from("<H", payload, offset)[0]
+                    offset += 2
+                if mask & DELTA_ERROR_COUNT:
+                    values[4] = struct.unpack_from("<H", payload, offset)[0]
+                    offset += 2
+                for vector in range(3):
+                    if not mask & (DELTA_ACCELERATION << vector):
+                        continue
+                    base = 5 + 3 * vector
+                    if mask & DELTA_WIDE:
+                        absolute = struct.unpack_from("<3h", payload, offset)
+                        for axis in range(3):
+                            values[base + axis] = absolute[axis]
+                        offset += 6
+                    else:
+                        step = self._steps[vector]
+                        deltas = struct.unpack_from("<3b", payload, offset)
+                        for axis in range(3):
+                            values[base + axis] = key[base + axis] + deltas[axis] * step
+                        offset += 3
+            except Exception as e:
+                raise BeaconDecodeError("truncated delta beacon") from e
+
+            lost = self._lost(key_id, frame)
+            self.deltas += 1
+
+            beacon = _struct_beacon(schema, values, self._name)
+            beacon["keyframe_missing"] = False
+            beacon["frames_lost"] = lost
+            return beacon
+
+        return decode(payload)
+
+
+def decode(payload: bytes) -> dict:
+    """Decode a stateless beacon of any supported schema into a dict of FIELDS.
+
+    Delta frames need the keyframe they refer to, use
+    :class:`DeltaBeaconDecoder` for those.
+
+    Raises:
+        BeaconDecodeError: If the payload is not a supported beacon.
+    """
+    if not payload:
+        raise BeaconDecodeError("empty payload")
+
+    schema = payload[0]
+
+    if schema == SCHEMA_STRUCT_V1:
+        if len(payload) < STRUCT_V1_SIZE:
+            raise BeaconDecodeError("truncated beacon")
+        values = struct.unpack_from(STRUCT_V1_FORMAT, payload, 0)
+        name = None
+        if values[1] & FLAG_NAME:
+            name = _read_name(payload, STRUCT_V1_SIZE)
+        return _struct_beacon(schema, values[1:], name)
+
+    if schema in (SCHEMA_KEYFRAME_V1, SCHEMA_DELTA_V1):
+        raise BeaconDecodeError("delta beacons need a DeltaBeaconDecoder")
+
+    if schema == SCHEMA_MSGPACK_V1:
+        if msgpack is None or BytesIO is None:
+            raise BeaconDecodeError("msgpack is not available")
+        try:
+            values = msgpack.unpack(BytesIO(bytes(payload[1:])))
+        except Exception as e:
+            raise BeaconDecodeError("invalid msgpack beacon") from e
+        if len(values) != len(FIELDS):
+            raise BeaconDecodeError("unexpected msgpack beacon length")
+
+        beacon = {"schema": schema}
+        for field, value in zip(FIELDS, values):
+            if isinstance(value, list):
+                value = tuple(value)
+            beacon[field] = value
+        return beacon
+
+    raise BeaconDecodeError("unknown beacon schema")
@@ -0,0 +1,149 @@
+"""Preallocated buffer pools for the flight software hot paths.
+
+Every buffer handed out by a pool is allocated once, when the pool is created,
+so code that checks buffers out and returns them in a loop runs without any
+steady-state heap allocation. This keeps the RP2040 heap from fragmenting over
+long uptimes.
+
+Usage:
+    pools = BufferPools()
+    buf = pools.radio.checkout()
+    try:
+        ...
+    finally:
+        pools.radio.release(buf)
+"""
+
+
+class PoolExhaustedError(Exception):
+    """Raised when a pool has no free slabs left."""
+
+
+class BufferPool:
+    """A fixed number of fixed-size ``bytearray`` slabs.
+
+    Args:
+        name: Name used in statistics and error messages.
+        slab_size: Size of each slab in bytes.
+        count: Number of slabs to preallocate.
+    """
+
+    def __init__(self, name: str, slab_size: int, count: int) -> None:
+        if slab_size <= 0 or count <= 0:
+            raise ValueError("slab_size and count must be positive")
+
+        self.name: str = name
+        self.slab_size: int = slab_size
+        self.count: int = count
+
+        self._slabs: list[bytearray] = [bytearray(slab_size) for _ in range(count)]
+        self._views: list[memoryview] = [memoryview(slab) for slab in self._slabs]
+        # Free slab indices are used as a stack. The list never grows past
+        # ``count`` so pushes and pops reuse its existing storage.
+        self._free: list[int] = list(range(count - 1, -1, -1))
+        self._in_use: list[bool] = [False] * count
+
+        self.checkouts: int = 0
+        self.releases: int = 0
+        self.exhausted: int = 0
+        self.high_water: int = 0
+
+    def checkout(self) -> bytearray:
+        """Take a slab out of the pool.
+
+        The contents of the returned slab are whatever the previous user left
+        in it.
+
+        Raises:
+            PoolExhaustedError: If every slab is already checked out.
+        """
+        if not self._free:
+            self.exhausted += 1
+            raise PoolExhaustedError(self.name)
+
+        index = self._free.pop()
+        self._in_use[index] = True
+        self.checkouts += 1
+
+        in_use = self.count - len(self._free)
+        if in_use > self.high_water:
+            self.high_water = in_use
+
+        return self._slabs[index]
+
+    def try_checkout(self) -> bytearray | None:
+        """Take a slab out of the pool, or return None if none are free."""
+        if not self._free:
+            self.exhausted += 1
+            return None
+        return self.checkout()
+
+    def release(self, slab: bytearray) -> None:
+        """Return a slab to the pool.
+
+        Raises:
+            ValueError: If the slab does not belong to this pool or has
+                already been released.
+        """
+        for index in range(self.count):
+            if self._slabs[index] is slab:
+                if not self._in_use[index]:
+                    raise ValueError("slab released twice")
+                self._in_use[index] = False
+                self._free.append(index)
+                self.releases += 1
+                return
+
+        raise ValueError("slab does not belong to pool " + self.name)
+
+    def view(self, slab: bytearray, length: int) -> memoryview:
+        """Return a zero-copy view of the first ``length`` bytes of a slab."""
+        for index in range(self.count):
+            if self._slabs[index] is slab:
+                return self._views[index][:length]
+
+        raise ValueError("slab does not belong to pool " + self.name)
+
+    @property
+    def available(self) -> int:
+        """Number of slabs that can currently be checked out."""
+        return len(self._free)
+
+    @property
+    def in_use(self) -> int:
+        """Number of slabs currently checked out."""
+        return self.count - len(self._free)
+
+    def stats(self) -> dict:
+        """Usage statistics for logging or telemetry."""
+        return {
+            "slab_size": self.slab_size,
+            "count": self.count,
+            "in_use": self.in_use,
+            "high_water": self.high_water,
+            "checkouts": self.checkouts,
+            "releases": self.releases,
+            "exhausted": self.exhausted,
+        }
+
+
+class BufferPools:
+    """The shared set of pools allocated once at boot.
+
+    Only the radio has a pool: a pool nothing checks out of is RAM taken for
+    good. Add one here along with the code that uses it.
+
+    Args:
+        radio_slabs: Number of radio packet slabs.
+    """
+
+    RADIO_SLAB_SIZE = 256
+
+    def __init__(self, radio_slabs: int = 4) -> None:
+        self.radio: BufferPool = BufferPool("radio", self.RADIO_SLAB_SIZE, radio_slabs)
+
+    def stats(self) -> dict:
+        """Usage statistics for every pool, keyed by pool name."""
+        return {
+            self.radio.name: self.radio.stats(),
+        }
@@ -0,0 +1,424 @@
+"""Selective-repeat ARQ for bulk transfers such as logs, images and telemetry.
+
+The ``PacketManager`` waits for each packet to be acknowledged before sending
+the next, so a multi-packet transfer moves one packet per round trip. Here the
+sender keeps up to ``window`` packets in flight, sent back to back. The last
+packet of each burst carries ``FLAG_POLL``, and the receiver answers a poll
+with one acknowledgement: a cumulative count of packets received in order plus
+a bitmap of the packets received beyond it. LoRa is half duplex, so the
+receiver only ever transmits when the sender has asked it to.
+
+Every packet in flight has its own retransmit deadline. A packet is resent
+when its deadline passes, or straight away when an acknowledgement for a later
+packet of the same burst shows it was lost. The timeout follows the measured
+round trip time (RFC 6298, ignoring retransmitted packets as in Karn's
+algorithm) and backs off exponentially per packet.
+
+Packets go straight to the radio manager, or ``FECRadio``, rather than through
+the ``PacketManager``, so neither end should use its packet manager while a
+transfer is running.
+
+Packets:
+    DATA: ``DATA_FORMAT`` header, then the segment.
+        type, transfer id, sequence number, total packets, flags
+    ACK: ``ACK_FORMAT``.
+        type, transfer id, packets received in order, bitmap of the packets
+        after that (bit ``i`` is packet ``cumulative + 1 + i``), sequence
+        number of the poll being answered
+"""
+
+import binascii
+import struct
+import time
+
+from .markers import TYPE_ACK, TYPE_DATA
+
+DATA_FORMAT = "<BBHHB"
+DATA_HEADER_LENGTH = struct.calcsize(DATA_FORMAT)
+ACK_FORMAT = "<BBHIH"
+ACK_LENGTH = struct.calcsize(ACK_FORMAT)
+
+FLAG_POLL = 0x01
+
+# Bytes read at a time by file_crc
+_CRC_BLOCK = 512
+
+# One bit per packet after the cumulative ack, so no more can be in flight
+MAX_WINDOW = 33
+DEFAULT_WINDOW = 8
+
+
+def file_crc(path: str) -> int:
+    """CRC-32 of a file, read a block at a time, as an upload checks it."""
+    crc = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(_CRC_BLOCK)
+            if not block:
+                return crc
+            crc = binascii.crc32(block, crc)
+
+
+class TransferError(Exception):
+    """Raised when a packet is not acknowledged after every retry."""
+
+
+class FileSegments:
+    """A file read one segment at a time, so it never has to fit in RAM.
+
+    Args:
+        path: File to send.
+        segment_size: Bytes per packet.
+    """
+
+    def __init__(self, path: str, segment_size: int) -> None:
+        self._file = open(path, "rb")
+        self._file.seek(0, 2)
+        self.size: int = self._file.tell()
+        self.segment_size: int = segment_size
+
+    def __len__(self) -> int:
+        return (self.size + self.segment_size - 1) // self.segment_size
+
+    def __getitem__(self, index: int) -> bytes:
+        self._file.seek(index * self.segment_size)
+        return self._file.read(self.segment_size)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class BytesSegments:
+    """Bytes in memory split into segments.
+
+    Args:
+        data: Bytes to send.
+        segment_size: Bytes per packet.
+    """
+
+    def __init__(self, data: bytes, segment_size: int) -> None:
+        self._data = memoryview(data)
+        self.size: int = len(data)
+        self.segment_size: int = segment_size
+
+    def __len__(self) -> int:
+        return (self.size + self.segment_size - 1) // self.segment_size
+
+    def __getitem__(self, index: int) -> bytes:
+        start = index * self.segment_size
+        return bytes(self._data[start : start + self.segment_size])
+
+    def close(self) -> None:
+        pass
+
+
+class TransferStats:
+    """Counters for one transfer."""
+
+    def __init__(self) -> None:
+        self.packets_sent: int = 0
+        self.retransmissions: int = 0
+        self.acks: int = 0
+        self.rtt_samples: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "packets_sent": self.packets_sent,
+            "retransmissions": self.retransmissions,
+            "acks": self.acks,
+            "rtt_samples": self.rtt_samples,
+        }
+
+
+class SelectiveRepeatSender:
+    """Sending side of a transfer, as a state machine driven by the caller.
+
+    Call :meth:`packets_due`, send what it returns and then call
+    :meth:`burst_sent`. Pass acknowledgements to :meth:`on_ack`, and wait no
+    longer than :meth:`next_deadline` in between. :meth:`run` does all of that
+    over a radio.
+
+    Args:
+        segments: Sequence of payloads, see :class:`FileSegments`.
+        transfer_id: Identifies this transfer, 0 to 255.
+        window: Packets in flight at most, 1 to ``MAX_WINDOW``.
+        initial_timeout: Retransmit timeout in seconds until the round trip
+            time has been measured.
+        min_timeout: Lower bound on the retransmit timeout.
+        max_timeout: Upper bound on the retransmit timeout, backoff included.
+        max_retries: Retransmissions of one packet before giving up.
+        start: First segment to send, when the receiver already has the ones
+            before it from an earlier, interrupted transfer.
+    """
+
+    def __init__(
+        self,
+        segments,
+        transfer_id: int,
+        window: int = DEFAULT_WINDOW,
+        initial_timeout: float = 3.0,
+        min_timeout: float = 0.5,
+        max_timeout: float = 30.0,
+        max_retries: int = 8,
+        start: int = 0,
+    ) -> None:
+        if not 1 <= window <= MAX_WINDOW:
+            raise ValueError("window must be between 1 and 33")
+        if len(segments) > 0xFFFF:
+            raise ValueError("too many segments")
+
+        self._segments = segments
+        self.transfer_id: int = transfer_id & 0xFF
+        self.total: int = len(segments)
+        self.window: int = window
+        self.min_timeout: float = min_timeout
+        self.max_timeout: float = max_timeout
+        self.max_retries: int = max_retries
+
+        self.base: int = start
+        self._next: int = start
+        self._acked: set = set()
+        self._last_sent: dict = {}
+        self._deadline: dict = {}
+        self._retries: dict = {}
+        # Send time of packets sent exactly once, the only valid RTT samples
+        self._first_sent: dict = {}
+        self._burst: list = []
+        self._burst_new: list = []
+
+        self.srtt: float | None = None
+        self.rttvar: float = 0.0
+        self.timeout: float = initial_timeout
+        self.stats: TransferStats = TransferStats()
+
+    @property
+    def done(self) -> bool:
+        return self.base >= self.total
+
+    def next_deadline(self) -> float | None:
+        """Earliest retransmit deadline, or None if nothing is in flight."""
+        return min(self._deadline.values()) if self._deadline else None
+
+    def _packet(self, seq: int, poll: bool) -> bytes:
+        return (
+            struct.pack(
+                DATA_FORMAT,
+                TYPE_DATA,
+                self.transfer_id,
+                seq,
+                self.total,
+                FLAG_POLL if poll else 0,
+            )
+            + self._segments[seq]
+        )
+
+    def packets_due(self, now: float) -> list:
+        """Packets to send now: expired ones first, then new ones.
+
+        Call :meth:`burst_sent` once they are all on air.
+
+        Raises:
+            TransferError: If a packet has used up its retries.
+        """
+        seqs = sorted(s for s, d in self._deadline.items() if d <= now)
+        for seq in seqs:
+            retries = self._retries.get(seq, 0) + 1
+            if retries > self.max_retries:
+                raise TransferError(f"packet {seq} not acknowledged")
+            self._retries[seq] = retries
+            self._first_sent.pop(seq, None)
+            # Not due again until the burst is on air
+            del self._deadline[seq]
+            self.stats.retransmissions += 1
+
+        first = len(seqs)
+        while self._next < self.total and self._next < self.base + self.window:
+            seqs.append(self._next)
+            self._next += 1
+
+        self._burst = seqs
+        self._burst_new = seqs[first:]
+        self.stats.packets_sent += len(seqs)
+        return [self._packet(seq, i == len(seqs) - 1) for i, seq in enumerate(seqs)]
+
+    def burst_sent(self, now: float) -> None:
+        """Start the retransmit timers of the packets just sent.
+
+        Timers start once the whole burst is on air, since the receiver only
+        answers the poll at its end.
+        """
+        for seq in self._burst_new:
+            self._first_sent[seq] = now
+        for seq in self._burst:
+            self._last_sent[seq] = now
+            backoff = self.timeout * (1 << self._retries.get(seq, 0))
+            self._deadline[seq] = now + min(backoff, self.max_timeout)
+        self._burst = []
+        self._burst_new = []
+
+    def _update_timeout(self, sample: float) -> None:
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+        self.stats.rtt_samples += 1
+        self.timeout = max(
+            self.min_timeout, min(self.max_timeout, self.srtt + 4 * self.rttvar)
+        )
+
+    def _mark_acked(self, seq: int) -> None:
+        self._acked.add(seq)
+        self._deadline.pop(seq, None)
+        self._first_sent.pop(seq, None)
+        self._last_sent.pop(seq, None)
+        self._retries.pop(seq, None)
+
+    def on_ack(self, packet: bytes, now: float) -> None:
+        """Handle an acknowledgement. Anything else is ignored."""
+        if len(packet) != ACK_LENGTH or packet[0] != TYPE_ACK:
+            return
+        _, transfer_id, cumulative, bitmap, echo = struct.unpack(ACK_FORMAT, packet)
+        if transfer_id != self.transfer_id:
+            return
+        self.stats.acks += 1
+
+        first_sent = self._first_sent.get(echo)
+        if first_sent is not None:
+            self._update_timeout(now - first_sent)
+        polled_at = self._last_sent.get(echo)
+
+        for seq in range(self.base, min(cumulative, self._next)):
+            if seq not in self._acked:
+                self._mark_acked(seq)
+        for i in range(32):
+            seq = cumulative + 1 + i
+            if seq >= self._next:
+                break
+            if bitmap & (1 << i) and seq not in self._acked:
+                self._mark_acked(seq)
+
+        # The poll came last in its burst, so anything sent with or before it
+        # that is still unacknowledged was lost
+        if polled_at is not None:
+            for seq, sent in self._last_sent.items():
+                if sent <= polled_at and seq != echo:
+                    self._deadline[seq] = now
+
+        while self.base in self._acked:
+            self._acked.remove(self.base)
+            self.base += 1
+
+    def run(self, link, watchdog=None, between_bursts=None) -> None:
+        """Run the whole transfer over a radio, blocking until it is done.
+
+        Args:
+            link: Anything with ``send(bytes)`` and ``receive(timeout)``.
+            watchdog: Petted on every iteration, if given.
+            between_bursts: Called before each burst, if given, so that more
+                urgent traffic can go out during a long transfer.
+
+        Raises:
+            TransferError: If a packet is not acknowledged.
+        """
+        while not self.done:
+            if watchdog is not None:
+                watchdog.pet()
+
+            if between_bursts is not None:
+                between_bursts()
+
+            for packet in self.packets_due(time.monotonic()):
+                link.send(packet)
+            self.burst_sent(time.monotonic())
+
+            deadline = self.next_deadline()
+            wait = self.timeout if deadline is None else deadline - time.monotonic()
+            ack = link.receive(timeout=max(wait, 0.01))
+            if ack is not None:
+                self.on_ack(ack, time.monotonic())
+
+
+class SelectiveRepeatReceiver:
+    """Receiving side of a transfer.
+
+    Packets are buffered until they can be delivered in order, so at most
+    ``MAX_WINDOW`` segments are held in RAM.
+
+    Args:
+        deliver: Called with each segment, in order.
+        transfer_id: Only accept this transfer, or the first one seen if None.
+    """
+
+    def __init__(self, deliver, transfer_id: int | None = None) -> None:
+        self._deliver = deliver
+        self.transfer_id: int | None = transfer_id
+        self.total: int | None = None
+        self.cumulative: int = 0
+        self._buffered: dict = {}
+        self.duplicates: int = 0
+
+    @property
+    def done(self) -> bool:
+        return self.total is not None and self.cumulative >= self.total
+
+    def _ack(self, echo: int) -> bytes:
+        bitmap = 0
+        for seq in self._buffered:
+            bitmap |= 1 << (seq - self.cumulative - 1)
+        return struct.pack(
+            ACK_FORMAT, TYPE_ACK, self.transfer_id, self.cumulative, bitmap, echo
+        )
+
+    def on_packet(self, packet: bytes) -> bytes | None:
+        """Handle a data packet.
+
+        Returns:
+            The acknowledgement to send back, if the packet asked for one.
+        """
+        if len(packet) < DATA_HEADER_LENGTH or packet[0] != TYPE_DATA:
+            return None
+        _, transfer_id, seq, total, flags = struct.unpack(
+            DATA_FORMAT, packet[:DATA_HEADER_LENGTH]
+        )
+        if self.transfer_id is None:
+            self.transfer_id = transfer_id
+        if transfer_id != self.transfer_id:
+            return None
+        self.total = total
+
+        if seq < self.cumulative or seq in self._buffered:
+            self.duplicates += 1
+        elif seq < self.cumulative + MAX_WINDOW:
+            self._buffered[seq] = packet[DATA_HEADER_LENGTH:]
+            while self.cumulative in self._buffered:
+                self._deliver(self._buffered.pop(self.cumulative))
+                self.cumulative += 1
+
+        return self._ack(seq) if flags & FLAG_POLL else None
+
+    def run(self, link, idle_timeout: float = 30.0, linger: float = 5.0) -> bool:
+        """Receive a whole transfer over a radio.
+
+        After the last packet, keeps answering polls for ``linger`` seconds
+        in case the final acknowledgement was lost.
+
+        Args:
+            link: Anything with ``send(bytes)`` and ``receive(timeout)``.
+            idle_timeout: Give up after this many seconds without a packet.
+            linger: Seconds to keep listening once the transfer is complete.
+
+        Returns:
+            Whether the transfer completed.
+        """
+        last_heard = time.monotonic()
+        while time.monotonic() - last_heard < (linger if self.done else idle_timeout):
+            packet = link.receive(timeout=1)
+            if packet is None:
+                continue
+            last_heard = time.monotonic()
+            ack = self.on_packet(packet)
+            if ack is not None:
+                link.send(ack)
+        return self.done
@@ -0,0 +1,293 @@
+"""Duty-cycled listening with LoRa channel activity detection (CAD).
+
+A receiver in full RX mode draws its receive current for the whole of
+``listen_for_commands``, whether or not a ground station is in view.
+:class:`CadListener` keeps the radio asleep instead and wakes it every
+``probe_interval`` seconds for a CAD, which looks for a LoRa preamble for
+about two symbols. Only when it finds one does the radio go to full RX to
+receive the packet.
+
+A CAD only finds a preamble that is on the air while it runs, so the ground
+station wakes the satellite with a preamble longer than the probe interval,
+see :class:`WakePreamble` and :func:`wake_preamble_length`. Once the
+satellite has heard a packet it stays in full RX for ``linger`` seconds, and
+for ``reply_window`` seconds after it sends one, so the ground station can
+answer a beacon. The ground station sends normal preambles only while it
+knows the satellite to be awake: just after hearing it, and after hearing it
+answer something the ground station sent. A packet the satellite missed
+therefore never leaves the ground station sending short preambles.
+
+Registers are those of the SX127x datasheet, accessed through the
+``adafruit_rfm9x`` driver.
+"""
+
+import time
+
+from .airtime import DEFAULT_BANDWIDTH, DEFAULT_PREAMBLE_LENGTH, symbol_time
+
+_REG_IRQ_FLAGS = 0x12
+
+_SLEEP_MODE = 0b000
+_CAD_MODE = 0b111
+
+_IRQ_CAD_DONE = 0x04
+_IRQ_CAD_DETECTED = 0x01
+
+# A CAD that has not finished after this long is abandoned
+_CAD_TIMEOUT = 0.05
+
+# How long a full RX window after a detection waits for the packet, on top of
+# what is left of the wake preamble
+RX_WINDOW = 1.0
+
+
+def cad_time(spreading_factor: int, bandwidth: int = DEFAULT_BANDWIDTH) -> float:
+    """Seconds one CAD takes, from the SX127x datasheet."""
+    return ((1 << spreading_factor) + 32) / bandwidth
+
+
+def max_probe_interval(
+    preamble_length: int,
+    spreading_factor: int,
+    bandwidth: int = DEFAULT_BANDWIDTH,
+) -> float:
+    """Longest probe interval at which a preamble of ``preamble_length``
+    symbols always overlaps a whole CAD."""
+    preamble = (preamble_length + 4.25) * symbol_time(spreading_factor, bandwidth)
+    return preamble - 2 * cad_time(spreading_factor, bandwidth)
+
+
+def wake_preamble_length(
+    probe_interval: float,
+    spreading_factor: int,
+    bandwidth: int = DEFAULT_BANDWIDTH,
+) -> int:
+    """Shortest preamble, in symbols, that a receiver probing every
+    ``probe_interval`` seconds cannot miss."""
+    t_sym = symbol_time(spreading_factor, bandwidth)
+    needed = probe_interval + 2 * cad_time(spreading_factor, bandwidth)
+    return max(DEFAULT_PREAMBLE_LENGTH, int(needed / t_sym - 4.25) + 1)
+
+
+class CadStats:
+    """Counters for :class:`CadListener`."""
+
+    def __init__(self) -> None:
+        self.probes: int = 0
+        self.detections: int = 0
+        self.false_detections: int = 0
+        self.packets: int = 0
+        self.rx_time: float = 0.0
+        self.cad_time: float = 0.0
+        self.listen_time: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "probes": self.probes,
+            "detections": self.detections,
+            "false_detections": self.false_detections,
+            "packets": self.packets,
+            "on_time": (
+                (self.rx_time + self.cad_time) / self.listen_time
+                if self.listen_time
+                else 0.0
+            ),
+        }
+
+
+class CadListener:
+    """Wraps a radio manager so ``receive`` probes with CAD instead of
+    listening continuously.
+
+    Anything other than ``send`` and ``receive`` is passed through to the
+    wrapped radio.
+
+    Args:
+        logger: Logger instance.
+        radio: The radio, or ``Dio0Receiver``, full RX is delegated to.
+        driver: The ``adafruit_rfm9x.RFM9x`` instance inside the radio.
+        probe_interval: Seconds between CAD probes. Must not exceed
+            :func:`max_probe_interval` of the ground station's wake preamble.
+        linger: Seconds to stay in full RX after receiving a packet.
+        reply_window: Seconds to stay in full RX after sending a packet.
+        idle: Called between probes, for work such as petting the watchdog.
+    """
+
+    def __init__(
+        self,
+        logger,
+        radio,
+        driver,
+        probe_interval: float = 1.0,
+        linger: float = 10.0,
+        reply_window: float = 2.0,
+        idle=None,
+    ) -> None:
+        self._log = logger
+        self._radio = radio
+        self._driver = driver
+        self.probe_interval: float = probe_interval
+        self.linger: float = linger
+        self.reply_window: float = reply_window
+        self._idle = idle
+        # Time until which the radio stays in full RX
+        self._awake_until: float = 0.0
+        self.stats: CadStats = CadStats()
+
+    def __getattr__(self, name: str):
+        return getattr(self._radio, name)
+
+    def awake(self) -> bool:
+        """Whether the radio is lingering in full RX after recent activity."""
+        return time.monotonic() < self._awake_until
+
+    def _stay_awake(self, seconds: float) -> None:
+        self._awake_until = max(self._awake_until, time.monotonic() + seconds)
+
+    def _probe(self) -> bool:
+        """Run one CAD. Returns whether a preamble was detected."""
+        driver = self._driver
+        driver._write_u8(_REG_IRQ_FLAGS, 0xFF)
+        driver.operation_mode = _CAD_MODE
+        start = time.monotonic()
+        flags = 0
+        while not flags & _IRQ_CAD_DONE:
+            if time.monotonic() - start > _CAD_TIMEOUT:
+                break
+            flags = driver._read_u8(_REG_IRQ_FLAGS)
+        driver._write_u8(_REG_IRQ_FLAGS, 0xFF)
+        driver.operation_mode = _SLEEP_MODE
+        self.stats.probes += 1
+        self.stats.cad_time += time.monotonic() - start
+        return bool(flags & _IRQ_CAD_DETECTED)
+
+    def _receive_full(self, timeout: float) -> bytes | None:
+        start = time.monotonic()
+        packet = self._radio.receive(timeout=timeout)
+        self.stats.rx_time += time.monotonic() - start
+        if packet is not None:
+            self.stats.packets += 1
+            self._stay_awake(self.linger)
+        return packet
+
+    def send(self, data) -> bool:
+        sent = self._radio.send(data)
+        self._stay_awake(self.reply_window)
+        return sent
+
+    def receive(self, timeout: float | None = None) -> bytes | None:
+        """Wait up to ``timeout`` seconds for a packet.
+
+        While lingering after recent activity this is a plain receive, and
+        without a timeout it is the wrapped radio's ``receive``.
+        """
+        if timeout is None:
+            return self._radio.receive()
+
+        start = time.monotonic()
+        deadline = start + timeout
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    return None
+
+                if self.awake():
+                    packet = self._receive_full(min(deadline, self._awake_until) - now)
+                    if packet is not None:
+                        return packet
+                    continue
+
+                if self._probe():
+                    self.stats.detections += 1
+                    window = RX_WINDOW + self.probe_interval
+                    packet = self._receive_full(min(window, deadline - now))
+                    if packet is not None:
+                        return packet
+                    self.stats.false_detections += 1
+                    continue
+
+                if self._idle is not None:
+                    self._idle()
+                time.sleep(
+                    max(
+                        0.0,
+                        min(
+                            self.probe_interval - (time.monotonic() - now),
+                            deadline - time.monotonic(),
+                        ),
+                    )
+                )
+        finally:
+            self.stats.listen_time += time.monotonic() - start
+
+
+class WakePreamble:
+    """Wraps the ground station's radio manager so a packet sent while the
+    satellite may be asleep carries a wake preamble.
+
+    Anything other than ``send`` and ``receive`` is passed through to the
+    wrapped radio.
+
+    Args:
+        radio: The radio manager to wrap.
+        driver: The ``adafruit_rfm9x.RFM9x`` instance inside ``radio``.
+        probe_interval: The satellite's probe interval. The wake preamble is
+            worked out from it at the spreading factor in use.
+        awake_time: Seconds after sending to the satellite that it is taken
+            to be awake, once it has answered. Keep it below the satellite's
+            ``linger``.
+        reply_window: Seconds after hearing the satellite that it is taken to
+            be awake. Keep it below the satellite's ``reply_window``. A packet
+            heard this soon after a send is taken as its answer.
+    """
+
+    def __init__(
+        self,
+        radio,
+        driver,
+        probe_interval: float,
+        awake_time: float = 8.0,
+        reply_window: float = 1.5,
+    ) -> None:
+        self._radio = radio
+        self._driver = driver
+        self.probe_interval: float = probe_interval
+        self.awake_time: float = awake_time
+        self.reply_window: float = reply_window
+        self._awake_until: float = 0.0
+        self._sent: float | None = None
+        self.wakes: int = 0
+
+    def __getattr__(self, name: str):
+        return getattr(self._radio, name)
+
+    def send(self, data) -> bool:
+        if time.monotonic() < self._awake_until:
+            sent = self._radio.send(data)
+        else:
+            self.wakes += 1
+            normal = self._driver.preamble_length
+            self._driver.preamble_length = wake_preamble_length(
+                self.probe_interval, self._driver.spreading_factor
+            )
+            try:
+                sent = self._radio.send(data)
+            finally:
+                self._driver.preamble_length = normal
+        self._sent = time.monotonic()
+        return sent
+
+    def receive(self, *args, **kwargs) -> bytes | None:
+        packet = self._radio.receive(*args, **kwargs)
+        if packet is not None:
+            now = time.monotonic()
+            self._stay_awake(self.reply_window)
+            # Heard straight after a send, so taken as its answer: the
+            # satellite received the send and lingers after it
+            if self._sent is not None and now - self._sent < self.reply_window:
+                self._awake_until = max(self._awake_until, self._sent + self.awake_time)
+        return packet
+
+    def _stay_awake(self, seconds: float) -> None:
+        self._awake_until = max(self._awake_until, time.monotonic() + seconds)
@@ -0,0 +1,529 @@
+"""Commands beyond those ``pysquared.cdh.CommandDataHandler`` knows, and
+batched commanding.
+
+:class:`CommandRouter` sits between the command handler and its packet
+manager. Every message the handler listens for passes through it first; a
+command registered here is checked and run, and the handler sees nothing.
+Anything else reaches the handler unchanged.
+
+Commands use the handler's format, a JSON object with the satellite's
+``name``, the ``password`` from ``super_secret_code``, the ``command`` and a
+list of ``args``. Only a message that contains a registered command's name as
+a JSON string, or ``"batch"``, is parsed here; the handler's own commands go
+on to it without being parsed twice.
+
+Batches:
+    A batch carries several registered commands in one uplink, so a pass
+    spends one turnaround on many commands instead of one each. Instead of
+    ``command`` and ``args`` it has ``batch``, a list of
+    ``[sequence, command, args]``, ``base``, the oldest sequence number the
+    ground station has not yet seen acknowledged, and ``session``, which the
+    ground station picks at random when it starts so the satellite knows to
+    forget the sequence numbers of the last one.
+
+    Commands run strictly in sequence order. One that arrives ahead of a gap
+    is held until the gap is filled, up to ``MAX_PENDING`` commands. After a
+    batch the satellite sends one response, ``{"ack": sequence, "results":
+    [[sequence, code, value], ...]}``, where ``ack`` is the last command run
+    in order, ``code`` one of the ``RESULT_*`` constants and ``value`` what
+    the command returned.
+
+    The ground station does not wait for a batch's results before sending
+    the next one. It resends every unacknowledged command in each batch;
+    commands already run are not run again, their cached results are sent
+    instead. :class:`CommandBatcher` is the ground station side.
+
+Opcodes:
+    A command registered with an opcode can also be sent in binary, which
+    skips JSON altogether: ``OPCODE_MARKER``, the password's bytes, the
+    opcode byte and the arguments packed with the ``struct`` format given at
+    registration. The opcode indexes a table and the length of the arguments
+    is worked out at registration, so a message with the wrong password, an
+    unknown opcode or arguments of the wrong length is rejected with a few
+    byte comparisons. A command registered with ``tail`` takes whatever
+    follows its arguments, such as a path or file data, as one more bytes
+    argument. :func:`opcode_command` builds one.
+"""
+
+import json
+import random
+import struct
+import time
+
+from .markers import OPCODE_MARKER
+
+RESULT_OK = 0
+RESULT_UNKNOWN = 1
+RESULT_FAILED = 2
+
+# Commands held ahead of a gap, and results kept for resent commands
+MAX_PENDING = 32
+
+SEQUENCE_MASK = 0xFFFF
+
+
+# The commands the flight software registers, with their opcodes as binary
+# commands and the ``struct`` formats of their arguments. They are kept here,
+# together, so that the ground station can build them without the modules
+# that run them and no two share an opcode.
+
+# Streams a time range of the telemetry archive to the ground station, with
+# the start and end time as arguments, see ``telemetry_archive``
+COMMAND_DOWNLINK = "downlink_archive"
+OPCODE_DOWNLINK = 0x01
+DOWNLINK_ARGS = "<II"
+
+# Starts or resumes an upload, the path following the arguments, see
+# ``uplink``
+COMMAND_UPLOAD = "upload"
+OPCODE_UPLOAD = 0x02
+UPLOAD_ARGS = "<BIIH"
+
+# Reports the staged upload
+COMMAND_UPLOAD_STATUS = "upload_status"
+OPCODE_UPLOAD_STATUS = 0x03
+
+# Seconds without a chunk after which the satellite stops waiting for an
+# upload
+UPLOAD_IDLE_TIMEOUT = 30.0
+
+# Applies an update bundle, its path following the opcode, see ``ota``
+COMMAND_APPLY_UPDATE = "apply_update"
+OPCODE_APPLY_UPDATE = 0x04
+
+# Where the satellite stages updates, and the ground station uploads bundles
+UPDATE_DIRECTORY = "/ota"
+
+# Downlinks chunks of an image, the ranges following the arguments, see
+# ``image_downlink``
+COMMAND_DOWNLINK_IMAGE = "downlink_image"
+OPCODE_DOWNLINK_IMAGE = 0x05
+DOWNLINK_IMAGE_ARGS = "<HH"
+
+
+def opcode_command(
+    config, opcode: int, arg_format: str = "", *args, tail: bytes = b""
+) -> bytes:
+    """A binary command for ``opcode`` with ``args`` packed as ``arg_format``,
+    followed by ``tail``."""
+    return (
+        bytes((OPCODE_MARKER,))
+        + config.super_secret_code.encode("utf-8")
+        + bytes((opcode,))
+        + struct.pack(arg_format, *args)
+        + tail
+    )
+
+
+def json_command(config, command: str, args: list | None = None) -> bytes:
+    """A JSON command for ``command`` with ``args``, in the handler's
+    format."""
+    return json.dumps(
+        {
+            "name": config.cubesat_name,
+            "password": config.super_secret_code,
+            "command": command,
+            "args": args or [],
+        }
+    ).encode("utf-8")
+
+
+def sequence_after(a: int, b: int) -> bool:
+    """Whether sequence number ``a`` comes after ``b``, allowing for wrap."""
+    return 0 < (a - b) & SEQUENCE_MASK < 0x8000
+
+
+class CommandStats:
+    """Counters for commands run by a :class:`CommandRouter`."""
+
+    def __init__(self) -> None:
+        self.commands: int = 0
+        self.batches: int = 0
+        self.failed: int = 0
+        self.duplicates: int = 0
+        self.rejected: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "commands": self.commands,
+            "batches": self.batches,
+            "failed": self.failed,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+        }
+
+
+class CommandTiming:
+    """How often one registered command ran and how long it took."""
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.failed: int = 0
+        self.total_ns: int = 0
+        self.longest_ns: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "failed": self.failed,
+            "mean_ms": self.total_ns / self.count / 1e6 if self.count else 0.0,
+            "longest_ms": self.longest_ns / 1e6,
+        }
+
+
+class CommandRouter:
+    """Runs registered commands from messages the command handler listens for.
+
+    Anything other than ``listen`` is passed through to the packet manager, so
+    this can be given to ``CommandDataHandler`` in place of it.
+
+    Args:
+        logger: Logger instance.
+        config: The satellite's config.
+        packet_manager: Receives the commands and sends batch responses.
+    """
+
+    def __init__(self, logger, config, packet_manager) -> None:
+        self._log = logger
+        self._config = config
+        self._packet_manager = packet_manager
+        self._handlers: dict = {}
+        # Registered command names and "batch" as JSON strings
+        self._tokens: list = [b'"batch"']
+        # (command, handler, argument format, argument length, tail) by opcode
+        self._opcodes: list = [None] * 256
+        self._opcode_prefix: bytes = bytes(
+            (OPCODE_MARKER,)
+        ) + config.super_secret_code.encode("utf-8")
+
+        # Ground station session and the next sequence number to run in it
+        self._session: int | None = None
+        self._expected: int | None = None
+        # Held commands by sequence number
+        self._pending: dict = {}
+        # Results of recent commands by sequence number, and their order
+        self._results: dict = {}
+        self._result_order: list = []
+
+        self.stats: CommandStats = CommandStats()
+        self.timings: dict = {}
+
+    def __getattr__(self, name: str):
+        return getattr(self._packet_manager, name)
+
+    def register(
+        self,
+        command: str,
+        handler,
+        opcode: int | None = None,
+        arg_format: str = "",
+        tail: bool = False,
+    ) -> None:
+        """Run ``handler(*args)`` when ``command`` is received.
+
+        Args:
+            command: Name of the command in JSON commands.
+            handler: Called with the command's arguments.
+            opcode: 0 to 255 to accept the command in binary too.
+            arg_format: ``struct`` format of the arguments of a binary
+                command.
+            tail: Pass the bytes after the arguments of a binary command as
+                a last argument.
+        """
+        self._handlers[command] = handler
+        self._tokens.append(json.dumps(command).encode("utf-8"))
+        self.timings[command] = CommandTiming()
+        if opcode is not None:
+            if self._opcodes[opcode] is not None:
+                raise ValueError(f"Opcode {opcode} is already registered")
+            self._opcodes[opcode] = (
+                command,
+                handler,
+                arg_format,
+                struct.calcsize(arg_format),
+                tail,
+            )
+
+    def _call(self, command: str, handler, args) -> tuple:
+        """Run a registered command's handler, timing it.
+
+        Returns:
+            The ``RESULT_*`` code and the handler's return value.
+        """
+        self._log.info("Running command", command=command, args=args)
+        self.stats.commands += 1
+        timing = self.timings[command]
+        timing.count += 1
+        start = time.monotonic_ns()
+        try:
+            return RESULT_OK, handler(*args)
+        except Exception as e:
+            self.stats.failed += 1
+            timing.failed += 1
+            self._log.error("Command failed", e, command=command)
+            return RESULT_FAILED, str(e)
+        finally:
+            elapsed = time.monotonic_ns() - start
+            timing.total_ns += elapsed
+            if elapsed > timing.longest_ns:
+                timing.longest_ns = elapsed
+
+    def _execute(self, command: str, args: list) -> tuple:
+        """Run a command.
+
+        Returns:
+            The ``RESULT_*`` code and the handler's return value.
+        """
+        handler = self._handlers.get(command)
+        if handler is None:
+            return RESULT_UNKNOWN, None
+        return self._call(command, handler, args)
+
+    def _dispatch(self, message) -> bool:
+        """Run the binary command in ``message`` if it is one.
+
+        Returns:
+            Whether the message was a binary command, run or rejected.
+        """
+        if not message or message[0] != OPCODE_MARKER:
+            return False
+
+        prefix = self._opcode_prefix
+        offset = len(prefix)
+        if len(message) <= offset or message[:offset] != prefix:
+            self.stats.rejected += 1
+            self._log.info("Rejected command with the wrong password")
+            return True
+
+        entry = self._opcodes[message[offset]]
+        length = len(message) - offset - 1
+        if entry is None or length < entry[3] or (length > entry[3] and not entry[4]):
+            self.stats.rejected += 1
+            return True
+
+        command, handler, arg_format, size, tail = entry
+        args = struct.unpack_from(arg_format, message, offset + 1)
+        if tail:
+            args += (bytes(message[offset + 1 + size :]),)
+        self._call(command, handler, args)
+        return True
+
+    def _remember(self, sequence: int, result: list) -> None:
+        self._results[sequence] = result
+        self._result_order.append(sequence)
+        if len(self._result_order) > MAX_PENDING:
+            self._results.pop(self._result_order.pop(0), None)
+
+    def _run_batch(self, msg: dict) -> None:
+        batch = msg.get("batch") or []
+        if msg.get("session") != self._session:
+            self._session = msg.get("session")
+            self._expected = None
+            self._pending = {}
+            self._results = {}
+            self._result_order = []
+        base = msg.get("base")
+        if base is None and batch:
+            base = batch[0][0]
+        # Everything before base was acknowledged, or given up on, by the
+        # ground station; that also resyncs after a reboot
+        if base is not None and (
+            self._expected is None or sequence_after(base, self._expected)
+        ):
+            self._expected = base
+            for sequence in list(self._pending):
+                if sequence_after(base, sequence):
+                    del self._pending[sequence]
+
+        if self._expected is None:
+            return
+
+        self.stats.batches += 1
+        results = []
+        for sequence, command, args in batch:
+            if sequence in self._results:
+                self.stats.duplicates += 1
+                results.append([sequence] + self._results[sequence])
+            elif (
+                sequence == self._expected or sequence_after(sequence, self._expected)
+            ) and len(self._pending) < MAX_PENDING:
+                self._pending[sequence] = (command, args or [])
+
+        while self._expected in self._pending:
+            sequence = self._expected
+            command, args = self._pending.pop(sequence)
+            code, value = self._execute(command, args)
+            result = [code, value if isinstance(value, (int, float, str)) else None]
+            self._remember(sequence, result)
+            results.append([sequence] + result)
+            self._expected = (sequence + 1) & SEQUENCE_MASK
+
+        response = {"ack": (self._expected - 1) & SEQUENCE_MASK, "results": results}
+        try:
+            self._packet_manager.send(json.dumps(response).encode("utf-8"))
+        except Exception as e:
+            self._log.error("Failed to send batch response", e)
+
+    def _route(self, message: bytes) -> bool:
+        """Run the command or batch in ``message`` if it is one of ours.
+
+        Returns:
+            Whether the message was a registered command or a batch.
+        """
+        message = bytes(message)
+        for token in self._tokens:
+            if token in message:
+                break
+        else:
+            return False
+
+        try:
+            msg = json.loads(message.decode("utf-8"))
+        except (ValueError, UnicodeError):
+            return False
+        if not isinstance(msg, dict):
+            return False
+
+        is_batch = "batch" in msg
+        if not is_batch and msg.get("command") not in self._handlers:
+            return False
+
+        if msg.get("name") != self._config.cubesat_name:
+            return True
+        if msg.get("password") != self._config.super_secret_code:
+            self._log.info("Rejected command with the wrong password")
+            return True
+
+        if is_batch:
+            self._run_batch(msg)
+        else:
+            self._execute(msg.get("command"), msg.get("args") or [])
+        return True
+
+    def listen(self, *args, **kwargs) -> bytes | None:
+        message = self._packet_manager.listen(*args, **kwargs)
+        if message is not None and (self._dispatch(message) or self._route(message)):
+            return None
+        return message
+
+    def status(self) -> dict:
+        """Counters, the number of commands held ahead of a gap and the
+        timing of every command that has run, for logging."""
+        status = self.stats.to_dict()
+        status["waiting"] = len(self._pending)
+        status["timings"] = {
+            command: timing.to_dict()
+            for command, timing in self.timings.items()
+            if timing.count
+        }
+        return status
+
+
+class CommandBatcher:
+    """Ground station side of batched commanding.
+
+    Queue commands with :meth:`add`, send :meth:`envelope` and pass what comes
+    back to :meth:`on_response` until :meth:`pending` is empty.
+
+    Only commands registered with the satellite's :class:`CommandRouter` can
+    be batched. ``CommandDataHandler``'s own commands never reach it from a
+    batch, and come back as ``RESULT_UNKNOWN``.
+
+    Args:
+        config: The ground station's config, with the satellite's name and
+            password.
+        max_length: Longest envelope in bytes; commands that do not fit wait
+            for the next one.
+        session: Identifies this ground station session, random by default.
+        commands: Names of the commands the satellite registers. If given,
+            :meth:`add` rejects any other.
+    """
+
+    def __init__(
+        self,
+        config,
+        max_length: int = 200,
+        session: int | None = None,
+        commands=None,
+    ) -> None:
+        self._config = config
+        self.max_length: int = max_length
+        self.session: int = session if session is not None else random.getrandbits(16)
+        self.commands = frozenset(commands) if commands is not None else None
+        self._next: int = 0
+        # [sequence, command, args] not yet acknowledged, oldest first
+        self._unacked: list = []
+        self.results: dict = {}
+
+    def check(self, command: str) -> None:
+        """Raise ``ValueError`` if ``command`` cannot be batched."""
+        if self.commands is not None and command not in self.commands:
+            raise ValueError(f"{command} is not a command the satellite batches")
+
+    def add(self, command: str, args: list | None = None) -> int:
+        """Queue a command.
+
+        Returns:
+            Its sequence number.
+
+        Raises:
+            ValueError: If ``command`` is not one of ``commands``.
+        """
+        self.check(command)
+        sequence = self._next
+        self._unacked.append([sequence, command, args or []])
+        self._next = (sequence + 1) & SEQUENCE_MASK
+        return sequence
+
+    def pending(self) -> int:
+        return len(self._unacked)
+
+    def envelope(self) -> bytes | None:
+        """The next batch: unacknowledged commands, oldest first, as many as
+        fit in ``max_length`` and ``MAX_PENDING``. None if nothing is
+        pending."""
+        if not self._unacked:
+            return None
+
+        msg = {
+            "name": self._config.cubesat_name,
+            "password": self._config.super_secret_code,
+            "session": self.session,
+            "base": self._unacked[0][0],
+            "batch": [],
+        }
+        encoded = b""
+        for entry in self._unacked[:MAX_PENDING]:
+            msg["batch"].append(entry)
+            candidate = json.dumps(msg).encode("utf-8")
+            if len(candidate) > self.max_length and len(msg["batch"]) > 1:
+                msg["batch"].pop()
+                break
+            encoded = candidate
+        return encoded
+
+    def on_response(self, message: bytes) -> list:
+        """Record the results in a batch response and forget acknowledged
+        commands.
+
+        Returns:
+            The ``[sequence, code, value]`` results it carried, or an empty
+            list if it was not a batch response.
+        """
+        try:
+            response = json.loads(bytes(message).decode("utf-8"))
+        except (ValueError, UnicodeError):
+            return []
+        if not isinstance(response, dict) or "ack" not in response:
+            return []
+
+        for sequence, code, value in response.get("results", []):
+            self.results[sequence] = (code, value)
+
+        ack = response["ack"]
+        self._unacked = [
+            entry
+            for entry in self._unacked
+            if entry[0] != ack and not sequence_after(ack, entry[0])
+        ]
+        return response.get("results", [])
@@ -0,0 +1,174 @@
+"""Small raw DEFLATE compressor.
+
+CircuitPython's ``zlib`` module can only decompress, so the flight software
+compresses with this pure-Python encoder instead. It emits a single
+fixed-Huffman block with LZ77 matches found through a one-entry hash table,
+which keeps both code size and RAM small. The output is standard raw DEFLATE
+(RFC 1951) and decompresses with ``zlib.decompress(data, -window_bits)`` on
+the board or the host.
+
+Where ``zlib.compressobj`` exists, on the host, it is used instead.
+"""
+
+try:
+    import zlib
+except ImportError:
+    zlib = None
+
+MIN_WINDOW_BITS = 9
+MAX_WINDOW_BITS = 15
+
+_MIN_MATCH = 3
+_MAX_MATCH = 258
+_HASH_BITS = 10
+
+# (base, extra bits) for length symbols 257 to 285
+_LENGTH_BASE = (
+    3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31,
+    35, 43, 51, 59, 67, 83, 99, 115, 131, 163, 195, 227, 258,
+)  # fmt: skip
+_LENGTH_EXTRA = (
+    0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2,
+    3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 0,
+)  # fmt: skip
+
+# (base, extra bits) for distance symbols 0 to 29
+_DISTANCE_BASE = (
+    1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193,
+    257, 385, 513, 769, 1025, 1537, 2049, 3073, 4097, 6145, 8193, 12289,
+    16385, 24577,
+)  # fmt: skip
+_DISTANCE_EXTRA = (
+    0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6,
+    7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12, 12, 13, 13,
+)  # fmt: skip
+
+
+class _BitWriter:
+    """Packs bits least significant first, as DEFLATE requires."""
+
+    def __init__(self) -> None:
+        self.out = bytearray()
+        self._bits = 0
+        self._count = 0
+
+    def write(self, value: int, count: int) -> None:
+        self._bits |= value << self._count
+        self._count += count
+        while self._count >= 8:
+            self.out.append(self._bits & 0xFF)
+            self._bits >>= 8
+            self._count -= 8
+
+    def write_reversed(self, code: int, count: int) -> None:
+        """Write a Huffman code, which DEFLATE stores most significant first."""
+        reversed_code = 0
+        for _ in range(count):
+            reversed_code = (reversed_code << 1) | (code & 1)
+            code >>= 1
+        self.write(reversed_code, count)
+
+    def flush(self) -> bytearray:
+        if self._count:
+            self.out.append(self._bits & 0xFF)
+            self._bits = 0
+            self._count = 0
+        return self.out
+
+
+def _write_literal(writer: _BitWriter, symbol: int) -> None:
+    """Write a literal/length symbol with the fixed Huffman code."""
+    if symbol < 144:
+        writer.write_reversed(0x30 + symbol, 8)
+    elif symbol < 256:
+        writer.write_reversed(0x190 + symbol - 144, 9)
+    elif symbol < 280:
+        writer.write_reversed(symbol - 256, 7)
+    else:
+        writer.write_reversed(0xC0 + symbol - 280, 8)
+
+
+def _write_match(writer: _BitWriter, length: int, distance: int) -> None:
+    code = 0
+    while code < 28 and _LENGTH_BASE[code + 1] <= length:
+        code += 1
+    _write_literal(writer, 257 + code)
+    if _LENGTH_EXTRA[code]:
+        writer.write(length - _LENGTH_BASE[code], _LENGTH_EXTRA[code])
+
+    code = 0
+    while code < 29 and _DISTANCE_BASE[code + 1] <= distance:
+        code += 1
+    writer.write_reversed(code, 5)
+    if _DISTANCE_EXTRA[code]:
+        writer.write(distance - _DISTANCE_BASE[code], _DISTANCE_EXTRA[code])
+
+
+def _compress_fixed(data: bytes, window_bits: int) -> bytes:
+    window = 1 << window_bits
+    length = len(data)
+    head = [-1] * (1 << _HASH_BITS)
+    mask = (1 << _HASH_BITS) - 1
+
+    writer = _BitWriter()
+    # BFINAL = 1, BTYPE = 01 (fixed Huffman)
+    writer.write(1, 1)
+    writer.write(1, 2)
+
+    i = 0
+    while i < length:
+        best_length = 0
+        best_distance = 0
+
+        if i + _MIN_MATCH <= length:
+            h = ((data[i] << 6) ^ (data[i + 1] << 3) ^ data[i + 2]) & mask
+            candidate = head[h]
+            head[h] = i
+            if candidate >= 0 and i - candidate <= window:
+                limit = min(_MAX_MATCH, length - i)
+                match = 0
+                while match < limit and data[candidate + match] == data[i + match]:
+                    match += 1
+                if match >= _MIN_MATCH:
+                    best_length = match
+                    best_distance = i - candidate
+
+        if best_length:
+            _write_match(writer, best_length, best_distance)
+            # Index the skipped positions so later matches can find them
+            end = i + best_length
+            i += 1
+            while i < end:
+                if i + _MIN_MATCH <= length:
+                    h = ((data[i] << 6) ^ (data[i + 1] << 3) ^ data[i + 2]) & mask
+                    head[h] = i
+                i += 1
+        else:
+            _write_literal(writer, data[i])
+            i += 1
+
+    _write_literal(writer, 256)
+    return bytes(writer.flush())
+
+
+def compress(data: bytes, window_bits: int = MIN_WINDOW_BITS) -> bytes:
+    """Compress ``data`` to raw DEFLATE with a ``2**window_bits`` byte window."""
+    if not MIN_WINDOW_BITS <= window_bits <= MAX_WINDOW_BITS:
+        raise ValueError("window_bits must be between 9 and 15")
+
+    if zlib is not None and hasattr(zlib, "compressobj"):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -window_bits, 1)
+        return compressor.compress(data) + compressor.flush()
+
+    return _compress_fixed(data, window_bits)
+
+
+def decompress(data: bytes, window_bits: int = MIN_WINDOW_BITS) -> bytes:
+    """Decompress raw DEFLATE data.
+
+    Raises:
+        RuntimeError: If ``zlib`` is not available.
+    """
+    if zlib is None:
+        raise RuntimeError("zlib is not available")
+    return zlib.decompress(data, -window_bits)
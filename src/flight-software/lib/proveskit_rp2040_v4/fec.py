@@ -0,0 +1,386 @@
+"""Reed-Solomon forward error correction for radio packets.
+
+Each radio packet is sent as a systematic RS codeword over GF(2^8): the
+packet followed by ``parity`` bytes, which corrects up to ``parity // 2``
+corrupted bytes anywhere in the packet. The code rate is chosen with the
+number of parity bytes, see ``CODE_RATES``.
+
+The radio drops packets that fail its own CRC before they reach software, so
+FEC only recovers packets when ``cyclic_redundancy_check`` is false on both
+ends. :class:`FECRadio` then takes over error detection: the decoder rejects
+most packets with more errors than it can correct, and a 16-bit CRC inside the
+codeword catches the few it would miscorrect.
+
+Encoding is table-driven long division and cheap enough for the RP2040. Decoding is
+plain Python as well, so the ground station board can use it, and
+:func:`decode_batch` vectorises syndrome computation with NumPy on the host,
+where most packets are clean and are accepted without running the full
+decoder.
+"""
+
+import binascii
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Parity bytes for each selectable code rate
+CODE_RATES = {
+    "light": 8,
+    "medium": 16,
+    "heavy": 32,
+}
+
+MAX_CODEWORD_LENGTH = 255
+
+# CRC bytes FECRadio adds to each packet before encoding
+CHECK_LENGTH = 2
+
+_PRIMITIVE = 0x11D
+
+_EXP = bytearray(512)
+_LOG = bytearray(256)
+
+
+def _init_tables() -> None:
+    x = 1
+    for i in range(255):
+        _EXP[i] = x
+        _LOG[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= _PRIMITIVE
+    for i in range(255, 512):
+        _EXP[i] = _EXP[i - 255]
+
+
+_init_tables()
+
+
+class ReedSolomonError(ValueError):
+    """Raised when a codeword has more errors than can be corrected."""
+
+
+def _mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def _div(a: int, b: int) -> int:
+    if b == 0:
+        raise ZeroDivisionError()
+    if a == 0:
+        return 0
+    return _EXP[(_LOG[a] + 255 - _LOG[b]) % 255]
+
+
+def _pow(x: int, power: int) -> int:
+    return _EXP[(_LOG[x] * power) % 255]
+
+
+def _inverse(x: int) -> int:
+    return _EXP[255 - _LOG[x]]
+
+
+def _poly_scale(p: list, x: int) -> list:
+    return [_mul(c, x) for c in p]
+
+
+def _poly_add(p: list, q: list) -> list:
+    r = [0] * max(len(p), len(q))
+    for i in range(len(p)):
+        r[i + len(r) - len(p)] = p[i]
+    for i in range(len(q)):
+        r[i + len(r) - len(q)] ^= q[i]
+    return r
+
+
+def _poly_mul(p: list, q: list) -> list:
+    r = [0] * (len(p) + len(q) - 1)
+    for j in range(len(q)):
+        for i in range(len(p)):
+            r[i + j] ^= _mul(p[i], q[j])
+    return r
+
+
+def _poly_eval(p, x: int) -> int:
+    y = p[0]
+    for i in range(1, len(p)):
+        y = _mul(y, x) ^ p[i]
+    return y
+
+
+_generator_logs: dict = {}
+
+
+def _generator_log(parity: int) -> bytearray:
+    """Logs of the generator polynomial coefficients, highest degree dropped."""
+    logs = _generator_logs.get(parity)
+    if logs is None:
+        g = [1]
+        for i in range(parity):
+            g = _poly_mul(g, [1, _pow(2, i)])
+        logs = bytearray(_LOG[c] for c in g[1:])
+        _generator_logs[parity] = logs
+    return logs
+
+
+def encode(data: bytes, parity: int) -> bytes:
+    """Return ``data`` followed by ``parity`` Reed-Solomon parity bytes."""
+    if len(data) + parity > MAX_CODEWORD_LENGTH:
+        raise ValueError("codeword longer than 255 bytes")
+
+    generator = _generator_log(parity)
+    length = len(data)
+    # Long division by the generator, in place; the remainder is the parity
+    work = bytearray(data) + bytearray(parity)
+    for i in range(length):
+        coefficient = work[i]
+        if coefficient:
+            log_coefficient = _LOG[coefficient]
+            for j in range(parity):
+                work[i + 1 + j] ^= _EXP[log_coefficient + generator[j]]
+
+    return bytes(data) + bytes(work[length:])
+
+
+def _syndromes(codeword, parity: int) -> list:
+    return [_poly_eval(codeword, _pow(2, i)) for i in range(parity)]
+
+
+def _error_locator(syndromes: list, parity: int) -> list:
+    """Berlekamp-Massey."""
+    error_locator = [1]
+    old_locator = [1]
+    for i in range(parity):
+        delta = syndromes[i]
+        for j in range(1, min(len(error_locator), i + 1)):
+            delta ^= _mul(error_locator[-(j + 1)], syndromes[i - j])
+        old_locator = old_locator + [0]
+        if delta != 0:
+            if len(old_locator) > len(error_locator):
+                new_locator = _poly_scale(old_locator, delta)
+                old_locator = _poly_scale(error_locator, _inverse(delta))
+                error_locator = new_locator
+            error_locator = _poly_add(error_locator, _poly_scale(old_locator, delta))
+
+    while error_locator and error_locator[0] == 0:
+        del error_locator[0]
+
+    if (len(error_locator) - 1) * 2 > parity:
+        raise ReedSolomonError("too many errors to correct")
+    return error_locator
+
+
+def _error_positions(error_locator: list, length: int) -> list:
+    """Chien search."""
+    reversed_locator = error_locator[::-1]
+    positions = []
+    for i in range(length):
+        if _poly_eval(reversed_locator, _pow(2, i)) == 0:
+            positions.append(length - 1 - i)
+    if len(positions) != len(error_locator) - 1:
+        raise ReedSolomonError("could not locate errors")
+    return positions
+
+
+def _correct(codeword: list, syndromes: list, positions: list) -> list:
+    """Forney algorithm."""
+    length = len(codeword)
+    coefficient_positions = [length - 1 - p for p in positions]
+
+    locator = [1]
+    for p in coefficient_positions:
+        locator = _poly_mul(locator, _poly_add([1], [_pow(2, p), 0]))
+
+    # Error evaluator: (x * syndromes * locator) mod x^(errors + 1)
+    errors = len(locator) - 1
+    product = _poly_mul(syndromes[::-1] + [0], locator)
+    evaluator = product[len(product) - (errors + 1) :]
+
+    x = [_pow(2, p) for p in coefficient_positions]
+    for i, xi in enumerate(x):
+        xi_inverse = _inverse(xi)
+        locator_prime = 1
+        for j, xj in enumerate(x):
+            if j != i:
+                locator_prime = _mul(locator_prime, 1 ^ _mul(xi_inverse, xj))
+        if locator_prime == 0:
+            raise ReedSolomonError("could not correct errors")
+        y = _mul(xi, _poly_eval(evaluator, xi_inverse))
+        codeword[positions[i]] ^= _div(y, locator_prime)
+
+    return codeword
+
+
+def _decode_with_syndromes(codeword, parity: int, syndromes: list) -> tuple:
+    corrected = list(codeword)
+    error_locator = _error_locator(syndromes, parity)
+    positions = _error_positions(error_locator, len(corrected))
+    corrected = _correct(corrected, syndromes, positions)
+    if max(_syndromes(corrected, parity)) != 0:
+        raise ReedSolomonError("could not correct errors")
+    return bytes(corrected[:-parity]), len(positions)
+
+
+def decode(codeword: bytes, parity: int) -> tuple:
+    """Correct a codeword and strip its parity.
+
+    Returns:
+        The data and the number of corrected bytes.
+
+    Raises:
+        ReedSolomonError: If the codeword cannot be corrected.
+    """
+    if len(codeword) <= parity:
+        raise ReedSolomonError("codeword too short")
+
+    syndromes = _syndromes(codeword, parity)
+    if max(syndromes) == 0:
+        return bytes(codeword[:-parity]), 0
+    return _decode_with_syndromes(codeword, parity, syndromes)
+
+
+def decode_batch(codewords: list, parity: int) -> list:
+    """Decode many codewords, vectorising the syndrome check with NumPy.
+
+    Falls back to :func:`decode` per codeword when NumPy is not available.
+
+    Returns:
+        For each codeword, ``(data, corrected)`` or None if it could not be
+        corrected.
+    """
+    results: list = [None] * len(codewords)
+
+    if numpy is None:
+        for i, codeword in enumerate(codewords):
+            try:
+                results[i] = decode(codeword, parity)
+            except ReedSolomonError:
+                pass
+        return results
+
+    exp = numpy.frombuffer(bytes(_EXP), dtype=numpy.uint8)
+    log = numpy.frombuffer(bytes(_LOG), dtype=numpy.uint8).astype(numpy.int32)
+
+    by_length: dict = {}
+    for i, codeword in enumerate(codewords):
+        if len(codeword) > parity:
+            by_length.setdefault(len(codeword), []).append(i)
+
+    for length, indices in by_length.items():
+        block = numpy.frombuffer(
+            b"".join(bytes(codewords[i]) for i in indices), dtype=numpy.uint8
+        ).reshape(len(indices), length)
+        nonzero = block != 0
+        logs = log[block]
+        # Power of x at each byte position, the first byte is the highest
+        degree = numpy.arange(length - 1, -1, -1, dtype=numpy.int32)
+
+        syndromes = numpy.empty((len(indices), parity), dtype=numpy.uint8)
+        for s in range(parity):
+            terms = numpy.where(nonzero, exp[(logs + s * degree) % 255], 0)
+            syndromes[:, s] = numpy.bitwise_xor.reduce(terms, axis=1)
+
+        clean = ~syndromes.any(axis=1)
+        for row, i in enumerate(indices):
+            if clean[row]:
+                results[i] = (bytes(codewords[i][:-parity]), 0)
+                continue
+            try:
+                results[i] = _decode_with_syndromes(
+                    codewords[i], parity, [int(v) for v in syndromes[row]]
+                )
+            except ReedSolomonError:
+                pass
+
+    return results
+
+
+def _check(data: bytes) -> bytes:
+    crc = binascii.crc32(data) & 0xFFFF
+    return bytes((crc & 0xFF, crc >> 8))
+
+
+class FECStats:
+    """Counters for packets passing through :class:`FECRadio`."""
+
+    def __init__(self) -> None:
+        self.sent: int = 0
+        self.received: int = 0
+        self.corrected_packets: int = 0
+        self.corrected_bytes: int = 0
+        self.uncorrectable: int = 0
+        self.check_failed: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "sent": self.sent,
+            "received": self.received,
+            "corrected_packets": self.corrected_packets,
+            "corrected_bytes": self.corrected_bytes,
+            "uncorrectable": self.uncorrectable,
+            "check_failed": self.check_failed,
+        }
+
+
+class FECRadio:
+    """Wraps a radio manager so every packet is Reed-Solomon protected.
+
+    It sits between the ``PacketManager`` and the radio manager, and reports
+    a maximum packet size reduced by the parity and CRC bytes so that the packet
+    manager fragments messages to fit. Anything else is passed through to the
+    wrapped radio.
+
+    Args:
+        logger: Logger instance.
+        radio: The radio manager to wrap.
+        parity: Parity bytes per packet, or a name from ``CODE_RATES``.
+    """
+
+    def __init__(self, logger, radio, parity: int | str = "light") -> None:
+        self._log = logger
+        self._radio = radio
+        self.parity: int = CODE_RATES[parity] if isinstance(parity, str) else parity
+        self.stats: FECStats = FECStats()
+
+    def __getattr__(self, name: str):
+        return getattr(self._radio, name)
+
+    def get_max_packet_size(self) -> int:
+        return (
+            min(self._radio.get_max_packet_size(), MAX_CODEWORD_LENGTH)
+            - self.parity
+            - CHECK_LENGTH
+        )
+
+    def send(self, data) -> bool:
+        data = bytes(data)
+        self.stats.sent += 1
+        return self._radio.send(encode(data + _check(data), self.parity))
+
+    def receive(self, *args, **kwargs) -> bytes | None:
+        codeword = self._radio.receive(*args, **kwargs)
+        if codeword is None:
+            return None
+
+        self.stats.received += 1
+        try:
+            data, corrected = decode(codeword, self.parity)
+        except ReedSolomonError as e:
+            self.stats.uncorrectable += 1
+            self._log.error("Dropping uncorrectable packet", e)
+            return None
+
+        data, check = data[:-CHECK_LENGTH], data[-CHECK_LENGTH:]
+        if len(check) != CHECK_LENGTH or _check(data) != check:
+            self.stats.check_failed += 1
+            self._log.debug("Dropping miscorrected packet")
+            return None
+
+        if corrected:
+            self.stats.corrected_packets += 1
+            self.stats.corrected_bytes += corrected
+        return data
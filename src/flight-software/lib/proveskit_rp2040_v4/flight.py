@@ -0,0 +1,773 @@
+"""Flight software initialisation and main loop.
+
+This lives in ``lib`` rather than in ``main.py`` so that ``make build``
+compiles it to ``.mpy``. CircuitPython then loads bytecode at boot instead of
+compiling the source on-device, which shortens boot and avoids the transient
+heap spike of the compiler. ``main.py`` and ``repl.py`` are thin entry points
+around :func:`run` and :func:`setup`.
+"""
+
+import gc
+import json
+import os
+import time
+
+import digitalio
+import microcontroller
+import storage
+from busio import SPI
+
+try:
+    from board_definitions import proveskit_rp2040_v4 as board
+except ImportError:
+    import board
+
+from version import __version__
+
+from ..pysquared.cdh import CommandDataHandler
+from ..pysquared.config.config import Config
+from ..pysquared.hardware.busio import _spi_init, initialize_i2c_bus
+from ..pysquared.hardware.digitalio import initialize_pin
+from ..pysquared.hardware.imu.manager.lsm6dsox import LSM6DSOXManager
+from ..pysquared.hardware.magnetometer.manager.lis2mdl import LIS2MDLManager
+from ..pysquared.hardware.radio.manager.rfm9x import RFM9xManager
+from ..pysquared.hardware.radio.packetizer.packet_manager import PacketManager
+from ..pysquared.logger import Logger, LogLevel
+from ..pysquared.nvm.counter import Counter
+from ..pysquared.rtc.manager.microcontroller import MicrocontrollerManager
+from ..pysquared.sleep_helper import SleepHelper
+from ..pysquared.watchdog import Watchdog
+from .airtime_budget import (
+    OTHER,
+    AirtimeMeter,
+    duty_cycle_budget,
+    energy_budget,
+    repeat_budget,
+)
+from .buffer_pool import BufferPools
+from .bulk_transfer import (
+    DATA_HEADER_LENGTH,
+    DEFAULT_WINDOW,
+    FileSegments,
+    SelectiveRepeatSender,
+    TransferError,
+)
+from .cad_listen import CadListener
+from .commands import (
+    COMMAND_APPLY_UPDATE,
+    COMMAND_DOWNLINK,
+    COMMAND_DOWNLINK_IMAGE,
+    COMMAND_UPLOAD,
+    COMMAND_UPLOAD_STATUS,
+    DOWNLINK_ARGS,
+    DOWNLINK_IMAGE_ARGS,
+    OPCODE_APPLY_UPDATE,
+    OPCODE_DOWNLINK,
+    OPCODE_DOWNLINK_IMAGE,
+    OPCODE_UPLOAD,
+    OPCODE_UPLOAD_STATUS,
+    UPLOAD_ARGS,
+    CommandRouter,
+)
+from .fec import FECRadio
+from .framing import FramedPacketManager, IdentifiedRadio
+from .image_downlink import (
+    CHUNK_HEADER_LENGTH,
+    chunk_count,
+    image_path,
+    pack_chunk,
+    unpack_ranges,
+)
+from .link_control import LinkController, RFM9xModem
+from .ota import Updater, on_trial
+from .packed_beacon import PackedBeacon
+from .radio_events import AlarmEdge, CounterEdge, Dio0Receiver
+from .register import Register
+from .repeater import Repeater
+from .telemetry_archive import ArchiveSegments, TelemetryArchive
+from .tx_queue import (
+    PRIORITY_BEACON,
+    PRIORITY_BULK,
+    PRIORITY_COMMAND,
+    PRIORITY_REPEAT,
+    PRIORITY_TELEMETRY,
+    TxQueue,
+)
+from .uplink import UplinkReceiver
+
+# Reed-Solomon code rate for every radio packet, a key of ``fec.CODE_RATES``,
+# or None to send packets unprotected. Must match the ground station, and only
+# helps with ``cyclic_redundancy_check`` turned off in config.json.
+FEC_CODE_RATE: str | None = None
+
+# Adapt the LoRa spreading factor and coding rate to the link, see
+# ``link_control``. Must match the ground station.
+ADAPTIVE_LINK: bool = False
+
+# Most of each hour the radio may spend transmitting telemetry and bulk data,
+# as a fraction, or None for no limit. Commands and beacons are never held
+# back.
+DUTY_CYCLE_LIMIT: float | None = 0.1
+
+# Joules per day the radio may spend transmitting telemetry and bulk data, or
+# None for no limit
+DAILY_TRANSMIT_ENERGY: float | None = 1000.0
+
+# Share of each hour repeated messages may spend on air, or None to not
+# repeat ``repeat_code`` messages, see ``repeater``
+REPEAT_DUTY_CYCLE: float | None = 0.02
+
+# Seconds a repeat may wait queued before it is dropped
+REPEAT_DEADLINE = 300.0
+
+# The uploads and updates below write to flash, which boot.py only makes
+# writable to code when ``/code_write`` is there; without it they log errors
+# and do nothing.
+
+# Directory beacons are archived in for downlink with ``downlink_archive``, or
+# None to not archive them, see ``telemetry_archive``. Only used when an SD
+# card is mounted at its top level directory, since the archive would take
+# half of the 2 MB internal flash.
+TELEMETRY_ARCHIVE: str | None = "/sd/archive"
+
+# Directory uploads are staged in until they are complete, or None to not
+# accept uploads, see ``uplink``.
+UPLINK_STAGING: str | None = "/uplink"
+
+# Directory the ``downlink_image`` command sends images from, as
+# ``<id>.jpg``, or None to not downlink images, see ``image_downlink``
+IMAGE_DIRECTORY: str | None = "/images"
+
+# Accept delta updates of the flight software with ``apply_update``, see
+# ``ota``. Updates are staged in ``ota.DEFAULT_DIRECTORY``, where main.py
+# looks for one on trial.
+DELTA_UPDATES: bool = True
+
+# How receive waits for a packet on DIO0, see ``radio_events``: "countio" to
+# idle between edge checks, "alarm" to light-sleep, or None to poll the radio
+# over SPI as RFM9xManager does.
+RECEIVE_WAKE: str | None = "countio"
+
+# Seconds between channel activity detection probes while no ground station
+# has been heard, see ``cad_listen``, or None to listen continuously. Must
+# match the ground station, which wakes the satellite with a long preamble.
+CAD_PROBE_INTERVAL: float | None = None
+
+
+def _mounted(path: str) -> bool:
+    """Whether a filesystem is mounted at the top level directory of
+    ``path``, such as ``/sd`` for ``/sd/archive``."""
+    top = "/" + path.strip("/").split("/")[0]
+    try:
+        # getmount finds the filesystem a path is on, which is the flash
+        # filesystem when nothing is mounted there
+        return storage.getmount(top) is not storage.getmount("/")
+    except OSError:
+        return False
+
+
+class Satellite:
+    """Every piece of hardware and software the flight loop uses.
+
+    Args:
+        logger: Logger instance.
+        boot_time: ``time.time()`` at boot.
+        boot_count: Boot counter, already incremented for this boot.
+        error_count: Error counter shared with the logger.
+        buffer_pools: The shared buffer pools allocated at boot.
+    """
+
+    def __init__(
+        self,
+        logger: Logger,
+        boot_time: float,
+        boot_count: Counter,
+        error_count: Counter,
+        buffer_pools: BufferPools,
+    ) -> None:
+        self.logger: Logger = logger
+        self.boot_time: float = boot_time
+        self.boot_count: Counter = boot_count
+        self.error_count: Counter = error_count
+        self.buffer_pools: BufferPools = buffer_pools
+
+        self.watchdog = Watchdog(logger, board.WDT_WDI)
+        self.watchdog.pet()
+
+        logger.debug("Initializing Config")
+        self.config: Config = Config("config.json")
+
+        # TODO(nateinaction): fix spi init
+        self.spi0: SPI = _spi_init(
+            logger,
+            board.SPI0_SCK,
+            board.SPI0_MOSI,
+            board.SPI0_MISO,
+        )
+
+        self.radio = RFM9xManager(
+            logger,
+            self.config.radio,
+            self.spi0,
+            initialize_pin(logger, board.SPI0_CS0, digitalio.Direction.OUTPUT, True),
+            initialize_pin(logger, board.RF1_RST, digitalio.Direction.OUTPUT, True),
+        )
+
+        # RFM9xManager keeps the adafruit_rfm9x driver in _radio
+        self.receiver: Dio0Receiver | None = (
+            Dio0Receiver(
+                logger,
+                self.radio,
+                self.radio._radio,
+                AlarmEdge(board.RF1_IO0)
+                if RECEIVE_WAKE == "alarm"
+                else CounterEdge(board.RF1_IO0),
+                idle=self.watchdog.pet,
+            )
+            if RECEIVE_WAKE
+            else None
+        )
+
+        self.cad_listener: CadListener | None = (
+            CadListener(
+                logger,
+                self.receiver or self.radio,
+                self.radio._radio,
+                CAD_PROBE_INTERVAL,
+                idle=self.watchdog.pet,
+            )
+            if CAD_PROBE_INTERVAL
+            else None
+        )
+
+        budgets = []
+        if DUTY_CYCLE_LIMIT is not None:
+            budgets.append(duty_cycle_budget(DUTY_CYCLE_LIMIT))
+        if DAILY_TRANSMIT_ENERGY is not None:
+            budgets.append(energy_budget(DAILY_TRANSMIT_ENERGY))
+        if REPEAT_DUTY_CYCLE is not None:
+            budgets.append(repeat_budget(REPEAT_DUTY_CYCLE))
+
+        # Innermost, so it measures exactly what goes on air
+        self.airtime_meter = AirtimeMeter(
+            logger,
+            self.cad_listener or self.receiver or self.radio,
+            self.config.radio.lora,
+            tuple(budgets),
+            microcontroller.nvm,
+            Register.airtime,
+            profile=(lambda: self.link_controller.profile) if ADAPTIVE_LINK else None,
+        )
+
+        self.fec_radio: FECRadio | None = (
+            FECRadio(logger, self.airtime_meter, FEC_CODE_RATE)
+            if FEC_CODE_RATE
+            else None
+        )
+
+        self.link_controller: LinkController | None = (
+            LinkController(
+                logger,
+                self.fec_radio or self.airtime_meter,
+                # RFM9xManager keeps the adafruit_rfm9x driver in _radio
+                RFM9xModem(self.radio._radio),
+                (
+                    self.config.radio.lora.spreading_factor,
+                    self.config.radio.lora.coding_rate,
+                ),
+            )
+            if ADAPTIVE_LINK
+            else None
+        )
+
+        # The radio with every optional layer on top, for anything that sends.
+        # Outermost, so that bulk transfers and the rest of the traffic that
+        # bypasses the packet manager is identified as well.
+        self.link = IdentifiedRadio(
+            logger,
+            self.link_controller or self.fec_radio or self.airtime_meter,
+            self.config.radio.license,
+        )
+
+        self.packet_manager = FramedPacketManager(
+            logger,
+            PacketManager(
+                logger,
+                self.link,
+                self.config.radio.license,
+                Counter(Register.message_count),
+                0.2,
+            ),
+            compress=True,
+            # Identifies the satellite once per burst instead of in a packet
+            # of its own
+            callsign=self.config.radio.license,
+            identified_radio=self.link,
+        )
+
+        self.i2c1 = initialize_i2c_bus(
+            logger,
+            board.I2C1_SCL,
+            board.I2C1_SDA,
+            100000,
+        )
+
+        self.magnetometer = LIS2MDLManager(logger, self.i2c1)
+
+        self.imu = LSM6DSOXManager(logger, self.i2c1, 0x6B)
+
+        self.sleep_helper = SleepHelper(logger, self.config, self.watchdog)
+
+        # Everything sent through the packet manager goes through here
+        self.tx_queue = TxQueue(logger, self.packet_manager, meter=self.airtime_meter)
+
+        self.archive: TelemetryArchive | None = (
+            TelemetryArchive(logger, TELEMETRY_ARCHIVE)
+            if TELEMETRY_ARCHIVE and _mounted(TELEMETRY_ARCHIVE)
+            else None
+        )
+
+        command_sender = self.tx_queue.sender(PRIORITY_COMMAND, immediate=True)
+
+        # Takes repeat requests out of what the command handler hears
+        self.repeater: Repeater | None = (
+            Repeater(
+                logger,
+                self.config,
+                command_sender,
+                self.tx_queue.sender(PRIORITY_REPEAT, REPEAT_DEADLINE),
+            )
+            if REPEAT_DUTY_CYCLE is not None and self.config.repeat_code
+            else None
+        )
+
+        # Runs the commands added here before the command handler sees them
+        self.commands = CommandRouter(
+            logger, self.config, self.repeater or command_sender
+        )
+        if self.archive is not None:
+            self.commands.register(
+                COMMAND_DOWNLINK,
+                self.downlink_archive,
+                OPCODE_DOWNLINK,
+                DOWNLINK_ARGS,
+            )
+
+        self.uplink: UplinkReceiver | None = (
+            UplinkReceiver(logger, UPLINK_STAGING) if UPLINK_STAGING else None
+        )
+        if self.uplink is not None:
+            self.commands.register(
+                COMMAND_UPLOAD,
+                self.receive_upload,
+                OPCODE_UPLOAD,
+                UPLOAD_ARGS,
+                tail=True,
+            )
+            self.commands.register(
+                COMMAND_UPLOAD_STATUS, self.report_upload, OPCODE_UPLOAD_STATUS
+            )
+
+        if IMAGE_DIRECTORY is not None:
+            self.commands.register(
+                COMMAND_DOWNLINK_IMAGE,
+                self.downlink_image,
+                OPCODE_DOWNLINK_IMAGE,
+                DOWNLINK_IMAGE_ARGS,
+                tail=True,
+            )
+
+        self.updater: Updater | None = Updater(logger) if DELTA_UPDATES else None
+        if self.updater is not None:
+            self.commands.register(
+                COMMAND_APPLY_UPDATE,
+                self.apply_update,
+                OPCODE_APPLY_UPDATE,
+                tail=True,
+            )
+
+        self.cdh = CommandDataHandler(logger, self.config, self.commands)
+
+        self.beacon = PackedBeacon(
+            logger,
+            self.config.cubesat_name,
+            # A beacon still queued after this long is stale
+            self.tx_queue.sender(PRIORITY_BEACON, deadline=30),
+            boot_time,
+            self.imu,
+            self.magnetometer,
+            self.radio,
+            error_count,
+            boot_count,
+            buffer_pools.radio,
+            keyframe_interval=10,
+            archive=self.archive,
+        )
+
+        self._transfer_id: int = 0
+
+    def _send_segments(self, segments, window: int, **context) -> bool:
+        """Send ``segments`` with selective-repeat ARQ and close them.
+
+        ``context`` is added to the log messages.
+        """
+        try:
+            if not self.airtime_meter.allows(PRIORITY_BULK):
+                self.logger.info(
+                    "Airtime budget spent, deferring bulk transfer", **context
+                )
+                return False
+
+            self._transfer_id = (self._transfer_id + 1) & 0xFF
+            sender = SelectiveRepeatSender(segments, self._transfer_id, window)
+
+            self.airtime_meter.message_class = PRIORITY_BULK
+            sender.run(
+                self.link,
+                self.watchdog,
+                lambda: self.tx_queue.pump(PRIORITY_TELEMETRY),
+            )
+        except TransferError as e:
+            self.logger.error("Bulk transfer failed", e, **context)
+            return False
+        finally:
+            self.airtime_meter.message_class = OTHER
+            segments.close()
+
+        self.logger.info(
+            "Bulk transfer complete",
+            bytes=segments.size,
+            rtt=sender.srtt,
+            **context,
+            **sender.stats.to_dict(),
+        )
+        return True
+
+    def send_file(self, path: str, window: int = DEFAULT_WINDOW) -> bool:
+        """Send a file to the ground station with selective-repeat ARQ.
+
+        The ground station must be running ``receive_file`` at the same time.
+
+        Returns:
+            Whether every packet was acknowledged.
+        """
+        segments = FileSegments(
+            path, self.link.get_max_packet_size() - DATA_HEADER_LENGTH
+        )
+        return self._send_segments(segments, window, path=path)
+
+    def downlink_archive(
+        self, start: int, end: int, window: int = DEFAULT_WINDOW
+    ) -> bool:
+        """Send the archived records stamped from ``start`` to ``end``.
+
+        Run by the ``downlink_archive`` command. The ground station receives
+        with ``receive_archive``.
+
+        Returns:
+            Whether every packet was acknowledged.
+        """
+        segments = ArchiveSegments(
+            self.archive.query(int(start), int(end)),
+            self.link.get_max_packet_size() - DATA_HEADER_LENGTH,
+        )
+        if not segments.records:
+            self.logger.info("No archived records in range", start=start, end=end)
+            return False
+        return self._send_segments(
+            segments, window, start=start, end=end, records=segments.records
+        )
+
+    def downlink_image(self, image_id: int, chunk_size: int, ranges=b"") -> int:
+        """Send chunks of image ``image_id``, the whole image if no ranges
+        are given.
+
+        Run by the ``downlink_image`` command. Chunks go out one after
+        another with no acknowledgement; the ground station puts them
+        together with ``image_reassembly`` and asks again for what it
+        missed. Stops early once the airtime budget is spent.
+
+        Returns:
+            The number of chunks sent.
+        """
+        image_id = int(image_id)
+        # Room for the PacketManager's header and the callsign the first
+        # message of a burst carries, see ``framing``
+        largest = (
+            self.link.get_max_packet_size()
+            - 4
+            - 2
+            - len(self.config.radio.license)
+            - CHUNK_HEADER_LENGTH
+        )
+        chunk_size = min(int(chunk_size), largest) if int(chunk_size) else largest
+
+        sent = 0
+        with open(image_path(IMAGE_DIRECTORY, image_id), "rb") as f:
+            f.seek(0, 2)
+            size = f.tell()
+            total = chunk_count(size, chunk_size)
+            ranges = unpack_ranges(ranges) or [(0, total)]
+            try:
+                self.airtime_meter.message_class = PRIORITY_BULK
+                for first, count in ranges:
+                    for chunk in range(first, min(first + count, total)):
+                        if not self.airtime_meter.allows(PRIORITY_BULK):
+                            self.logger.info(
+                                "Airtime budget spent, stopping image downlink",
+                                image=image_id,
+                                sent=sent,
+                            )
+                            return sent
+                        self.watchdog.pet()
+                        self.tx_queue.pump(PRIORITY_TELEMETRY)
+                        f.seek(chunk * chunk_size)
+                        self.packet_manager.send(
+                            pack_chunk(
+                                image_id, chunk, chunk_size, size, f.read(chunk_size)
+                            )
+                        )
+                        sent += 1
+            finally:
+                self.airtime_meter.message_class = OTHER
+
+        self.logger.info(
+            "Image downlinked",
+            image=image_id,
+            chunks=sent,
+            total=total,
+            chunk_size=chunk_size,
+        )
+        return sent
+
+    def report_upload(self) -> dict:
+        """Send the staged upload's status to the ground station.
+
+        Run by the ``upload_status`` command.
+        """
+        status = self.uplink.status()
+        self.commands.send(json.dumps(status).encode("utf-8"))
+        return status
+
+    def receive_upload(
+        self, transfer_id: int, size: int, crc: int, chunk_size: int, path
+    ) -> bool:
+        """Receive a file from the ground station into ``path``, carrying on
+        with the staged upload if it is the same one.
+
+        Run by the ``upload`` command. The ground station sends with
+        ``upload_file``, and gets the status before and after the transfer.
+
+        Returns:
+            Whether the file was received whole and committed.
+        """
+        if isinstance(path, bytes):
+            path = path.decode("utf-8")
+        self.uplink.begin(int(transfer_id), int(size), int(crc), int(chunk_size), path)
+        self.report_upload()
+
+        started = time.monotonic()
+        had = self.uplink.received
+        try:
+            complete = self.uplink.run(self.link, self.watchdog)
+        finally:
+            self.uplink.close()
+        seconds = time.monotonic() - started
+        status = self.uplink.status()
+        uplinked = (self.uplink.received - had) * self.uplink.chunk_size
+        committed = complete and self.uplink.commit()
+
+        status.update(
+            committed=committed,
+            seconds=seconds,
+            rate=uplinked / seconds if seconds else 0.0,
+        )
+        self.logger.info("Upload ended", **status)
+        self.commands.send(json.dumps(status).encode("utf-8"))
+        return committed
+
+    def apply_update(self, path) -> None:
+        """Apply the update bundle at ``path`` and reset into it.
+
+        Run by the ``apply_update`` command once the ground station has
+        uploaded the bundle. The ground station hears the result as JSON;
+        a bundle that does not apply leaves the software as it was.
+        """
+        if isinstance(path, bytes):
+            path = path.decode("utf-8")
+        status = {"update": path}
+        try:
+            status["files"] = self.updater.stage(path)
+            self.updater.install()
+        except Exception as e:
+            status["error"] = str(e)
+            self.commands.send(json.dumps(status).encode("utf-8"))
+            raise
+
+        status["installed"] = True
+        self.commands.send(json.dumps(status).encode("utf-8"))
+        self.logger.info("Resetting into the update", path=path)
+        if self.archive is not None:
+            self.archive.flush()
+        time.sleep(2)
+        microcontroller.on_next_reset(microcontroller.RunMode.NORMAL)
+        microcontroller.reset()
+
+    def nominal_power_loop(self) -> None:
+        self.logger.debug(
+            "FC Board Stats",
+            bytes_remaining=gc.mem_free(),
+            buffer_pools=self.buffer_pools.stats(),
+            framing=self.packet_manager.stats.to_dict(),
+            fec=self.fec_radio.stats.to_dict() if self.fec_radio else None,
+            link=self.link_controller.status() if self.link_controller else None,
+            tx_queue=self.tx_queue.stats(),
+            airtime=self.airtime_meter.stats(),
+            archive=self.archive.status() if self.archive else None,
+            commands=self.commands.status(),
+            receiver=self.receiver.stats.to_dict() if self.receiver else None,
+            cad=self.cad_listener.stats.to_dict() if self.cad_listener else None,
+            repeater=self.repeater.stats.to_dict() if self.repeater else None,
+            uplink=self.uplink.status() if self.uplink else None,
+            ota=self.updater.status() if self.updater else None,
+        )
+
+        self.airtime_meter.update()
+
+        self.beacon.send()
+
+        self.tx_queue.pump()
+
+        if self.link_controller is not None:
+            self.link_controller.update()
+
+        self.cdh.listen_for_commands(10)
+
+        self.beacon.send()
+
+        self.tx_queue.pump()
+
+        self.cdh.listen_for_commands(self.config.sleep_duration)
+
+
+def boot(log_level: int = LogLevel.NOTSET) -> tuple[Logger, Counter, Counter]:
+    """Start the RTC, bump the boot counter and create the logger.
+
+    Returns:
+        The logger, the boot counter and the error counter.
+    """
+    MicrocontrollerManager()
+
+    (boot_count := Counter(index=Register.boot_count)).increment()
+    error_count: Counter = Counter(index=Register.error_count)
+
+    logger: Logger = Logger(
+        error_counter=error_count,
+        colorized=False,
+        log_level=log_level,
+    )
+
+    logger.info(
+        "Booting",
+        hardware_version=os.uname().version,
+        software_version=__version__,
+        # False while boot.py leaves flash to the USB host, see boot.py
+        filesystem_writable=not storage.getmount("/").readonly,
+    )
+
+    return logger, boot_count, error_count
+
+
+def log_boot_cost(
+    logger: Logger,
+    import_seconds: float,
+    init_seconds: float,
+    import_heap: int,
+    heap_at_boot: int,
+    peak: bool = False,
+) -> None:
+    """Log how long boot took and how much heap it used.
+
+    ``import_heap`` is the heap allocated by importing, taken once every
+    module is loaded and before anything has been collected, so it includes
+    the transient garbage of compiling source on-device. CircuitPython has no
+    high-water mark, so it is only the peak, and logged as
+    ``import_heap_peak``, when ``peak`` says that collection was held off
+    during the imports, see ``MEASURE_IMPORT_PEAK`` in ``main.py``.
+    Otherwise a collection during import lowers it.
+    """
+    gc.collect()
+    heap = {"import_heap_peak" if peak else "import_heap": import_heap}
+    logger.info(
+        "Boot complete",
+        import_seconds=import_seconds,
+        init_seconds=init_seconds,
+        heap_retained=gc.mem_alloc() - heap_at_boot,
+        heap_free=gc.mem_free(),
+        **heap,
+    )
+
+
+def run(
+    boot_started: float, boot_time: float, heap_at_boot: int, loiter_time: int = 5
+) -> None:
+    """Boot the satellite and run the main loop forever.
+
+    Args:
+        boot_started: ``time.monotonic()`` at the very top of ``main.py``.
+        boot_time: ``time.time()`` at the very top of ``main.py``.
+        heap_at_boot: ``gc.mem_alloc()`` once ``main.py`` has imported ``gc``.
+        loiter_time: Seconds to wait before touching any hardware.
+    """
+    imported = time.monotonic()
+    heap_after_import = gc.mem_alloc()
+    # main.py holds off collection to measure the peak heap of importing
+    import_peak = not gc.isenabled()
+    gc.enable()
+
+    # Allocate the shared buffer pools first, while the heap is still unfragmented
+    buffer_pools = BufferPools()
+
+    logger, boot_count, error_count = boot(LogLevel.INFO)
+
+    try:
+        for i in range(loiter_time):
+            logger.info(f"Code Starting in {loiter_time - i} seconds")
+            time.sleep(1)
+
+        init_started = time.monotonic()
+        satellite = Satellite(logger, boot_time, boot_count, error_count, buffer_pools)
+        log_boot_cost(
+            logger,
+            imported - boot_started,
+            time.monotonic() - init_started,
+            heap_after_import - heap_at_boot,
+            heap_at_boot,
+            import_peak,
+        )
+
+        try:
+            logger.info("Entering main loop")
+            while True:
+                # TODO(nateinaction): Modify behavior based on power state
+                satellite.nominal_power_loop()
+                # The update on trial, if any, got this far
+                if satellite.updater is not None:
+                    satellite.updater.confirm()
+
+        except Exception as e:
+            logger.critical("Critical in Main Loop", e)
+            if satellite.archive is not None:
+                satellite.archive.flush()
+            time.sleep(10)
+            microcontroller.on_next_reset(microcontroller.RunMode.NORMAL)
+            microcontroller.reset()
+        finally:
+            logger.info("Going Neutral!")
+
+    except Exception as e:
+        logger.critical("An exception occured within main.py", e)
+        # Give up on an update that does not start, see ``ota.boot_check``
+        if on_trial():
+            microcontroller.on_next_reset(microcontroller.RunMode.NORMAL)
+            microcontroller.reset()
@@ -0,0 +1,393 @@
+"""Message framing between the application and the ``PacketManager``.
+
+A framed message starts with a frame byte whose high nibble is ``FRAME_MARKER``
+and whose low nibble holds per-message flags. Messages that need no flags are
+sent without a frame byte, so framing costs nothing for them, unless their
+first byte happens to look like a frame byte. ``0xA0`` to ``0xAF`` are UTF-8
+continuation bytes, so text, JSON commands and beacons are never mistaken for
+frames, and a peer that does not frame its messages still interoperates.
+
+Flags:
+    FLAG_CALLSIGN: The station's callsign follows the frame byte, as a length
+        byte and then the callsign, before anything else.
+    FLAG_COMPRESSED: The rest of the message is raw DEFLATE, see
+        :mod:`deflate`. The window size is carried in the byte after the frame
+        byte, or after the callsign, as ``window_bits - 9``.
+
+Identification: amateur rules require the callsign on the air, but it does
+not need a packet of its own. :class:`FramedPacketManager` adds it to the
+first message of each transmission burst, which costs its length plus two
+bytes instead of a whole packet's preamble and headers. Bulk transfers,
+uplink acknowledgements, link control and wake-ups go straight to the radio,
+so :class:`IdentifiedRadio` identifies those: it sends an ID frame, a frame
+with only the callsign, ahead of any packet that starts a burst or comes
+``id_interval`` after the last identification.
+"""
+
+import time
+
+from . import deflate
+from .markers import FRAME_MARKER
+
+FRAME_MARKER_MASK = 0xF0
+
+FLAG_COMPRESSED = 0x01
+FLAG_CALLSIGN = 0x02
+
+
+class FrameDecodeError(ValueError):
+    """Raised when a framed message cannot be decoded."""
+
+
+def _ticks_us() -> int:
+    return time.monotonic_ns() // 1000
+
+
+class FrameStats:
+    """Counters describing what framing did to outgoing messages."""
+
+    def __init__(self) -> None:
+        self.messages: int = 0
+        self.compress_attempts: int = 0
+        self.compressed: int = 0
+        self.bytes_in: int = 0
+        self.bytes_out: int = 0
+        self.compress_us: int = 0
+        self.identified: int = 0
+        self.id_frames: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "messages": self.messages,
+            "compress_attempts": self.compress_attempts,
+            "compressed": self.compressed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+            "compress_us": self.compress_us,
+            "identified": self.identified,
+            "id_frames": self.id_frames,
+        }
+
+
+def _identification_due(
+    now: float,
+    last_sent: float | None,
+    last_identified: float | None,
+    burst_gap: float,
+    id_interval: float,
+) -> bool:
+    return (
+        last_sent is None
+        or now - last_sent > burst_gap
+        or last_identified is None
+        or now - last_identified > id_interval
+    )
+
+
+def encode_frame(
+    data: bytes,
+    compress: bool = False,
+    compress_threshold: int = 48,
+    window_bits: int = deflate.MIN_WINDOW_BITS,
+    stats: FrameStats | None = None,
+    callsign: bytes | None = None,
+) -> bytes:
+    """Frame a message for sending.
+
+    Args:
+        data: The message.
+        compress: Try compressing the message.
+        compress_threshold: Messages shorter than this are never compressed.
+        window_bits: DEFLATE window size, 9 to 15.
+        stats: Optional counters to update.
+        callsign: Callsign to identify the message with, if any.
+    """
+    flags = 0
+    body = data
+
+    if compress and len(data) >= compress_threshold:
+        start = _ticks_us()
+        compressed = deflate.compress(data, window_bits)
+        if stats is not None:
+            stats.compress_attempts += 1
+            stats.compress_us += _ticks_us() - start
+
+        # Only keep the compressed form when it pays for its two header bytes
+        if len(compressed) + 2 < len(data):
+            flags |= FLAG_COMPRESSED
+            body = bytes((window_bits - deflate.MIN_WINDOW_BITS,)) + compressed
+
+    if callsign:
+        flags |= FLAG_CALLSIGN
+        body = bytes((len(callsign),)) + callsign + body
+
+    if flags or (data and data[0] & FRAME_MARKER_MASK == FRAME_MARKER):
+        frame = bytes((FRAME_MARKER | flags,)) + body
+    else:
+        frame = data
+
+    if stats is not None:
+        stats.messages += 1
+        stats.compressed += 1 if flags & FLAG_COMPRESSED else 0
+        stats.identified += 1 if flags & FLAG_CALLSIGN else 0
+        stats.bytes_in += len(data)
+        stats.bytes_out += len(frame)
+
+    return frame
+
+
+def decode_frame(frame: bytes) -> bytes:
+    """Undo :func:`encode_frame`. Unframed messages are returned unchanged.
+
+    Raises:
+        FrameDecodeError: If a framed message is malformed.
+    """
+    return decode_frame_callsign(frame)[0]
+
+
+def decode_frame_callsign(frame: bytes) -> tuple:
+    """Like :func:`decode_frame`, but also return the callsign.
+
+    Returns:
+        The message and the callsign it carried, or None.
+
+    Raises:
+        FrameDecodeError: If a framed message is malformed.
+    """
+    if not frame or frame[0] & FRAME_MARKER_MASK != FRAME_MARKER:
+        return frame, None
+
+    flags = frame[0] & ~FRAME_MARKER_MASK
+    body = frame[1:]
+    callsign = None
+
+    if flags & FLAG_CALLSIGN:
+        if not body or len(body) < 1 + body[0]:
+            raise FrameDecodeError("truncated callsign")
+        callsign = bytes(body[1 : 1 + body[0]])
+        body = body[1 + body[0] :]
+
+    if flags & FLAG_COMPRESSED:
+        if not body:
+            raise FrameDecodeError("missing compression header")
+        try:
+            body = deflate.decompress(body[1:], body[0] + deflate.MIN_WINDOW_BITS)
+        except Exception as e:
+            raise FrameDecodeError("corrupt compressed message") from e
+
+    return body, callsign
+
+
+def is_id_frame(packet: bytes) -> bool:
+    """Whether a packet is an ID frame, a frame with only a callsign."""
+    return (
+        len(packet) >= 2
+        and packet[0] == FRAME_MARKER | FLAG_CALLSIGN
+        and len(packet) == 2 + packet[1]
+    )
+
+
+class IdentifiedRadio:
+    """Wraps a radio so that everything sent over it is identified.
+
+    Before a packet that starts a transmission burst, or that comes
+    ``id_interval`` after the last identification, an ID frame goes out: a
+    frame with only :data:`FLAG_CALLSIGN` and the callsign. A
+    :class:`FramedPacketManager` sending through this radio puts the callsign
+    in its own message instead, see ``identified_radio``. Received ID frames
+    are noted in ``last_callsign`` and not returned.
+
+    Anything other than ``send`` and ``receive`` is passed through to the
+    wrapped radio.
+
+    Args:
+        logger: Logger instance.
+        radio: The radio to wrap.
+        callsign: Station callsign, or None to send no ID frames.
+        burst_gap: Seconds without sending that end a transmission burst.
+        id_interval: Seconds after which the callsign is repeated even within
+            a burst.
+        clock: Returns the time in seconds.
+    """
+
+    def __init__(
+        self,
+        logger,
+        radio,
+        callsign: str | None,
+        burst_gap: float = 5.0,
+        id_interval: float = 600.0,
+        clock=time.monotonic,
+    ) -> None:
+        self._log = logger
+        self._radio = radio
+        self._id_frame: bytes | None = (
+            encode_frame(b"", callsign=callsign.encode("utf-8")) if callsign else None
+        )
+        self.burst_gap: float = burst_gap
+        self.id_interval: float = id_interval
+        self._clock = clock
+        self._last_sent: float | None = None
+        self._last_identified: float | None = None
+        self._next_identified: bool = False
+        self.last_callsign: bytes | None = None
+        self.stats: FrameStats = FrameStats()
+
+    def __getattr__(self, name: str):
+        return getattr(self._radio, name)
+
+    def due(self, now: float) -> bool:
+        """Whether a packet sent at ``now`` must be identified."""
+        return self._id_frame is not None and _identification_due(
+            now,
+            self._last_sent,
+            self._last_identified,
+            self.burst_gap,
+            self.id_interval,
+        )
+
+    def identified(self, now: float) -> None:
+        """Note that the packet about to be sent carries the callsign."""
+        self._last_identified = now
+        self._next_identified = True
+
+    def send(self, data) -> bool:
+        now = self._clock()
+        if self._next_identified:
+            self._next_identified = False
+        elif self.due(now):
+            self._radio.send(self._id_frame)
+            self._last_identified = now
+            self.stats.id_frames += 1
+        sent = self._radio.send(data)
+        self._last_sent = self._clock()
+        return sent
+
+    def receive(self, *args, **kwargs) -> bytes | None:
+        """Receive a packet, noting ID frames.
+
+        Returns:
+            The packet, or None if nothing was received or it was an ID
+            frame.
+        """
+        packet = self._radio.receive(*args, **kwargs)
+        if packet is not None and is_id_frame(packet):
+            self.last_callsign = bytes(packet[2:])
+            return None
+        return packet
+
+
+class FramedPacketManager:
+    """Wraps a ``PacketManager`` so that messages are framed transparently.
+
+    Anything other than ``send`` and ``listen`` is passed through to the
+    wrapped packet manager, so this can be used wherever a ``PacketManager``
+    is expected.
+
+    Args:
+        logger: Logger instance.
+        packet_manager: The packet manager to wrap.
+        compress: Try compressing outgoing messages.
+        compress_threshold: Messages shorter than this are never compressed.
+        window_bits: DEFLATE window size, 9 to 15. Small windows keep the
+            receiver's RAM use down.
+        callsign: Station callsign to identify transmissions with, or None.
+        burst_gap: Seconds without sending that end a transmission burst.
+        id_interval: Seconds after which the callsign is repeated even within
+            a burst.
+        clock: Returns the time in seconds.
+        identified_radio: The :class:`IdentifiedRadio` the packet manager
+            sends through, if any. It then decides when to identify, so that
+            a message carrying the callsign is not preceded by an ID frame as
+            well, and counts in the same stats.
+    """
+
+    def __init__(
+        self,
+        logger,
+        packet_manager,
+        compress: bool = False,
+        compress_threshold: int = 48,
+        window_bits: int = deflate.MIN_WINDOW_BITS,
+        callsign: str | None = None,
+        burst_gap: float = 5.0,
+        id_interval: float = 600.0,
+        clock=time.monotonic,
+        identified_radio: IdentifiedRadio | None = None,
+    ) -> None:
+        self._log = logger
+        self._packet_manager = packet_manager
+        self.compress: bool = compress
+        self.compress_threshold: int = compress_threshold
+        self.window_bits: int = window_bits
+        self.callsign: bytes | None = callsign.encode("utf-8") if callsign else None
+        self.burst_gap: float = burst_gap
+        self.id_interval: float = id_interval
+        self._clock = clock
+        self._last_sent: float | None = None
+        self._last_identified: float | None = None
+        self.last_callsign: bytes | None = None
+        self._identified_radio = identified_radio
+        self.stats: FrameStats = (
+            identified_radio.stats if identified_radio else FrameStats()
+        )
+
+    def __getattr__(self, name: str):
+        return getattr(self._packet_manager, name)
+
+    def _needs_callsign(self, now: float) -> bool:
+        if self.callsign is None:
+            return False
+        if self._identified_radio is not None:
+            return self._identified_radio.due(now)
+        return _identification_due(
+            now,
+            self._last_sent,
+            self._last_identified,
+            self.burst_gap,
+            self.id_interval,
+        )
+
+    def send(self, data: bytes) -> bool:
+        """Frame and send a message, with the callsign if a burst starts."""
+        now = self._clock()
+        identify = self._needs_callsign(now)
+        if identify:
+            self._last_identified = now
+            if self._identified_radio is not None:
+                self._identified_radio.identified(now)
+
+        sent = self._packet_manager.send(
+            encode_frame(
+                data,
+                self.compress,
+                self.compress_threshold,
+                self.window_bits,
+                self.stats,
+                self.callsign if identify else None,
+            )
+        )
+
+        self._last_sent = self._clock()
+        return sent
+
+    def listen(self, timeout: float | None = None) -> bytes | None:
+        """Receive a message and undo its framing.
+
+        Returns:
+            The message, or None if nothing was received or it was corrupt.
+        """
+        frame = self._packet_manager.listen(timeout)
+        if frame is None:
+            return None
+
+        try:
+            message, callsign = decode_frame_callsign(frame)
+        except FrameDecodeError as e:
+            self._log.error("Dropping malformed frame", e)
+            return None
+
+        if callsign is not None:
+            self.last_callsign = callsign
+        return message
@@ -0,0 +1,490 @@
+"""Pipelined ground station receive, decode, store and display.
+
+``GroundStation.run`` decodes, stores and shows each message before it
+listens again, so a burst of packets arriving during a slow write is lost:
+the radio holds only the last packet it received. :class:`Pipeline` runs the
+receiver as its own ``asyncio`` task that only takes packets off the radio
+and puts them on a bounded queue, and each stage as another task reading
+its own queue:
+
+    rx -> decode -> persist
+                 -> display
+
+A stage's handler takes an item and returns what its following stages get,
+or None to pass nothing on. A handler may be a coroutine function, which
+lets a slow stage yield in between, or on the host hand blocking work to a
+thread with ``asyncio.to_thread``. Stages run one item at a time, and the
+receiver gets a turn between every item, so a plain handler delays receive
+by at most one item's work.
+
+On the board there are no threads and the radio keeps only the last
+packet, so a handler that blocks for longer than two packets' time on air
+loses packets wherever it runs. The receiver never waits for a write, but a
+plain writing stage would still run between two receives. Writes belong in
+a stage added with ``defer`` and ``batch``: it holds its items until the
+receiver has been quiet for ``defer`` seconds, unless its queue is three
+quarters full, and then stores every item waiting in one go, so each gap
+between bursts takes one write. Its queue should hold a whole burst. By
+``scripts/ground_pipeline_sim.py``, with flash stalling for a second every
+tenth write, ``GroundStation.run`` and the pipeline with plain handlers lose
+8.9% of a three-burst downlink, deferred writes 2.2%, and deferred batched
+writes none.
+
+:class:`Console` reads commands typed on the serial console between items,
+so the ground station can send while the pipeline runs.
+
+Queues never block the stage putting on them: an item for a full queue is
+dropped and counted, so a stalled stage loses its own items and nothing
+else. Each stage reports its queue depth and high-water mark, drops, the
+time items wait in its queue, the time its handler takes and the latency
+from receive to the end of the stage.
+
+CircuitPython's ``asyncio`` has no ``Queue``; :class:`StageQueue` is a
+bounded queue built on ``Event``.
+
+Only the ground station runs this; ``make build`` leaves it out of the flight
+artifact, see ``GROUND_ONLY_MODULES`` in the Makefile.
+"""
+
+import binascii
+import json
+import sys
+import time
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+try:
+    import supervisor
+except ImportError:
+    supervisor = None
+
+from .beacon_codec import BeaconDecodeError, DeltaBeaconDecoder
+from .image_downlink import chunk_count, unpack_chunk
+
+# Name of the stage that receives
+RX = "rx"
+
+DEFAULT_QUEUE_SIZE = 32
+
+
+def _awaitable(value) -> bool:
+    # Coroutines are generators on CircuitPython, and have no __await__
+    return hasattr(value, "send")
+
+
+class StageQueue:
+    """Bounded FIFO that a task can wait on.
+
+    Args:
+        maxsize: Items held at most; more are dropped.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_QUEUE_SIZE) -> None:
+        self.maxsize: int = maxsize
+        self._items: list = []
+        self._ready = asyncio.Event()
+        self.dropped: int = 0
+        self.max_depth: int = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put_nowait(self, item) -> bool:
+        """Add ``item`` unless the queue is full.
+
+        Returns:
+            Whether it was added.
+        """
+        if len(self._items) >= self.maxsize:
+            self.dropped += 1
+            return False
+        self._items.append(item)
+        if len(self._items) > self.max_depth:
+            self.max_depth = len(self._items)
+        self._ready.set()
+        return True
+
+    async def get(self):
+        """Wait for the oldest item and take it."""
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.pop(0)
+
+    def get_all_nowait(self) -> list:
+        """Take every item waiting, oldest first."""
+        items = self._items
+        self._items = []
+        return items
+
+
+class StageStats:
+    """Counters for one stage of a :class:`Pipeline`."""
+
+    def __init__(self) -> None:
+        self.items: int = 0
+        self.errors: int = 0
+        self.wait_ns: int = 0
+        self.service_ns: int = 0
+        self.longest_ns: int = 0
+        self.latency_ns: int = 0
+
+    def to_dict(self) -> dict:
+        items = self.items or 1
+        return {
+            "items": self.items,
+            "errors": self.errors,
+            "mean_wait_ms": self.wait_ns / items / 1e6,
+            "mean_service_ms": self.service_ns / items / 1e6,
+            "longest_ms": self.longest_ns / 1e6,
+            "mean_latency_ms": self.latency_ns / items / 1e6,
+        }
+
+
+class Stage:
+    """A handler, its input queue and the stages it feeds."""
+
+    def __init__(
+        self,
+        name: str,
+        handler,
+        queue_size: int,
+        defer: float | None = None,
+        batch: bool = False,
+    ) -> None:
+        self.name: str = name
+        self.handler = handler
+        self.defer: float | None = defer
+        self.batch: bool = batch
+        self.queue: StageQueue = StageQueue(queue_size)
+        self.following: list = []
+        self.stats: StageStats = StageStats()
+
+    def status(self) -> dict:
+        status = self.stats.to_dict()
+        status.update(
+            depth=len(self.queue),
+            max_depth=self.queue.max_depth,
+            dropped=self.queue.dropped,
+        )
+        return status
+
+
+class Pipeline:
+    """Receives packets and runs them through stages under ``asyncio``.
+
+    Args:
+        logger: Logger instance.
+        receive: Returns the next packet or None. Should return promptly;
+            a short timeout keeps the stages running. May be a coroutine
+            function.
+        queue_size: Default queue size of each stage.
+        clock: Returns the time in nanoseconds.
+    """
+
+    def __init__(
+        self,
+        logger,
+        receive,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        clock=time.monotonic_ns,
+    ) -> None:
+        if asyncio is None:
+            raise RuntimeError("asyncio is not available")
+        self._log = logger
+        self._receive = receive
+        self.queue_size: int = queue_size
+        self._clock = clock
+        # Its stats count packets and the time spent in receive
+        self.rx: Stage = Stage(RX, receive, 0)
+        self.stages: dict = {RX: self.rx}
+        self._last_received: int = clock()
+
+    def add(
+        self,
+        name: str,
+        handler,
+        after: str = RX,
+        queue_size: int | None = None,
+        defer: float | None = None,
+        batch: bool = False,
+    ) -> None:
+        """Add a stage fed by the stage ``after``.
+
+        Args:
+            name: The stage's name in :meth:`status`.
+            handler: Takes an item, returns what the following stages get.
+            after: The stage that feeds this one.
+            queue_size: Items the stage may have waiting.
+            defer: Seconds without a packet before the handler runs, unless
+                the queue is three quarters full, for blocking work such as
+                writes.
+            batch: Give the handler a list of every item waiting instead of
+                one item, for work such as writes that costs about the same
+                for many items as for one.
+
+        Raises:
+            ValueError: If the name is taken or ``after`` does not exist.
+        """
+        if name in self.stages or after not in self.stages:
+            raise ValueError("bad stage: " + name)
+        stage = Stage(name, handler, queue_size or self.queue_size, defer, batch)
+        self.stages[name] = stage
+        self.stages[after].following.append(stage)
+
+    def _forward(self, stage: Stage, received: int, value) -> None:
+        now = self._clock()
+        for following in stage.following:
+            following.queue.put_nowait((received, now, value))
+
+    async def _run_rx(self) -> None:
+        stats = self.rx.stats
+        while True:
+            start = self._clock()
+            try:
+                packet = self._receive()
+                if _awaitable(packet):
+                    packet = await packet
+            except Exception as e:
+                stats.errors += 1
+                self._log.error("Receive failed", e)
+                packet = None
+            elapsed = self._clock() - start
+            stats.service_ns += elapsed
+            if packet is not None:
+                self._last_received = start + elapsed
+                stats.items += 1
+                if elapsed > stats.longest_ns:
+                    stats.longest_ns = elapsed
+                self._forward(self.rx, start + elapsed, packet)
+            # Let the stages run
+            await asyncio.sleep(0)
+
+    async def _quiet(self, stage: Stage) -> None:
+        """Wait until the receiver has been quiet for the stage's ``defer``
+        seconds or its queue is three quarters full."""
+        quiet_ns = int(stage.defer * 1e9)
+        while (
+            self._clock() - self._last_received < quiet_ns
+            and len(stage.queue) < stage.queue.maxsize * 3 // 4
+        ):
+            await asyncio.sleep(0.01)
+
+    async def _run_stage(self, stage: Stage) -> None:
+        stats = stage.stats
+        while True:
+            entries = [await stage.queue.get()]
+            if stage.defer is not None:
+                await self._quiet(stage)
+            if stage.batch:
+                entries += stage.queue.get_all_nowait()
+            start = self._clock()
+            try:
+                result = stage.handler(
+                    [item for _, _, item in entries] if stage.batch else entries[0][2]
+                )
+                if _awaitable(result):
+                    result = await result
+            except Exception as e:
+                stats.errors += 1
+                self._log.error("Pipeline stage failed", e, stage=stage.name)
+                result = None
+            end = self._clock()
+            stats.items += len(entries)
+            stats.service_ns += end - start
+            if end - start > stats.longest_ns:
+                stats.longest_ns = end - start
+            for received, queued, _ in entries:
+                stats.wait_ns += start - queued
+                stats.latency_ns += end - received
+            if result is not None:
+                self._forward(stage, entries[0][0], result)
+            await asyncio.sleep(0)
+
+    async def run(self, duration: float | None = None) -> dict:
+        """Run every stage, forever or for ``duration`` seconds.
+
+        Returns:
+            The stats, see :meth:`status`.
+        """
+        tasks = [asyncio.create_task(self._run_rx())] + [
+            asyncio.create_task(self._run_stage(stage))
+            for stage in self.stages.values()
+            if stage is not self.rx
+        ]
+        if duration is None:
+            await asyncio.gather(*tasks)
+        else:
+            await asyncio.sleep(duration)
+            for task in tasks:
+                task.cancel()
+        return self.status()
+
+    def status(self) -> dict:
+        """Per-stage queue depth, drops, waits, handler times and latency."""
+        rx = self.rx.stats
+        # Receiving has no queue of its own; it drops what the stages it
+        # feeds have no room for
+        status = {
+            RX: {
+                "items": rx.items,
+                "errors": rx.errors,
+                "receive_ms": rx.service_ns / 1e6,
+                "longest_ms": rx.longest_ns / 1e6,
+                "dropped": sum(stage.queue.dropped for stage in self.rx.following),
+            }
+        }
+        for name, stage in self.stages.items():
+            if stage is not self.rx:
+                status[name] = stage.status()
+        return status
+
+
+def _serial_bytes_available() -> int:
+    return supervisor.runtime.serial_bytes_available
+
+
+class Console:
+    """Reads commands typed on the serial console while the pipeline runs.
+
+    ``input()`` would stop every task until Enter is pressed, so this takes
+    only the characters already waiting, echoes them and passes each whole
+    line to ``handler``.
+
+    Args:
+        logger: Logger instance.
+        handler: Called with each line typed, stripped.
+        available: Returns how many characters are waiting. By default the
+            USB serial console's.
+        read: Reads that many characters.
+        interval: Seconds between looks at the console.
+    """
+
+    def __init__(
+        self,
+        logger,
+        handler,
+        available=None,
+        read=None,
+        interval: float = 0.05,
+    ) -> None:
+        if available is None:
+            if supervisor is None:
+                raise RuntimeError("no serial console to read from")
+            available = _serial_bytes_available
+        if read is None:
+            read = sys.stdin.read
+        self._log = logger
+        self._handler = handler
+        self._available = available
+        self._read = read
+        self.interval: float = interval
+        self._line: list = []
+
+    def poll(self) -> None:
+        """Handle what has been typed since the last call."""
+        while self._available():
+            char = self._read(1)
+            print(char, end="")
+            if char not in "\r\n":
+                self._line.append(char)
+                continue
+            line = "".join(self._line).strip()
+            self._line = []
+            if not line:
+                continue
+            try:
+                self._handler(line)
+            except Exception as e:
+                self._log.error("Console command failed", e, line=line)
+
+    async def run(self) -> None:
+        while True:
+            self.poll()
+            await asyncio.sleep(self.interval)
+
+
+class DecodedPacketManager:
+    """Wraps the ground station's packet manager for ``GroundStation.run``,
+    which shows what it receives as text: beacons come out decoded, as JSON,
+    image chunks go to ``on_chunk`` instead, and anything else comes out as
+    it came.
+
+    Anything other than ``listen`` is passed through to the wrapped packet
+    manager.
+
+    Args:
+        packet_manager: The packet manager to wrap.
+        decoder: Decodes each message, a new :class:`MessageDecoder` by
+            default.
+        on_chunk: Called with each image chunk packet, such as
+            ``ImageReassembler.on_packet``, or None to pass chunks on.
+    """
+
+    def __init__(self, packet_manager, decoder=None, on_chunk=None) -> None:
+        self._packet_manager = packet_manager
+        self._decoder = decoder if decoder is not None else MessageDecoder()
+        self._on_chunk = on_chunk
+
+    def __getattr__(self, name: str):
+        return getattr(self._packet_manager, name)
+
+    def listen(self, *args, **kwargs) -> bytes | None:
+        message = self._packet_manager.listen(*args, **kwargs)
+        if message is None:
+            return None
+        record = self._decoder(message)
+        if record["kind"] == "beacon":
+            return json.dumps(record["beacon"]).encode("utf-8")
+        if record["kind"] == "image" and self._on_chunk is not None:
+            self._on_chunk(message)
+            return None
+        return message
+
+
+class MessageDecoder:
+    """Decodes what the satellite sends into a dict for storing and display.
+
+    Beacons of every schema are decoded, keeping delta beacon state; image
+    chunks are summarised, their data being kept by ``image_reassembly``;
+    other messages are JSON, such as command results and upload status, text
+    or binary. ``kind`` says which, and ``received`` is ``time.time()`` when
+    decoded.
+    """
+
+    def __init__(self) -> None:
+        self.beacons: DeltaBeaconDecoder = DeltaBeaconDecoder()
+
+    def __call__(self, message) -> dict:
+        message = bytes(message)
+        record = {"received": time.time(), "size": len(message)}
+        chunk = unpack_chunk(message)
+        if chunk is not None:
+            image_id, number, chunk_size, size, _ = chunk
+            record["kind"] = "image"
+            record["image"] = image_id
+            record["chunk"] = number
+            record["chunks"] = chunk_count(size, chunk_size)
+            return record
+        try:
+            record["beacon"] = self.beacons.decode(message)
+            record["kind"] = "beacon"
+            return record
+        except BeaconDecodeError:
+            pass
+        try:
+            text = message.decode("utf-8")
+        except UnicodeError:
+            record["kind"] = "binary"
+            record["hex"] = binascii.hexlify(message).decode()
+            return record
+        try:
+            record["json"] = json.loads(text)
+            record["kind"] = "json"
+        except ValueError:
+            record["kind"] = "text"
+            record["text"] = text
+        return record
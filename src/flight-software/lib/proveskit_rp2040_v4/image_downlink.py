@@ -0,0 +1,77 @@
+"""Image downlink in independent chunks, resent by range across passes.
+
+A ``bulk_transfer`` needs the ground station to acknowledge every burst
+while the satellite is overhead. An image can take several passes, and each
+pass loses different packets, so images go down as chunks that stand on
+their own: every chunk packet says which image it belongs to, where it goes
+and how big the whole image is. The ground station puts them together in
+whatever order they come, see ``image_reassembly``, and asks for the ranges
+it is still missing on the next pass.
+
+Images are the files ``<id>.jpg`` in the satellite's image directory.
+
+Packets:
+    CHUNK: ``CHUNK_FORMAT`` header, then the chunk.
+        type, image id, chunk number, chunk size, image size
+
+Command:
+    ``downlink_image`` takes the image id, the chunk size, 0 for the
+    largest that fits a packet, and the ranges to send, packed with
+    :func:`pack_ranges` after the arguments of the binary command. No ranges
+    sends the whole image. The chunk size must stay the same for one image,
+    since chunk numbers count in it.
+"""
+
+import struct
+
+from .markers import TYPE_CHUNK
+
+CHUNK_FORMAT = "<BHHHI"
+CHUNK_HEADER_LENGTH = struct.calcsize(CHUNK_FORMAT)
+
+# First chunk and number of chunks
+RANGE_FORMAT = "<HH"
+RANGE_LENGTH = struct.calcsize(RANGE_FORMAT)
+
+
+def image_path(directory: str, image_id: int) -> str:
+    return f"{directory.rstrip('/')}/{image_id}.jpg"
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    return (size + chunk_size - 1) // chunk_size
+
+
+def pack_chunk(
+    image_id: int, chunk: int, chunk_size: int, size: int, data: bytes
+) -> bytes:
+    return (
+        struct.pack(CHUNK_FORMAT, TYPE_CHUNK, image_id, chunk, chunk_size, size) + data
+    )
+
+
+def unpack_chunk(packet: bytes) -> tuple | None:
+    """The image id, chunk number, chunk size, image size and data of a
+    chunk packet, or None if it is not one."""
+    if len(packet) < CHUNK_HEADER_LENGTH or packet[0] != TYPE_CHUNK:
+        return None
+    _, image_id, chunk, chunk_size, size = struct.unpack_from(CHUNK_FORMAT, packet)
+    if chunk_size == 0:
+        return None
+    return image_id, chunk, chunk_size, size, packet[CHUNK_HEADER_LENGTH:]
+
+
+def pack_ranges(ranges) -> bytes:
+    """``(first, count)`` pairs for the ``downlink_image`` command."""
+    return b"".join(struct.pack(RANGE_FORMAT, first, count) for first, count in ranges)
+
+
+def unpack_ranges(data) -> list:
+    """Undo :func:`pack_ranges`. A list of pairs, as in a JSON command, is
+    returned as it is."""
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        return [(int(first), int(count)) for first, count in data]
+    return [
+        struct.unpack_from(RANGE_FORMAT, data, offset)
+        for offset in range(0, len(data) - RANGE_LENGTH + 1, RANGE_LENGTH)
+    ]
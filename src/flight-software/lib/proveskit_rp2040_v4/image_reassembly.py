@@ -0,0 +1,468 @@
+"""Ground station reassembly of images downlinked in chunks.
+
+Chunks of an ``image_downlink`` arrive out of order, more than once or not
+at all, over several passes. :class:`ImageReassembler` writes each new chunk
+at its offset in ``<id>.part`` and keeps which ones it holds in a bitmap,
+saved with the image's size and chunk size in ``<id>.map``, so a partial
+image carries on after a restart. Chunks are written ``flush_every`` at a
+time, the map after them, so a restart loses at most the chunks not yet
+written, and those are asked for again.
+
+Memory:
+    Only ``max_open`` images are held open, each with its bitmap, one bit
+    per chunk, and the chunks not yet written. A chunk for another image
+    closes the one that has gone longest without a chunk and loads the
+    other's map, so any number of images can be in progress at once.
+
+Resend:
+    :meth:`ImageReassembler.resend_ranges` gives the chunk size and the
+    ranges still missing, for the ``downlink_image`` command. When there are
+    more ranges than fit in the command, those with the smallest gaps
+    between them are merged, which resends the fewest chunks already held.
+
+Preview:
+    Once the chunks held in order from the start go past a JPEG's headers
+    into its first scan, that prefix with an end of image marker appended is
+    written to ``<id>.preview.jpg``, and written again every
+    ``preview_every`` chunks the prefix grows by. Decoders show it as the
+    top of a baseline image or a coarse whole progressive one.
+
+Complete:
+    Once every chunk is in, ``<id>.part`` is renamed ``<id>.jpg`` and its map
+    and preview are removed. Chunks for a complete image are counted as
+    duplicates.
+
+Map file:
+    ``MAP_FORMAT`` header (image id, image size, chunk size), the bitmap
+    with bit ``i % 8`` of byte ``i // 8`` for chunk ``i``, and the CRC-16 of
+    everything before it.
+
+Only the ground station runs this; ``make build`` leaves it out of the flight
+artifact, see ``GROUND_ONLY_MODULES`` in the Makefile.
+"""
+
+import binascii
+import os
+import struct
+
+from .image_downlink import chunk_count, image_path, unpack_chunk
+
+MAP_FORMAT = "<HIH"
+MAP_HEADER_LENGTH = struct.calcsize(MAP_FORMAT)
+
+_PART_SUFFIX = ".part"
+_MAP_SUFFIX = ".map"
+_PREVIEW_SUFFIX = ".preview.jpg"
+
+_SOI = b"\xff\xd8"
+_EOI = b"\xff\xd9"
+_SOS = 0xDA
+
+# Bytes copied at a time into a preview
+_COPY_BLOCK = 512
+
+DEFAULT_MAX_OPEN = 4
+
+
+def _crc16(data: bytes) -> int:
+    return binascii.crc32(data) & 0xFFFF
+
+
+def _exists(path: str) -> bool:
+    try:
+        os.stat(path)
+    except OSError:
+        return False
+    return True
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def scan_start(f, length: int) -> int | None:
+    """Where the first scan's data starts in a JPEG file of which only the
+    first ``length`` bytes are known.
+
+    Returns:
+        The offset, None if the headers go on past ``length``, or -1 if the
+        file is not a JPEG.
+    """
+    if length < len(_SOI):
+        return None
+    f.seek(0)
+    if f.read(len(_SOI)) != _SOI:
+        return -1
+    offset = len(_SOI)
+    while offset + 4 <= length:
+        f.seek(offset)
+        marker = f.read(4)
+        if marker[0] != 0xFF:
+            return -1
+        if marker[1] == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        end = offset + 2 + struct.unpack_from(">H", marker, 2)[0]
+        if marker[1] == _SOS:
+            return end if end <= length else None
+        offset = end
+    return None
+
+
+class ImageStats:
+    """Counters for an :class:`ImageReassembler`."""
+
+    def __init__(self) -> None:
+        self.packets: int = 0
+        self.chunks: int = 0
+        self.duplicates: int = 0
+        self.rejected: int = 0
+        self.previews: int = 0
+        self.completed: int = 0
+        self.evicted: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "packets": self.packets,
+            "chunks": self.chunks,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "previews": self.previews,
+            "completed": self.completed,
+            "evicted": self.evicted,
+        }
+
+
+class PartialImage:
+    """The chunks of one image held so far.
+
+    Args:
+        image_id: The image's id.
+        size: The image's size in bytes.
+        chunk_size: Bytes per chunk, the last one excepted.
+        bitmap: The chunks held, or None for none.
+    """
+
+    def __init__(self, image_id: int, size: int, chunk_size: int, bitmap=None) -> None:
+        self.image_id: int = image_id
+        self.size: int = size
+        self.chunk_size: int = chunk_size
+        self.total: int = chunk_count(size, chunk_size)
+        self.bitmap: bytearray = (
+            bytearray(bitmap)
+            if bitmap is not None
+            else bytearray((self.total + 7) // 8)
+        )
+        self.received: int = sum(self.has(chunk) for chunk in range(self.total))
+        # Chunks held in order from the start
+        self.cumulative: int = 0
+        self.advance()
+        # Chunks not yet written, by number
+        self.pending: dict = {}
+        self.file = None
+        # Where the first scan starts, once known, or -1 if not a JPEG
+        self.scan_start: int | None = None
+        self.previewed: int = 0
+
+    @property
+    def done(self) -> bool:
+        return self.received >= self.total
+
+    def has(self, chunk: int) -> bool:
+        return bool(self.bitmap[chunk >> 3] & (1 << (chunk & 7)))
+
+    def add(self, chunk: int) -> None:
+        self.bitmap[chunk >> 3] |= 1 << (chunk & 7)
+        self.received += 1
+        self.advance()
+
+    def advance(self) -> None:
+        while self.cumulative < self.total and self.has(self.cumulative):
+            self.cumulative += 1
+
+    def prefix_length(self) -> int:
+        return min(self.cumulative * self.chunk_size, self.size)
+
+    def missing(self) -> list:
+        """``(first, count)`` for each run of chunks not held."""
+        ranges = []
+        first = None
+        for chunk in range(self.cumulative, self.total + 1):
+            held = chunk == self.total or self.has(chunk)
+            if first is None and not held:
+                first = chunk
+            elif first is not None and held:
+                ranges.append((first, chunk - first))
+                first = None
+        return ranges
+
+
+class ImageReassembler:
+    """Puts downlinked images together from their chunks on disk.
+
+    ``on_packet`` takes any received packet, so this can be a ground
+    pipeline stage fed by the receiver.
+
+    Args:
+        logger: Logger instance.
+        directory: Where images and partial images are kept. Created if it
+            does not exist.
+        max_open: Images held in memory at most.
+        flush_every: Chunks held before they are written.
+        preview_every: Chunks the decodable prefix grows by between previews.
+    """
+
+    def __init__(
+        self,
+        logger,
+        directory: str = "/images",
+        max_open: int = DEFAULT_MAX_OPEN,
+        flush_every: int = 8,
+        preview_every: int = 16,
+    ) -> None:
+        self._log = logger
+        self.directory: str = directory.rstrip("/")
+        self.max_open: int = max_open
+        self.flush_every: int = flush_every
+        self.preview_every: int = preview_every
+        self.stats: ImageStats = ImageStats()
+        # Open images by id, and their ids least recently used first
+        self._open: dict = {}
+        self._order: list = []
+
+        try:
+            os.listdir(self.directory)
+        except OSError:
+            try:
+                os.mkdir(self.directory)
+            except OSError as e:
+                self._log.error("Cannot create image directory", e)
+
+    def _path(self, image_id: int, suffix: str) -> str:
+        return f"{self.directory}/{image_id}{suffix}"
+
+    def _load(self, image_id: int) -> PartialImage | None:
+        """The partial image in ``<id>.map``, if there is a good one."""
+        try:
+            with open(self._path(image_id, _MAP_SUFFIX), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        body = data[:-2]
+        if len(data) >= MAP_HEADER_LENGTH + 2:
+            (crc16,) = struct.unpack_from("<H", data, len(body))
+            stored_id, size, chunk_size = struct.unpack_from(MAP_FORMAT, body)
+            if (
+                crc16 == _crc16(body)
+                and stored_id == image_id
+                and chunk_size > 0
+                and len(body) - MAP_HEADER_LENGTH
+                == (chunk_count(size, chunk_size) + 7) // 8
+                and _exists(self._path(image_id, _PART_SUFFIX))
+            ):
+                return PartialImage(
+                    image_id, size, chunk_size, body[MAP_HEADER_LENGTH:]
+                )
+        self._log.info("Discarding corrupt image bitmap", image=image_id)
+        self.discard(image_id)
+        return None
+
+    def _persist(self, image: PartialImage) -> None:
+        body = (
+            struct.pack(MAP_FORMAT, image.image_id, image.size, image.chunk_size)
+            + image.bitmap
+        )
+        with open(self._path(image.image_id, _MAP_SUFFIX), "wb") as f:
+            f.write(body + struct.pack("<H", _crc16(body)))
+
+    def _get(self, image_id: int, size: int, chunk_size: int) -> PartialImage | None:
+        """The open image, opening or starting it. None if it is complete."""
+        image = self._open.get(image_id)
+        if image is not None:
+            self._order.remove(image_id)
+            self._order.append(image_id)
+        else:
+            image = self._load(image_id)
+            if image is None:
+                if _exists(image_path(self.directory, image_id)):
+                    return None
+                image = PartialImage(image_id, size, chunk_size)
+                with open(self._path(image_id, _PART_SUFFIX), "wb"):
+                    pass
+                self._persist(image)
+            while len(self._order) >= self.max_open:
+                self.stats.evicted += 1
+                self._close(self._order[0])
+            image.file = open(self._path(image_id, _PART_SUFFIX), "r+b")
+            self._open[image_id] = image
+            self._order.append(image_id)
+
+        if (image.size, image.chunk_size) != (size, chunk_size):
+            # Asked for again with another chunk size; chunk numbers no
+            # longer line up with what is held
+            self._log.info(
+                "Restarting image with new chunking",
+                image=image_id,
+                size=size,
+                chunk_size=chunk_size,
+            )
+            self.discard(image_id)
+            return self._get(image_id, size, chunk_size)
+        return image
+
+    def _flush(self, image: PartialImage) -> None:
+        if not image.pending:
+            return
+        for chunk in sorted(image.pending):
+            image.file.seek(chunk * image.chunk_size)
+            image.file.write(image.pending[chunk])
+        # What the bitmap records must already be in the file
+        image.file.flush()
+        self._persist(image)
+        image.pending = {}
+
+    def _close(self, image_id: int) -> None:
+        image = self._open.pop(image_id)
+        self._order.remove(image_id)
+        self._flush(image)
+        image.file.close()
+
+    def on_packet(self, packet) -> None:
+        """Take a chunk packet. Anything else is ignored."""
+        unpacked = unpack_chunk(packet)
+        if unpacked is None:
+            return
+        image_id, chunk, chunk_size, size, data = unpacked
+        self.stats.packets += 1
+
+        total = chunk_count(size, chunk_size)
+        if chunk >= total or len(data) != min(chunk_size, size - chunk * chunk_size):
+            self.stats.rejected += 1
+            return
+        image = self._get(image_id, size, chunk_size)
+        if image is None or image.has(chunk):
+            self.stats.duplicates += 1
+            return
+
+        image.pending[chunk] = bytes(data)
+        image.add(chunk)
+        self.stats.chunks += 1
+
+        if image.done:
+            self._complete(image)
+            return
+        if len(image.pending) >= self.flush_every:
+            self._flush(image)
+        if image.cumulative > image.previewed and (
+            not image.previewed
+            or image.cumulative - image.previewed >= self.preview_every
+        ):
+            self._preview(image)
+
+    def _preview(self, image: PartialImage) -> None:
+        """Write the decodable prefix of the image, if there is one yet."""
+        if image.scan_start == -1:
+            return
+        self._flush(image)
+        length = image.prefix_length()
+        if image.scan_start is None:
+            image.scan_start = scan_start(image.file, length)
+        if image.scan_start is None or image.scan_start == -1:
+            return
+        if length <= image.scan_start:
+            return
+
+        image.file.seek(length - 1)
+        if image.file.read(1) == b"\xff":
+            # Half a marker
+            length -= 1
+        image.file.seek(0)
+        with open(self._path(image.image_id, _PREVIEW_SUFFIX), "wb") as f:
+            copied = 0
+            while copied < length:
+                block = image.file.read(min(_COPY_BLOCK, length - copied))
+                f.write(block)
+                copied += len(block)
+            f.write(_EOI)
+        image.previewed = image.cumulative
+        self.stats.previews += 1
+        self._log.info(
+            "Wrote image preview",
+            image=image.image_id,
+            bytes=length,
+            size=image.size,
+        )
+
+    def _complete(self, image: PartialImage) -> None:
+        self._close(image.image_id)
+        path = image_path(self.directory, image.image_id)
+        _remove(path)
+        os.rename(self._path(image.image_id, _PART_SUFFIX), path)
+        _remove(self._path(image.image_id, _MAP_SUFFIX))
+        _remove(self._path(image.image_id, _PREVIEW_SUFFIX))
+        self.stats.completed += 1
+        self._log.info(
+            "Image complete", image=image.image_id, path=path, bytes=image.size
+        )
+
+    def resend_ranges(self, image_id: int, max_ranges: int | None = None) -> tuple:
+        """What to ask for on the next pass.
+
+        Args:
+            image_id: The image.
+            max_ranges: Ranges that fit in one command, or None for no limit.
+
+        Returns:
+            The chunk size and the ``(first, count)`` ranges missing, merged
+            down to ``max_ranges``: ``(0, [])`` for the whole image if none of
+            it has arrived, or None if it is complete.
+        """
+        image = self._open.get(image_id) or self._load(image_id)
+        if image is None:
+            if _exists(image_path(self.directory, image_id)):
+                return None
+            return 0, []
+
+        ranges = image.missing()
+        while max_ranges is not None and len(ranges) > max(max_ranges, 1):
+            # Merge across the smallest gap
+            gaps = [
+                ranges[i + 1][0] - ranges[i][0] - ranges[i][1]
+                for i in range(len(ranges) - 1)
+            ]
+            i = gaps.index(min(gaps))
+            first = ranges[i][0]
+            ranges[i : i + 2] = [(first, ranges[i + 1][0] + ranges[i + 1][1] - first)]
+        return image.chunk_size, ranges
+
+    def flush(self) -> None:
+        """Write every chunk held."""
+        for image in self._open.values():
+            self._flush(image)
+
+    def close(self) -> None:
+        while self._order:
+            self._close(self._order[0])
+
+    def discard(self, image_id: int) -> None:
+        """Forget a partial image and delete its files."""
+        image = self._open.pop(image_id, None)
+        if image is not None:
+            self._order.remove(image_id)
+            image.file.close()
+        for suffix in (_PART_SUFFIX, _MAP_SUFFIX, _PREVIEW_SUFFIX):
+            _remove(self._path(image_id, suffix))
+
+    def status(self) -> dict:
+        """Counters and the progress of open images, for logging."""
+        status = self.stats.to_dict()
+        status["open"] = {
+            image_id: [image.received, image.total]
+            for image_id, image in self._open.items()
+        }
+        return status
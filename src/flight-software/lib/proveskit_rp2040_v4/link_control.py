@@ -0,0 +1,378 @@
+"""Adaptive LoRa spreading factor and coding rate from measured signal quality.
+
+:class:`LinkController` wraps the radio the same way ``FECRadio`` does. It
+records the RSSI and SNR of every packet it receives, and control packets
+carry the peer's reading back. From the worst recent SNR it picks the fastest
+profile in ``PROFILES`` that still leaves ``margin`` dB above that profile's
+demodulation floor. SNR is measured in the channel
+bandwidth, so a reading taken at one spreading factor predicts the others.
+
+Both ends must change modulation together, so a change is a three-way
+handshake sent at the current settings:
+
+1. The satellite sends PROPOSE with the new profile and its SNR reading.
+2. The ground station answers ACCEPT with its own reading of the satellite's
+   signal, then switches.
+3. The satellite switches and sends CONFIRM at the new settings, and the
+   ground station echoes CONFIRM.
+
+If the CONFIRM exchange does not complete within ``handshake_timeout``, each
+side returns to the profile it had before. If either side hears nothing at
+all for ``silence_timeout``, it falls back to the defaults from config.json.
+Both sides apply that rule, so they meet again on the defaults.
+
+A change is proposed straight away when the current profile falls below
+``min_delivery``. Otherwise it waits for a full history, ``hold`` seconds
+after the last change, and a predicted gain of at least ``UPGRADE_GAIN``.
+
+Control packets:
+    ``CONTROL_FORMAT``: type, handshake id, profile index, SNR in quarter dB.
+"""
+
+import struct
+import time
+
+from .airtime import DEFAULT_BANDWIDTH, symbol_time, time_on_air
+from .markers import TYPE_ACCEPT, TYPE_CONFIRM, TYPE_PROPOSE
+
+CONTROL_FORMAT = "<BBBb"
+CONTROL_LENGTH = struct.calcsize(CONTROL_FORMAT)
+
+# (spreading factor, coding rate denominator), fastest first
+PROFILES = (
+    (7, 5),
+    (8, 5),
+    (8, 8),
+    (9, 8),
+    (10, 8),
+    (11, 8),
+)
+
+# Lowest SNR in dB each spreading factor demodulates at, from the SX1276 datasheet
+DEMODULATION_FLOOR = {
+    7: -7.5,
+    8: -10.0,
+    9: -12.5,
+    10: -15.0,
+    11: -17.5,
+    12: -20.0,
+}
+
+# Extra SNR in dB the weakest coding rate needs to get through fading as well
+# as 4/8 does
+CODING_RATE_PENALTY = 1.0
+
+
+def required_snr(spreading_factor: int, coding_rate: int) -> float:
+    """SNR in dB a profile needs, before any margin."""
+    penalty = CODING_RATE_PENALTY * (8 - coding_rate) / 3
+    return DEMODULATION_FLOOR[spreading_factor] + penalty
+
+
+# Packet length the profiles' data rates are compared at
+REFERENCE_PACKET_LENGTH = 128
+
+_PROFILE_AIRTIME = tuple(
+    time_on_air(REFERENCE_PACKET_LENGTH, spreading_factor, coding_rate)
+    for spreading_factor, coding_rate in PROFILES
+)
+
+# Predicted improvement needed before changing profile without being forced to
+UPGRADE_GAIN = 1.2
+
+
+def predict(samples: list, margin: float) -> list:
+    """Predicted delivery ratio and packets per second of each profile.
+
+    Returns:
+        ``(delivery, packets_per_second)`` for each of ``PROFILES``.
+    """
+    predictions = []
+    for (spreading_factor, coding_rate), airtime in zip(PROFILES, _PROFILE_AIRTIME):
+        threshold = required_snr(spreading_factor, coding_rate) + margin
+        delivery = sum(1 for snr in samples if snr >= threshold) / len(samples)
+        predictions.append((delivery, delivery / airtime))
+    return predictions
+
+
+def select_profile(predictions: list, min_delivery: float) -> int:
+    """Index of the profile with the highest predicted packets per second.
+
+    Only profiles with at least ``min_delivery`` are considered. Returns the
+    slowest profile if none qualifies.
+    """
+    best = len(PROFILES) - 1
+    best_rate = 0.0
+    for index, (delivery, rate) in enumerate(predictions):
+        if delivery >= min_delivery and rate > best_rate:
+            best = index
+            best_rate = rate
+    return best
+
+
+class RFM9xModem:
+    """Signal readings and modulation settings of an ``adafruit_rfm9x`` driver.
+
+    Args:
+        driver: The ``adafruit_rfm9x.RFM9x`` instance inside ``RFM9xManager``.
+    """
+
+    def __init__(self, driver) -> None:
+        self._driver = driver
+
+    def signal(self) -> tuple[float, float]:
+        """RSSI in dBm and SNR in dB of the last packet received."""
+        return self._driver.last_rssi, self._driver.last_snr
+
+    def apply(self, spreading_factor: int, coding_rate: int) -> None:
+        self._driver.spreading_factor = spreading_factor
+        self._driver.coding_rate = coding_rate
+        # Required once symbols are longer than 16 ms
+        self._driver.low_datarate_optimize = (
+            symbol_time(spreading_factor, DEFAULT_BANDWIDTH) > 0.016
+        )
+
+
+class LinkStats:
+    """Counters describing link adaptation."""
+
+    def __init__(self) -> None:
+        self.proposals: int = 0
+        self.changes: int = 0
+        self.reverts: int = 0
+        self.fallbacks: int = 0
+        self.last_rssi: float | None = None
+        self.last_snr: float | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "proposals": self.proposals,
+            "changes": self.changes,
+            "reverts": self.reverts,
+            "fallbacks": self.fallbacks,
+            "last_rssi": self.last_rssi,
+            "last_snr": self.last_snr,
+        }
+
+
+class LinkController:
+    """Wraps a radio and adapts its modulation to the link.
+
+    Anything other than ``send`` and ``receive`` is passed through to the
+    wrapped radio.
+
+    Args:
+        logger: Logger instance.
+        link: The radio manager, or a wrapper around it such as ``FECRadio``.
+        modem: Reads signal quality and applies profiles, see
+            :class:`RFM9xModem`.
+        default_profile: ``(spreading_factor, coding_rate)`` from config.json,
+            used at start and after silence.
+        propose: Whether this side proposes changes. Only the satellite
+            does; the ground station follows.
+        margin: dB of SNR a reading needs above a profile's demodulation
+            floor to count as a delivered packet.
+        min_delivery: Lowest predicted delivery ratio a profile may have.
+        history: Number of SNR samples predictions are made from.
+        hold: Seconds to wait after a change before proposing a faster one.
+        handshake_timeout: Seconds to wait for each step of a handshake.
+        silence_timeout: Seconds without a packet before falling back to the
+            default profile.
+        clock: Returns the time in seconds.
+    """
+
+    def __init__(
+        self,
+        logger,
+        link,
+        modem,
+        default_profile: tuple[int, int],
+        propose: bool = True,
+        margin: float = 1.0,
+        min_delivery: float = 0.35,
+        history: int = 5,
+        hold: float = 30.0,
+        handshake_timeout: float = 5.0,
+        silence_timeout: float = 120.0,
+        clock=time.monotonic,
+    ) -> None:
+        self._log = logger
+        self._link = link
+        self._modem = modem
+        self._clock = clock
+        self.default_profile: tuple[int, int] = default_profile
+        self.propose: bool = propose
+        self.margin: float = margin
+        self.min_delivery: float = min_delivery
+        self.history: int = history
+        self.hold: float = hold
+        self.handshake_timeout: float = handshake_timeout
+        self.silence_timeout: float = silence_timeout
+
+        self.profile: tuple[int, int] = default_profile
+        self._samples: list = []
+        self._last_heard: float = clock()
+        self._last_change: float = self._last_heard
+
+        self._handshake_id: int = 0
+        # None, "proposed" or "switched"
+        self._state: str | None = None
+        self._pending: int = 0
+        self._previous: tuple[int, int] = default_profile
+        self._deadline: float = 0.0
+
+        self.stats: LinkStats = LinkStats()
+
+    def __getattr__(self, name: str):
+        return getattr(self._link, name)
+
+    def estimate(self) -> float | None:
+        """Worst recent SNR in dB, or None without samples."""
+        return min(self._samples) if self._samples else None
+
+    def _add_sample(self, snr: float) -> None:
+        self._samples.append(snr)
+        if len(self._samples) > self.history:
+            self._samples.pop(0)
+
+    def _apply(self, profile: tuple[int, int]) -> None:
+        if profile != self.profile:
+            self._modem.apply(*profile)
+            self.profile = profile
+            self._last_change = self._clock()
+
+    def _send_control(self, kind: int, profile: int) -> None:
+        snr = self.stats.last_snr if self.stats.last_snr is not None else 0.0
+        quarter_db = max(-128, min(127, int(snr * 4)))
+        self._link.send(
+            struct.pack(CONTROL_FORMAT, kind, self._pending, profile, quarter_db)
+        )
+
+    def _check_timeouts(self, now: float) -> None:
+        if self._state is not None and now > self._deadline:
+            if self._state == "switched":
+                self._apply(self._previous)
+                self.stats.reverts += 1
+                self._log.info("Link change not confirmed, reverting")
+            self._state = None
+
+        if now - self._last_heard > self.silence_timeout:
+            if self.profile != self.default_profile:
+                self._apply(self.default_profile)
+                self.stats.fallbacks += 1
+                self._log.info("Link silent, falling back to defaults")
+            self._state = None
+            self._samples = []
+            self._last_heard = now
+
+    def update(self) -> None:
+        """Handle timeouts and propose a new profile if the link calls for one.
+
+        Call this regularly, at a time the ground station is listening.
+        """
+        now = self._clock()
+        self._check_timeouts(now)
+
+        if not self.propose or self._state is not None or not self._samples:
+            return
+
+        predictions = predict(self._samples, self.margin)
+        target = select_profile(predictions, self.min_delivery)
+        current = (
+            PROFILES.index(self.profile)
+            if self.profile in PROFILES
+            else len(PROFILES) - 1
+        )
+        if target == current:
+            return
+        forced = predictions[current][0] < self.min_delivery
+        if not forced and (
+            len(self._samples) < self.history
+            or now - self._last_change < self.hold
+            or predictions[target][1] < UPGRADE_GAIN * predictions[current][1]
+        ):
+            return
+
+        self._handshake_id = (self._handshake_id + 1) & 0xFF
+        self._pending = self._handshake_id
+        self._state = "proposed"
+        self._deadline = now + self.handshake_timeout
+        self.stats.proposals += 1
+        self._send_control(TYPE_PROPOSE, target)
+
+    def _on_control(self, packet: bytes) -> None:
+        kind, handshake_id, index, quarter_db = struct.unpack(CONTROL_FORMAT, packet)
+        if index >= len(PROFILES):
+            return
+        # The peer's reading of our signal counts as much as ours of theirs
+        self._add_sample(quarter_db / 4)
+        now = self._clock()
+
+        if kind == TYPE_PROPOSE:
+            self._pending = handshake_id
+            self._send_control(TYPE_ACCEPT, index)
+            self._previous = self.profile
+            self._apply(PROFILES[index])
+            self._state = "switched"
+            self._deadline = now + self.handshake_timeout
+
+        elif (
+            kind == TYPE_ACCEPT
+            and self._state == "proposed"
+            and handshake_id == self._pending
+        ):
+            self._previous = self.profile
+            self._apply(PROFILES[index])
+            self._state = "switched"
+            self._deadline = now + self.handshake_timeout
+            self._send_control(TYPE_CONFIRM, index)
+
+        elif (
+            kind == TYPE_CONFIRM
+            and self._state == "switched"
+            and handshake_id == self._pending
+        ):
+            if not self.propose:
+                self._send_control(TYPE_CONFIRM, index)
+            self._state = None
+            self.stats.changes += 1
+            self._log.info(
+                "Link profile changed",
+                spreading_factor=self.profile[0],
+                coding_rate=self.profile[1],
+                snr=self.estimate(),
+            )
+
+    def send(self, data) -> bool:
+        return self._link.send(data)
+
+    def receive(self, *args, **kwargs) -> bytes | None:
+        """Receive a packet, handling link control packets internally.
+
+        Returns:
+            The packet, or None if nothing was received or it was a control
+            packet.
+        """
+        packet = self._link.receive(*args, **kwargs)
+        if packet is None:
+            self._check_timeouts(self._clock())
+            return None
+
+        self._last_heard = self._clock()
+        rssi, snr = self._modem.signal()
+        self.stats.last_rssi = rssi
+        self.stats.last_snr = snr
+        self._add_sample(snr)
+
+        if len(packet) == CONTROL_LENGTH and TYPE_PROPOSE <= packet[0] <= TYPE_CONFIRM:
+            self._on_control(packet)
+            return None
+        return packet
+
+    def status(self) -> dict:
+        """Current profile and counters, for logging."""
+        status = self.stats.to_dict()
+        status["spreading_factor"] = self.profile[0]
+        status["coding_rate"] = self.profile[1]
+        status["snr_estimate"] = self.estimate()
+        return status
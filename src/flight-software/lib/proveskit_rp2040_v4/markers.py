@@ -0,0 +1,74 @@
+"""First bytes of everything sent over the air.
+
+Both ends tell messages apart by their first byte, so every protocol that
+shares the link gets its own bytes, defined here and listed in ``MARKERS``.
+The modules that send them import them from here. Importing this module
+checks that no byte is claimed twice, so a collision fails on the ground
+station and in the host scripts before it flies.
+
+Bytes ``0x80`` to ``0xBF`` are UTF-8 continuation bytes, which text and JSON
+never start with, so new markers should come from the free bytes there.
+"""
+
+# Beacon schemas, see ``beacon_codec``
+SCHEMA_STRUCT_V1 = 0x01
+SCHEMA_KEYFRAME_V1 = 0x02
+SCHEMA_DELTA_V1 = 0x03
+SCHEMA_MSGPACK_V1 = 0x81
+
+# JSON commands and responses
+JSON_MARKER = ord("{")
+
+# Bulk transfer packets, see ``bulk_transfer``
+TYPE_DATA = 0x91
+TYPE_ACK = 0x92
+
+# Frame bytes, with flags in the low nibble, see ``framing``
+FRAME_MARKER = 0xA0
+
+# Binary commands, see ``commands``
+OPCODE_MARKER = 0xB1
+
+# Image chunks, see ``image_downlink``
+TYPE_CHUNK = 0xB3
+
+# Link control packets, see ``link_control``
+TYPE_PROPOSE = 0xC1
+TYPE_ACCEPT = 0xC2
+TYPE_CONFIRM = 0xC3
+
+# (what, first byte, last byte) of every marker
+MARKERS = (
+    ("struct beacon", SCHEMA_STRUCT_V1, SCHEMA_STRUCT_V1),
+    ("keyframe beacon", SCHEMA_KEYFRAME_V1, SCHEMA_KEYFRAME_V1),
+    ("delta beacon", SCHEMA_DELTA_V1, SCHEMA_DELTA_V1),
+    ("msgpack beacon", SCHEMA_MSGPACK_V1, SCHEMA_MSGPACK_V1),
+    ("JSON", JSON_MARKER, JSON_MARKER),
+    ("bulk data", TYPE_DATA, TYPE_DATA),
+    ("bulk acknowledgement", TYPE_ACK, TYPE_ACK),
+    ("frame", FRAME_MARKER, FRAME_MARKER | 0x0F),
+    ("binary command", OPCODE_MARKER, OPCODE_MARKER),
+    ("image chunk", TYPE_CHUNK, TYPE_CHUNK),
+    ("link control propose", TYPE_PROPOSE, TYPE_PROPOSE),
+    ("link control accept", TYPE_ACCEPT, TYPE_ACCEPT),
+    ("link control confirm", TYPE_CONFIRM, TYPE_CONFIRM),
+)
+
+
+def check(markers: tuple = MARKERS) -> None:
+    """Check that no byte is the marker of two things.
+
+    Raises:
+        ValueError: Naming both and the byte, if one is.
+    """
+    taken = {}
+    for name, first, last in markers:
+        for byte in range(first, last + 1):
+            if byte in taken:
+                raise ValueError(
+                    "{} and {} both start with 0x{:02X}".format(taken[byte], name, byte)
+                )
+            taken[byte] = name
+
+
+check()
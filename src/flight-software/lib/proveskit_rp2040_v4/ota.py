@@ -0,0 +1,480 @@
+"""Delta updates of the flight software over the air.
+
+The ground station builds an update bundle with ``scripts/make_patch.py``
+from the artifact last deployed to the satellite and the new one, uploads it
+with ``upload_file`` and sends the ``apply_update`` command with the
+bundle's path. Only the bytes that changed go up: each file is rebuilt from
+the copy already on the satellite.
+
+Applying an update:
+    :meth:`Updater.stage` checks that every file the bundle patches is the
+    one it was built against, rebuilds each into the staging directory and
+    checks the result's CRC-32 and, where ``hashlib`` exists, its SHA-256.
+    Nothing outside the staging directory is touched until every file has
+    passed.
+
+    :meth:`Updater.install` writes a journal, renames each file it replaces
+    to ``.old`` and the staged file into its place, then marks the update as
+    on trial. The satellite then resets into the new software.
+
+Trial boots:
+    ``main.py`` calls :func:`boot_check` before importing anything else. A
+    reset in the middle of installing rolls the update back, and so does
+    every boot past ``MAX_TRIAL_BOOTS`` that did not get as far as
+    :meth:`Updater.confirm`, which the main loop calls once it has run. A
+    confirmed update removes the ``.old`` files and records the new hashes
+    in the deploy manifest, so ``scripts/deploy.py`` sees what is on the
+    board.
+
+Bundle:
+    ``BUNDLE_FORMAT`` header (``MAGIC``, entry count), then per file an
+    ``ENTRY_FORMAT`` header (kind, flags, path length, old size, old CRC-32,
+    new size, new CRC-32, new SHA-256, body length), its path relative to
+    the board's root and its body. With ``FLAG_DEFLATE`` the body is raw
+    DEFLATE with a ``2**WINDOW_BITS`` byte window.
+
+    A body is a list of operations, each starting with a byte: ``OP_COPY``
+    then the zigzag varint distance from the end of the previous copy and
+    the varint length, to copy from the old file, or ``OP_ADD`` then the
+    varint length and the bytes themselves. A file the satellite does not
+    have yet is patched against an empty file. ``KIND_DELETE`` entries have
+    no body.
+"""
+
+import binascii
+import json
+import os
+import struct
+
+from . import deflate
+from .commands import UPDATE_DIRECTORY
+
+try:
+    import hashlib
+except ImportError:
+    hashlib = None
+
+MAGIC = b"OTA1"
+BUNDLE_FORMAT = "<4sB"
+BUNDLE_HEADER_LENGTH = struct.calcsize(BUNDLE_FORMAT)
+ENTRY_FORMAT = "<BBBIIII32sI"
+ENTRY_HEADER_LENGTH = struct.calcsize(ENTRY_FORMAT)
+
+KIND_PATCH = 0
+KIND_DELETE = 1
+
+FLAG_DEFLATE = 0x01
+WINDOW_BITS = 10
+
+OP_COPY = 0
+OP_ADD = 1
+
+DEFAULT_DIRECTORY = UPDATE_DIRECTORY
+JOURNAL_NAME = "journal.json"
+
+# As written by scripts/deploy.py
+MANIFEST_PATH = "/.deploy-manifest.json"
+
+# Boots an update gets to reach the main loop before it is rolled back
+MAX_TRIAL_BOOTS = 2
+
+STATE_INSTALLING = "installing"
+STATE_TRIAL = "trial"
+
+_OLD_SUFFIX = ".old"
+
+# Bytes copied or checked at a time
+_BLOCK = 512
+
+
+def _exists(path: str) -> bool:
+    try:
+        os.stat(path)
+    except OSError:
+        return False
+    return True
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _board_path(path: str) -> str:
+    return "/" + path.lstrip("/")
+
+
+def read_varint(data, pos: int) -> tuple:
+    """Read an unsigned LEB128 varint. Returns the value and the position
+    after it."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def write_varint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def file_crc(path: str) -> tuple:
+    """Size and CRC-32 of a file, or ``(0, 0)`` if it does not exist."""
+    size = crc = 0
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return 0, 0
+    with f:
+        while True:
+            block = f.read(_BLOCK)
+            if not block:
+                return size, crc
+            size += len(block)
+            crc = binascii.crc32(block, crc)
+
+
+class _Output:
+    """Writes the rebuilt file, keeping its size, CRC-32 and SHA-256."""
+
+    def __init__(self, f) -> None:
+        self._file = f
+        self.size = 0
+        self.crc = 0
+        self._sha = hashlib.sha256() if hashlib is not None else None
+
+    def write(self, data) -> None:
+        self._file.write(data)
+        self.size += len(data)
+        self.crc = binascii.crc32(data, self.crc)
+        if self._sha is not None:
+            self._sha.update(data)
+
+    def digest(self) -> bytes | None:
+        return self._sha.digest() if self._sha is not None else None
+
+
+def apply_delta(ops, old, out) -> None:
+    """Rebuild a file from the operations ``ops`` and the ``old`` file.
+
+    Args:
+        ops: The entry's body, decompressed.
+        old: The old file open for reading, or None for an empty one.
+        out: Has ``write(bytes)``.
+
+    Raises:
+        ValueError: If an operation is malformed or reads past the old
+            file.
+    """
+    pos = 0
+    expected = 0
+    try:
+        while pos < len(ops):
+            op = ops[pos]
+            if op == OP_COPY:
+                distance, pos = read_varint(ops, pos + 1)
+                length, pos = read_varint(ops, pos)
+                # Zigzag: even distances forwards, odd ones backwards
+                offset = expected + (
+                    -(distance >> 1) - 1 if distance & 1 else distance >> 1
+                )
+                if old is None or offset < 0:
+                    raise ValueError("copy outside the old file")
+                old.seek(offset)
+                expected = offset + length
+                while length:
+                    block = old.read(min(length, _BLOCK))
+                    if not block:
+                        raise ValueError("copy outside the old file")
+                    out.write(block)
+                    length -= len(block)
+            elif op == OP_ADD:
+                length, pos = read_varint(ops, pos + 1)
+                if pos + length > len(ops):
+                    raise ValueError("truncated add")
+                out.write(ops[pos : pos + length])
+                pos += length
+            else:
+                raise ValueError("unknown operation")
+    except IndexError:
+        raise ValueError("truncated operation")
+
+
+def _read_journal(directory: str) -> dict | None:
+    try:
+        with open(directory + "/" + JOURNAL_NAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_journal(directory: str, journal: dict) -> None:
+    with open(directory + "/" + JOURNAL_NAME, "w") as f:
+        json.dump(journal, f)
+
+
+def _rollback(directory: str, journal: dict) -> None:
+    """Put back every file the journal lists, as it was before the update."""
+    for path, had_old, _, _ in journal["files"]:
+        path = _board_path(path)
+        old = path + _OLD_SUFFIX
+        if had_old:
+            # Without .old the file was never replaced
+            if _exists(old):
+                _remove(path)
+                os.rename(old, path)
+        else:
+            _remove(path)
+    _remove(directory + "/" + JOURNAL_NAME)
+
+
+def on_trial(directory: str = DEFAULT_DIRECTORY) -> bool:
+    """Whether an installed update has yet to reach the main loop."""
+    journal = _read_journal(directory)
+    return journal is not None and journal.get("state") == STATE_TRIAL
+
+
+def boot_check(
+    directory: str = DEFAULT_DIRECTORY, max_boots: int = MAX_TRIAL_BOOTS
+) -> str | None:
+    """Count this boot against an update on trial, rolling it back if it
+    was interrupted or has used up its boots.
+
+    Runs before the logger exists, so it only says what it did.
+
+    Returns:
+        None without an update on trial, ``"trial"`` if this boot runs the
+        update, or ``"rolled_back"``.
+    """
+    journal = _read_journal(directory)
+    if journal is None:
+        return None
+    if journal.get("state") != STATE_TRIAL or journal["boots"] >= max_boots:
+        _rollback(directory, journal)
+        return "rolled_back"
+    journal["boots"] += 1
+    _write_journal(directory, journal)
+    return STATE_TRIAL
+
+
+class UpdateStats:
+    """Counters for an :class:`Updater`."""
+
+    def __init__(self) -> None:
+        self.staged: int = 0
+        self.installed: int = 0
+        self.confirmed: int = 0
+        self.rejected: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "staged": self.staged,
+            "installed": self.installed,
+            "confirmed": self.confirmed,
+            "rejected": self.rejected,
+        }
+
+
+class Updater:
+    """Stages, installs and confirms update bundles.
+
+    Args:
+        logger: Logger instance.
+        directory: Where files are rebuilt and the journal is kept. Created
+            if it does not exist.
+    """
+
+    def __init__(self, logger, directory: str = DEFAULT_DIRECTORY) -> None:
+        self._log = logger
+        self.directory: str = directory.rstrip("/")
+        self.stats: UpdateStats = UpdateStats()
+
+        # (kind, path, staged path, size, SHA-256 hex) of each staged file
+        self._staged: list = []
+
+        try:
+            os.listdir(self.directory)
+        except OSError:
+            try:
+                os.mkdir(self.directory)
+            except OSError as e:
+                self._log.error("Cannot create update staging directory", e)
+
+        journal = _read_journal(self.directory)
+        self.on_trial: bool = (
+            journal is not None and journal.get("state") == STATE_TRIAL
+        )
+        self.boots: int = journal["boots"] if self.on_trial else 0
+
+    def _staging_path(self, index: int) -> str:
+        return f"{self.directory}/{index}.new"
+
+    def _stage_entry(self, index: int, header: tuple, path: str, body) -> tuple:
+        (
+            kind,
+            flags,
+            _,
+            old_size,
+            old_crc,
+            new_size,
+            new_crc,
+            sha256,
+            _,
+        ) = header
+        target = _board_path(path)
+        if (old_size, old_crc) != file_crc(target):
+            raise ValueError("not the file the update was built against: " + path)
+        if kind == KIND_DELETE:
+            return kind, path, None, 0, ""
+        if kind != KIND_PATCH:
+            raise ValueError("unknown entry kind")
+
+        if flags & FLAG_DEFLATE:
+            body = deflate.decompress(body, WINDOW_BITS)
+        staged = self._staging_path(index)
+        old = open(target, "rb") if old_size else None
+        try:
+            with open(staged, "wb") as f:
+                out = _Output(f)
+                apply_delta(body, old, out)
+            digest = out.digest()
+            if (out.size, out.crc) != (new_size, new_crc) or (
+                digest is not None and digest != sha256
+            ):
+                raise ValueError("rebuilt file does not match its hash: " + path)
+        except Exception:
+            _remove(staged)
+            raise
+        finally:
+            if old is not None:
+                old.close()
+        return kind, path, staged, new_size, binascii.hexlify(sha256).decode()
+
+    def stage(self, bundle: str) -> int:
+        """Rebuild every file in ``bundle`` in the staging directory.
+
+        Returns:
+            The number of files the update changes.
+
+        Raises:
+            ValueError: If the bundle is malformed, was built against other
+                files than the satellite has, or a rebuilt file fails its
+                hash check.
+            OSError: If the bundle cannot be read or the staging directory
+                written.
+
+        Whatever was staged is discarded on failure.
+        """
+        self.discard()
+        try:
+            with open(bundle, "rb") as f:
+                magic, count = struct.unpack(
+                    BUNDLE_FORMAT, f.read(BUNDLE_HEADER_LENGTH)
+                )
+                if magic != MAGIC:
+                    raise ValueError("not an update bundle")
+                for index in range(count):
+                    header = struct.unpack(ENTRY_FORMAT, f.read(ENTRY_HEADER_LENGTH))
+                    path = f.read(header[2]).decode("utf-8")
+                    body = f.read(header[-1])
+                    if len(body) != header[-1]:
+                        raise ValueError("truncated bundle")
+                    self._staged.append(self._stage_entry(index, header, path, body))
+        except Exception as e:
+            self.stats.rejected += 1
+            self._log.error("Rejected update bundle", e, bundle=bundle)
+            self.discard()
+            raise
+
+        self.stats.staged += 1
+        self._log.info("Staged update", bundle=bundle, files=len(self._staged))
+        return len(self._staged)
+
+    def install(self) -> None:
+        """Swap the staged files in and put the update on trial.
+
+        The caller resets the satellite afterwards, so that the new software
+        runs.
+        """
+        journal = {
+            "state": STATE_INSTALLING,
+            "boots": 0,
+            "files": [
+                [path, _exists(_board_path(path)), sha256, size]
+                for _, path, _, size, sha256 in self._staged
+            ],
+        }
+        # From here on a reset rolls back whatever was swapped
+        _write_journal(self.directory, journal)
+        for kind, path, staged, _, _ in self._staged:
+            target = _board_path(path)
+            old = target + _OLD_SUFFIX
+            if _exists(target):
+                _remove(old)
+                os.rename(target, old)
+            if kind == KIND_PATCH:
+                os.rename(staged, target)
+
+        journal["state"] = STATE_TRIAL
+        _write_journal(self.directory, journal)
+        self.stats.installed += 1
+        self._log.info("Installed update", files=len(self._staged))
+        self._staged = []
+
+    def confirm(self) -> None:
+        """Keep the update on trial, now that it has reached the main loop.
+
+        Does nothing without one.
+        """
+        if not self.on_trial:
+            return
+        journal = _read_journal(self.directory)
+        self.on_trial = False
+        if journal is None:
+            return
+
+        try:
+            with open(MANIFEST_PATH) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        for path, _, sha256, size in journal["files"]:
+            _remove(_board_path(path) + _OLD_SUFFIX)
+            if manifest is None:
+                continue
+            if sha256:
+                manifest["files"][path] = {"sha256": sha256, "size": size}
+            else:
+                manifest["files"].pop(path, None)
+        if manifest is not None:
+            with open(MANIFEST_PATH, "w") as f:
+                json.dump(manifest, f)
+
+        _remove(self.directory + "/" + JOURNAL_NAME)
+        self.stats.confirmed += 1
+        self._log.info(
+            "Confirmed update", files=len(journal["files"]), boots=self.boots
+        )
+
+    def discard(self) -> None:
+        """Delete whatever is staged."""
+        for _, _, staged, _, _ in self._staged:
+            if staged is not None:
+                _remove(staged)
+        self._staged = []
+
+    def status(self) -> dict:
+        status = self.stats.to_dict()
+        status.update(on_trial=self.on_trial, boots=self.boots)
+        return status
@@ -0,0 +1,163 @@
+"""Beacon that sends compact binary packets instead of JSON.
+
+Drop-in replacement for ``pysquared.beacon.Beacon`` in the flight loop. It
+collects the same data, packs it with :mod:`beacon_codec` into a radio slab
+from the shared buffer pool and hands it to the ``PacketManager``.
+"""
+
+import time
+
+from ..pysquared.logger import Logger
+from . import beacon_codec
+from .buffer_pool import BufferPool
+from .telemetry_archive import KIND_BEACON
+
+
+def vector(reading) -> tuple:
+    """Return an (x, y, z) tuple from a sensor reading object or a tuple."""
+    value = getattr(reading, "value", reading)
+    return value[0], value[1], value[2]
+
+
+class PackedBeacon:
+    """Sends binary beacons.
+
+    Args:
+        logger: Logger instance.
+        name: The cubesat name.
+        packet_manager: PacketManager used to send the beacon.
+        boot_time: ``time.time()`` at boot.
+        imu: IMU manager providing acceleration and angular velocity.
+        magnetometer: Magnetometer manager providing the magnetic field.
+        radio: Radio manager, used to report the current modulation.
+        error_count: Error counter.
+        boot_count: Boot counter.
+        radio_pool: Buffer pool the beacon is packed into.
+        name_interval: Include the cubesat name in every Nth beacon.
+        use_msgpack: Send every beacon as full precision msgpack. Otherwise
+            only a beacon the ``struct`` layout would clip, such as one with
+            an acceleration beyond 327 m/s^2, is sent as msgpack, when the
+            build has msgpack.
+        keyframe_interval: Send delta beacons with a full keyframe every Nth
+            beacon, or every beacon in full when 0. Ignored with msgpack.
+        archive: ``TelemetryArchive`` every beacon is also stored in, as a
+            full ``struct`` beacon without the name, or None.
+    """
+
+    ZERO = (0.0, 0.0, 0.0)
+
+    def __init__(
+        self,
+        logger: Logger,
+        name: str,
+        packet_manager,
+        boot_time: float,
+        imu,
+        magnetometer,
+        radio,
+        error_count,
+        boot_count,
+        radio_pool: BufferPool,
+        name_interval: int = 10,
+        use_msgpack: bool = False,
+        keyframe_interval: int = 0,
+        archive=None,
+    ) -> None:
+        self._log: Logger = logger
+        self._name: bytes = name.encode("utf-8")
+        self._packet_manager = packet_manager
+        self._boot_time: float = boot_time
+        self._imu = imu
+        self._magnetometer = magnetometer
+        self._radio = radio
+        self._error_count = error_count
+        self._boot_count = boot_count
+        self._radio_pool: BufferPool = radio_pool
+        self._name_interval: int = name_interval
+        self._use_msgpack: bool = use_msgpack
+        self._archive = archive
+        self._sent: int = 0
+        self._delta_encoder: beacon_codec.DeltaBeaconEncoder | None = (
+            beacon_codec.DeltaBeaconEncoder(keyframe_interval)
+            if keyframe_interval
+            else None
+        )
+
+    def _fields(self) -> tuple:
+        flags = 0
+
+        acceleration = angular_velocity = magnetic_field = self.ZERO
+        try:
+            acceleration = vector(self._imu.get_acceleration())
+            angular_velocity = vector(self._imu.get_angular_velocity())
+            flags |= beacon_codec.FLAG_IMU_VALID
+        except Exception as e:
+            self._log.error("Error reading IMU for beacon", e)
+
+        try:
+            magnetic_field = vector(self._magnetometer.get_magnetic_field())
+            flags |= beacon_codec.FLAG_MAGNETOMETER_VALID
+        except Exception as e:
+            self._log.error("Error reading magnetometer for beacon", e)
+
+        try:
+            if self._radio.get_modulation().__name__ == "FSK":
+                flags |= beacon_codec.FLAG_FSK
+        except Exception as e:
+            self._log.error("Error reading radio modulation for beacon", e)
+
+        now = time.time()
+        name = self._name if self._sent % self._name_interval == 0 else None
+
+        return (
+            flags,
+            self._boot_time,
+            now - self._boot_time,
+            self._boot_count.get(),
+            self._error_count.get(),
+            acceleration,
+            angular_velocity,
+            magnetic_field,
+            name,
+        )
+
+    def _store(self, fields: tuple) -> None:
+        slab = self._radio_pool.checkout()
+        try:
+            length = beacon_codec.encode_struct(slab, *fields[:-1])
+            self._archive.append(KIND_BEACON, self._radio_pool.view(slab, length))
+        finally:
+            self._radio_pool.release(slab)
+
+    def send(self) -> bool:
+        """Collect the beacon fields and send them.
+
+        Returns:
+            What the packet manager's ``send`` returned: whether the beacon
+            went out, or with a ``QueueSender`` whether it was queued.
+        """
+        fields = self._fields()
+        self._sent += 1
+
+        if self._archive is not None:
+            self._store(fields)
+
+        if self._use_msgpack or not beacon_codec.fits_struct(*fields):
+            try:
+                payload = beacon_codec.encode_msgpack(*fields)
+            except RuntimeError:
+                # No msgpack in this build, so the struct beacon goes, clipped
+                payload = None
+            if payload is not None:
+                return self._packet_manager.send(payload)
+
+        slab = self._radio_pool.checkout()
+        try:
+            if self._delta_encoder is not None:
+                length = self._delta_encoder.encode(slab, *fields)
+            else:
+                length = beacon_codec.encode_struct(slab, *fields)
+            # A TxQueue copies what it keeps, so the slab can go back after
+            return self._packet_manager.send(self._radio_pool.view(slab, length))
+        finally:
+            self._radio_pool.release(slab)
@@ -0,0 +1,176 @@
+"""Interrupt-driven radio receive on the RFM9x DIO0 line.
+
+``RFM9xManager.receive`` polls the radio's IRQ flags over SPI for its whole
+timeout, so ``listen_for_commands`` keeps the CPU busy the entire time.
+While the radio is listening it raises DIO0, wired to ``board.RF1_IO0``, on
+RxDone. :class:`Dio0Receiver` puts the radio in receive mode and waits for
+that edge instead, then reads the packet straight away:
+
+    :class:`CounterEdge` counts edges with ``countio`` and sleeps between
+    checks, so the CPU idles and a packet is read within ``poll_interval``.
+
+    :class:`AlarmEdge` light-sleeps until the pin goes high, with
+    ``alarm.pin.PinAlarm``. It uses the least energy but cannot share the pin
+    with anything else.
+
+The IRQ flags are also checked over SPI once per ``idle_interval``, which
+catches a packet whose edge came before the wait was armed. ``idle`` is
+called at the same interval, for work such as petting the watchdog.
+
+DIO4, on ``board.RF1_IO4``, is not used here.
+"""
+
+import time
+
+try:
+    import countio
+except ImportError:
+    countio = None
+
+try:
+    import alarm
+except ImportError:
+    alarm = None
+
+# Timeout for reading a packet DIO0 has already announced
+READ_TIMEOUT = 0.1
+
+
+class CounterEdge:
+    """Waits for rising edges on a pin counted by ``countio``.
+
+    Args:
+        pin: The DIO0 pin.
+        poll_interval: Seconds to sleep between checks of the count.
+    """
+
+    def __init__(self, pin, poll_interval: float = 0.005) -> None:
+        self._counter = countio.Counter(pin, edge=countio.Edge.RISE)
+        self.poll_interval: float = poll_interval
+
+    def arm(self) -> None:
+        """Forget earlier edges, such as TxDone."""
+        self._counter.reset()
+
+    def wait(self, timeout: float) -> bool:
+        """Whether an edge came within ``timeout`` seconds."""
+        deadline = time.monotonic() + timeout
+        while self._counter.count == 0:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+        self._counter.reset()
+        return True
+
+
+class AlarmEdge:
+    """Light-sleeps until a pin goes high.
+
+    Args:
+        pin: The DIO0 pin.
+    """
+
+    def __init__(self, pin) -> None:
+        self._pin = pin
+
+    def arm(self) -> None:
+        pass
+
+    def wait(self, timeout: float) -> bool:
+        """Whether the pin went high within ``timeout`` seconds."""
+        woke = alarm.light_sleep_until_alarms(
+            alarm.pin.PinAlarm(self._pin, value=True),
+            alarm.time.TimeAlarm(monotonic_time=time.monotonic() + timeout),
+        )
+        return isinstance(woke, alarm.pin.PinAlarm)
+
+
+class RxStats:
+    """Counters for :class:`Dio0Receiver`."""
+
+    def __init__(self) -> None:
+        self.packets: int = 0
+        self.wakeups: int = 0
+        self.spurious: int = 0
+        self.waited: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "packets": self.packets,
+            "wakeups": self.wakeups,
+            "spurious": self.spurious,
+            "waited": self.waited,
+        }
+
+
+class Dio0Receiver:
+    """Wraps a radio manager so ``receive`` waits on DIO0 instead of polling.
+
+    Anything other than ``receive`` is passed through to the wrapped radio.
+
+    Args:
+        logger: Logger instance.
+        radio: The radio manager to wrap.
+        driver: The ``adafruit_rfm9x.RFM9x`` instance inside ``radio``.
+        edge: Waits for DIO0, see :class:`CounterEdge` and :class:`AlarmEdge`.
+        idle: Called about every ``idle_interval`` seconds while waiting.
+        idle_interval: Longest wait between checks of the IRQ flags.
+    """
+
+    def __init__(
+        self,
+        logger,
+        radio,
+        driver,
+        edge,
+        idle=None,
+        idle_interval: float = 1.0,
+    ) -> None:
+        self._log = logger
+        self._radio = radio
+        self._driver = driver
+        self._edge = edge
+        self._idle = idle
+        self.idle_interval: float = idle_interval
+        self.stats: RxStats = RxStats()
+
+    def __getattr__(self, name: str):
+        return getattr(self._radio, name)
+
+    def receive(self, timeout: float | None = None) -> bytes | None:
+        """Wait up to ``timeout`` seconds for a packet.
+
+        Without a timeout this is the wrapped radio's ``receive``.
+        """
+        if timeout is None:
+            return self._radio.receive()
+
+        start = time.monotonic()
+        deadline = start + timeout
+        try:
+            self._driver.listen()
+            # Armed after listening, and the flags checked after arming, so no
+            # packet falls in between
+            self._edge.arm()
+            while True:
+                now = time.monotonic()
+                announced = self._driver.rx_done() or self._edge.wait(
+                    min(self.idle_interval, max(0.0, deadline - now))
+                )
+                if announced:
+                    self.stats.wakeups += 1
+                    packet = self._radio.receive(timeout=READ_TIMEOUT)
+                    if packet is not None:
+                        self.stats.packets += 1
+                        return packet
+                    # A CRC error, or TxDone from a send in between
+                    self.stats.spurious += 1
+                    self._driver.listen()
+                    self._edge.arm()
+
+                if self._idle is not None:
+                    self._idle()
+                if time.monotonic() >= deadline:
+                    return None
+        finally:
+            self.stats.waited += time.monotonic() - start
@@ -2,3 +2,5 @@ class Register:
     boot_count = 0
     error_count = 1
     message_count = 2
+    # airtime_budget.RECORD_LENGTH bytes from here
+    airtime = 3
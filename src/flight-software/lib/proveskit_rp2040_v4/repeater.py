@@ -0,0 +1,175 @@
+"""Store-and-forward repeater for ``repeat_code`` messages.
+
+A ground station asks the satellite to repeat a message by sending
+``repeat_code``, its callsign, ``:`` and the message. The satellite repeats
+everything after ``repeat_code``, so the originator's callsign goes out with
+the message and the repeat itself carries no repeat code to be repeated
+again.
+
+Repeating never gets in the way of the satellite's own traffic:
+
+    Repeats are queued in the ``TxQueue``'s lowest priority class, which
+    holds only so many bytes and is sent only after beacons, commands and
+    telemetry. A repeat still queued past its sender's deadline is dropped.
+
+    A :func:`airtime_budget.repeat_budget` on the ``AirtimeMeter`` limits
+    the airtime repeats take, and the queue holds them while it is spent.
+
+    Each source callsign may have ``burst`` messages repeated at once and
+    earns another every ``source_interval`` seconds.
+
+    A message heard again within ``dedupe_time`` seconds, such as a station
+    retrying because it missed the repeat, is not repeated twice. The last
+    ``dedupe_size`` messages repeated are remembered by CRC-32.
+"""
+
+import binascii
+import time
+
+# Longest source callsign accepted, as in AX.25 with an SSID
+MAX_CALLSIGN_LENGTH = 9
+
+
+class RepeaterStats:
+    """Counters for :class:`Repeater`."""
+
+    def __init__(self) -> None:
+        self.received: int = 0
+        self.queued: int = 0
+        self.duplicates: int = 0
+        self.rate_limited: int = 0
+        self.refused: int = 0
+        self.malformed: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "queued": self.queued,
+            "duplicates": self.duplicates,
+            "rate_limited": self.rate_limited,
+            "refused": self.refused,
+            "malformed": self.malformed,
+        }
+
+
+class Repeater:
+    """Repeats ``repeat_code`` messages heard by the packet manager.
+
+    Sits between the command router and its packet manager. ``listen`` takes
+    repeat requests out of what it receives; anything else is returned
+    unchanged, and anything other than ``listen`` is passed through to the
+    packet manager.
+
+    Args:
+        logger: Logger instance.
+        config: The satellite's config, with ``repeat_code``.
+        packet_manager: Receives the messages.
+        sender: Queues repeats, a ``TxQueue`` sender at ``PRIORITY_REPEAT``.
+        burst: Messages a source may have repeated at once.
+        source_interval: Seconds in which a source earns another message.
+        max_sources: Sources whose rate is tracked; the least recently heard
+            is forgotten first.
+        dedupe_size: Recent messages remembered to suppress duplicates.
+        dedupe_time: Seconds a message is remembered.
+        clock: Returns the time in seconds.
+    """
+
+    def __init__(
+        self,
+        logger,
+        config,
+        packet_manager,
+        sender,
+        burst: int = 3,
+        source_interval: float = 60.0,
+        max_sources: int = 16,
+        dedupe_size: int = 32,
+        dedupe_time: float = 600.0,
+        clock=time.monotonic,
+    ) -> None:
+        self._log = logger
+        self._packet_manager = packet_manager
+        self._sender = sender
+        self._prefix: bytes = config.repeat_code.encode("utf-8")
+        self.burst: int = burst
+        self.source_interval: float = source_interval
+        self.max_sources: int = max_sources
+        self.dedupe_size: int = dedupe_size
+        self.dedupe_time: float = dedupe_time
+        self._clock = clock
+
+        # [tokens, updated] by source callsign
+        self._sources: dict = {}
+        # When each recent message was heard by CRC-32, and their order,
+        # least recently heard first
+        self._seen: dict = {}
+        self._seen_order: list = []
+
+        self.stats: RepeaterStats = RepeaterStats()
+
+    def __getattr__(self, name: str):
+        return getattr(self._packet_manager, name)
+
+    def _duplicate(self, key: int, now: float) -> bool:
+        """Whether the message with CRC ``key`` was repeated recently."""
+        heard = self._seen.get(key)
+        return heard is not None and now - heard < self.dedupe_time
+
+    def _remember(self, key: int, now: float) -> None:
+        """Count the message with CRC ``key`` as just heard."""
+        if key in self._seen:
+            self._seen_order.remove(key)
+        elif len(self._seen_order) >= self.dedupe_size:
+            del self._seen[self._seen_order.pop(0)]
+        self._seen[key] = now
+        self._seen_order.append(key)
+
+    def _take_token(self, source: bytes, now: float) -> bool:
+        """Spend one of ``source``'s messages, if it has one left."""
+        entry = self._sources.get(source)
+        if entry is None:
+            if len(self._sources) >= self.max_sources:
+                oldest = min(self._sources, key=lambda s: self._sources[s][1])
+                del self._sources[oldest]
+            entry = self._sources[source] = [float(self.burst), now]
+        else:
+            entry[0] = min(
+                float(self.burst),
+                entry[0] + (now - entry[1]) / self.source_interval,
+            )
+            entry[1] = now
+        if entry[0] < 1.0:
+            return False
+        entry[0] -= 1.0
+        return True
+
+    def _repeat(self, message: bytes) -> None:
+        self.stats.received += 1
+        separator = message.find(b":")
+        if not 0 < separator <= MAX_CALLSIGN_LENGTH:
+            self.stats.malformed += 1
+            return
+
+        now = self._clock()
+        key = binascii.crc32(message)
+        if self._duplicate(key, now):
+            self.stats.duplicates += 1
+            self._remember(key, now)
+            return
+        # A message turned away here may be tried again, so it is not
+        # remembered
+        if not self._take_token(message[:separator], now):
+            self.stats.rate_limited += 1
+            return
+        if not self._sender.send(message):
+            self.stats.refused += 1
+            return
+        self._remember(key, now)
+        self.stats.queued += 1
+
+    def listen(self, *args, **kwargs) -> bytes | None:
+        message = self._packet_manager.listen(*args, **kwargs)
+        if message is None or not message.startswith(self._prefix):
+            return message
+        self._repeat(bytes(message[len(self._prefix) :]))
+        return None
@@ -0,0 +1,470 @@
+"""Store-and-forward telemetry archive on the flash filesystem.
+
+Telemetry produced out of ground contact is appended to the archive as fixed
+size records and streamed back on request with a bulk transfer, see
+:mod:`bulk_transfer`.
+
+Records are appended to numbered segment files in ``directory``, each holding
+up to ``segment_records`` records. A segment that is full is closed and added
+to the index file, which holds the time range and record count of every
+closed segment, so a query only reads the segments it needs. Whenever a
+segment is closed, the oldest segments are deleted until the archive and a
+full new segment fit in ``max_bytes``.
+
+Buffering:
+    Appended records are held in a RAM buffer of ``buffer_records`` records
+    and written to their segment with a single write when it is full, when
+    the segment is full, or ``flush_interval`` seconds after the last write.
+    Flash is erased in 4 KiB sectors and FAT rewrites its table on every
+    append, so writing each beacon on its own wore the flash and stalled the
+    loop on every beacon. A reset loses the buffered records.
+
+Crash safety:
+    Every record carries its own CRC and each flush is a single write to a
+    file that is closed again straight away, so a reset loses at most the
+    records being written. A segment whose length is not a whole number of
+    records was torn by a reset; it is closed as it is and appends continue
+    in a new segment. Readers skip records that fail their CRC.
+
+    The index is written to ``index.new`` and then renamed over ``index``. It
+    is only a cache: segments it does not list are scanned at start-up, and a
+    missing or corrupt index is rebuilt from the segments.
+
+The archive belongs on an SD card: the internal flash is small and
+read-only to code unless the flight software's ``boot.py`` remounts it.
+
+Record, ``RECORD_LENGTH`` bytes:
+    ``RECORD_HEADER_FORMAT``: ``time.time()`` at append, kind, payload length.
+    Then the payload padded to ``PAYLOAD_LENGTH``, then the CRC-16 of
+    everything before it from ``binascii.crc32``.
+
+Index:
+    ``INDEX_ENTRY_FORMAT`` per closed segment: segment number, earliest and
+    latest record time, record count. Then the CRC-16 of the entries.
+"""
+
+import binascii
+import os
+import struct
+import time
+
+RECORD_HEADER_FORMAT = "<IBB"
+RECORD_HEADER_LENGTH = struct.calcsize(RECORD_HEADER_FORMAT)
+PAYLOAD_LENGTH = 40
+RECORD_LENGTH = RECORD_HEADER_LENGTH + PAYLOAD_LENGTH + 2
+
+INDEX_ENTRY_FORMAT = "<IIIH"
+INDEX_ENTRY_LENGTH = struct.calcsize(INDEX_ENTRY_FORMAT)
+
+# Record kinds
+KIND_BEACON = 0x01
+
+_SEGMENT_SUFFIX = ".seg"
+
+# errno of a read-only filesystem
+_EROFS = 30
+
+
+def _crc16(data: bytes) -> int:
+    return binascii.crc32(data) & 0xFFFF
+
+
+def pack_record(timestamp: int, kind: int, payload: bytes) -> bytes:
+    """A record of ``payload``, which must fit in ``PAYLOAD_LENGTH``."""
+    if len(payload) > PAYLOAD_LENGTH:
+        raise ValueError("payload longer than PAYLOAD_LENGTH")
+    record = (
+        struct.pack(RECORD_HEADER_FORMAT, timestamp, kind, len(payload))
+        + payload
+        + bytes(PAYLOAD_LENGTH - len(payload))
+    )
+    return record + struct.pack("<H", _crc16(record))
+
+
+def unpack_record(record: bytes) -> tuple | None:
+    """Undo :func:`pack_record`.
+
+    Returns:
+        ``(timestamp, kind, payload)``, or None if the record is corrupt.
+    """
+    if len(record) != RECORD_LENGTH:
+        return None
+    (crc,) = struct.unpack_from("<H", record, RECORD_LENGTH - 2)
+    if crc != _crc16(record[:-2]):
+        return None
+    timestamp, kind, length = struct.unpack_from(RECORD_HEADER_FORMAT, record)
+    if length > PAYLOAD_LENGTH:
+        return None
+    start = RECORD_HEADER_LENGTH
+    return timestamp, kind, bytes(record[start : start + length])
+
+
+class ArchiveSegments:
+    """Records of an archive query, packed into bulk transfer segments.
+
+    Records are sent whole, CRC included, as many as fit in ``segment_size``,
+    so the ground station can check each one with :func:`unpack_record`.
+
+    Args:
+        runs: ``(path, first_record, count)`` runs from
+            :meth:`TelemetryArchive.query`.
+        segment_size: Bytes per packet.
+    """
+
+    def __init__(self, runs: list, segment_size: int) -> None:
+        self._runs = runs
+        self.records_per_segment: int = max(1, segment_size // RECORD_LENGTH)
+        self.records: int = sum(count for _, _, count in runs)
+        self.size: int = self.records * RECORD_LENGTH
+        self._path: str | None = None
+        self._file = None
+
+    def __len__(self) -> int:
+        return (self.records + self.records_per_segment - 1) // self.records_per_segment
+
+    def _read(self, path: str, first: int, count: int) -> bytes:
+        if path != self._path:
+            self.close()
+            self._file = open(path, "rb")
+            self._path = path
+        self._file.seek(first * RECORD_LENGTH)
+        return self._file.read(count * RECORD_LENGTH)
+
+    def __getitem__(self, index: int) -> bytes:
+        skip = index * self.records_per_segment
+        wanted = min(self.records_per_segment, self.records - skip)
+        chunks = []
+        for path, first, count in self._runs:
+            if wanted <= 0:
+                break
+            if skip >= count:
+                skip -= count
+                continue
+            take = min(count - skip, wanted)
+            chunks.append(self._read(path, first + skip, take))
+            wanted -= take
+            skip = 0
+        return b"".join(chunks)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._path = None
+
+
+class ArchiveStats:
+    """Counters for a :class:`TelemetryArchive`."""
+
+    def __init__(self) -> None:
+        self.appended: int = 0
+        self.failed: int = 0
+        self.flushes: int = 0
+        self.evicted_segments: int = 0
+        self.torn_segments: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "appended": self.appended,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "evicted_segments": self.evicted_segments,
+            "torn_segments": self.torn_segments,
+        }
+
+
+class TelemetryArchive:
+    """Append-only archive of fixed size telemetry records.
+
+    Args:
+        logger: Logger instance.
+        directory: Where the segment files and the index are kept. Created if
+            it does not exist.
+        segment_records: Records per segment file.
+        max_bytes: Size past which the oldest segments are deleted.
+        clock: Returns the time records are stamped with, in seconds.
+        buffer_records: Records held in RAM between writes.
+        flush_interval: Seconds after which buffered records are written even
+            if the buffer is not full.
+    """
+
+    def __init__(
+        self,
+        logger,
+        directory: str = "/sd/archive",
+        segment_records: int = 256,
+        max_bytes: int = 1 << 20,
+        clock=time.time,
+        buffer_records: int = 64,
+        flush_interval: float = 900.0,
+    ) -> None:
+        self._log = logger
+        self.directory: str = directory.rstrip("/")
+        self.segment_records: int = segment_records
+        self.max_bytes: int = max_bytes
+        self._clock = clock
+        self.flush_interval: float = flush_interval
+        self.stats: ArchiveStats = ArchiveStats()
+        # Whether appends are possible; cleared on a read-only filesystem
+        self.writable: bool = True
+
+        # (segment, earliest time, latest time, count) of closed segments,
+        # oldest first
+        self._closed: list = []
+        # The segment being appended to
+        self._segment: int = 0
+        self._count: int = 0
+        self._first: int = 0
+        self._last: int = 0
+
+        # Records not written yet, allocated once at boot
+        self._buffer: bytearray = bytearray(buffer_records * RECORD_LENGTH)
+        self._buffered: int = 0
+        self._buffered_first: int = 0
+        self._buffered_last: int = 0
+        self._flushed_at: float = time.monotonic()
+
+        self._load()
+
+    def _path(self, segment: int) -> str:
+        return "{}/{:08d}{}".format(self.directory, segment, _SEGMENT_SUFFIX)
+
+    def _index_path(self) -> str:
+        return self.directory + "/index"
+
+    def _read_index(self) -> list:
+        for path in (self._index_path(), self._index_path() + ".new"):
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            body = data[:-2]
+            if (
+                len(data) < 2
+                or len(body) % INDEX_ENTRY_LENGTH
+                or struct.unpack_from("<H", data, len(body))[0] != _crc16(body)
+            ):
+                continue
+            return [
+                struct.unpack_from(INDEX_ENTRY_FORMAT, body, offset)
+                for offset in range(0, len(body), INDEX_ENTRY_LENGTH)
+            ]
+        return []
+
+    def _write_index(self) -> None:
+        body = b"".join(
+            struct.pack(INDEX_ENTRY_FORMAT, *entry) for entry in self._closed
+        )
+        new_path = self._index_path() + ".new"
+        with open(new_path, "wb") as f:
+            f.write(body + struct.pack("<H", _crc16(body)))
+        try:
+            os.remove(self._index_path())
+        except OSError:
+            pass
+        os.rename(new_path, self._index_path())
+
+    def _scan(self, segment: int) -> tuple:
+        """Earliest and latest time and count of the valid records in a
+        segment, and whether it ends in a torn record."""
+        first = last = count = 0
+        with open(self._path(segment), "rb") as f:
+            while True:
+                record = f.read(RECORD_LENGTH)
+                if not record:
+                    break
+                if len(record) < RECORD_LENGTH:
+                    return first, last, count, True
+                unpacked = unpack_record(record)
+                if unpacked is None:
+                    continue
+                if count == 0 or unpacked[0] < first:
+                    first = unpacked[0]
+                last = max(last, unpacked[0])
+                count += 1
+        return first, last, count, False
+
+    def _load(self) -> None:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            try:
+                os.mkdir(self.directory)
+            except OSError as e:
+                self._log.error("Cannot create telemetry archive", e)
+                self.writable = False
+            names = []
+
+        segments = sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)])
+            for name in names
+            if name.endswith(_SEGMENT_SUFFIX)
+        )
+        indexed = {entry[0]: entry for entry in self._read_index()}
+
+        closed = []
+        torn = False
+        for segment in segments:
+            if segment in indexed:
+                closed.append(indexed[segment])
+                torn = False
+                continue
+            first, last, count, torn = self._scan(segment)
+            closed.append((segment, first, last, count))
+
+        # The newest segment stays open for appends unless it is full or torn
+        if closed and closed[-1][3] < self.segment_records and not torn:
+            self._segment, self._first, self._last, self._count = closed.pop()
+        else:
+            self._segment = closed[-1][0] + 1 if closed else 0
+            if torn:
+                self.stats.torn_segments += 1
+
+        self._closed = closed
+        if [entry[0] for entry in closed] != sorted(indexed) and self.writable:
+            try:
+                self._write_index()
+            except OSError as e:
+                self._log.error("Failed to write telemetry archive index", e)
+
+    def _roll(self) -> None:
+        """Close the current segment and start the next, evicting old ones."""
+        self._closed.append((self._segment, self._first, self._last, self._count))
+        self._segment += 1
+        self._count = 0
+        self._evict()
+        self._write_index()
+
+    def _evict(self) -> None:
+        """Delete the oldest segments until a full new segment fits."""
+        room = self.segment_records * RECORD_LENGTH
+        while self._closed and self.size() + room > self.max_bytes:
+            segment = self._closed.pop(0)[0]
+            try:
+                os.remove(self._path(segment))
+            except OSError as e:
+                self._log.error("Failed to evict telemetry segment", e)
+            self.stats.evicted_segments += 1
+
+    def size(self) -> int:
+        """Bytes of records held, buffered ones included."""
+        records = sum(entry[3] for entry in self._closed) + self._count
+        return (records + self._buffered) * RECORD_LENGTH
+
+    def flush(self) -> bool:
+        """Write the buffered records to the current segment.
+
+        Returns:
+            Whether they were written. They are dropped if not.
+        """
+        self._flushed_at = time.monotonic()
+        if not self._buffered:
+            return True
+        buffered = self._buffered
+        self._buffered = 0
+        try:
+            with open(self._path(self._segment), "ab") as f:
+                f.write(memoryview(self._buffer)[: buffered * RECORD_LENGTH])
+        except OSError as e:
+            self.stats.failed += buffered
+            if e.args and e.args[0] == _EROFS:
+                self.writable = False
+            self._log.error("Failed to write telemetry archive", e, records=buffered)
+            return False
+
+        if self._count == 0 or self._buffered_first < self._first:
+            self._first = self._buffered_first
+        self._last = (
+            max(self._last, self._buffered_last) if self._count else self._buffered_last
+        )
+        self._count += buffered
+        self.stats.flushes += 1
+        return True
+
+    def append(self, kind: int, payload: bytes, timestamp: int | None = None) -> bool:
+        """Append a record.
+
+        Args:
+            kind: One of the ``KIND_*`` constants.
+            payload: Up to ``PAYLOAD_LENGTH`` bytes.
+            timestamp: Defaults to the current time.
+
+        Returns:
+            Whether the record was buffered. It reaches flash at the next
+            :meth:`flush`.
+        """
+        if not self.writable:
+            return False
+        if timestamp is None:
+            timestamp = int(self._clock())
+
+        record = pack_record(timestamp, kind, payload)
+        if self._count + self._buffered >= self.segment_records:
+            self.flush()
+        if self._count >= self.segment_records:
+            try:
+                self._roll()
+            except OSError as e:
+                self._log.error("Failed to write telemetry archive index", e)
+
+        offset = self._buffered * RECORD_LENGTH
+        self._buffer[offset : offset + RECORD_LENGTH] = record
+        if self._buffered == 0 or timestamp < self._buffered_first:
+            self._buffered_first = timestamp
+        self._buffered_last = (
+            max(self._buffered_last, timestamp) if self._buffered else timestamp
+        )
+        self._buffered += 1
+        self.stats.appended += 1
+
+        if (
+            self._buffered * RECORD_LENGTH >= len(self._buffer)
+            or time.monotonic() - self._flushed_at >= self.flush_interval
+        ):
+            self.flush()
+        return True
+
+    def query(self, start: int, end: int) -> list:
+        """Find the records stamped from ``start`` to ``end`` inclusive.
+
+        Returns:
+            ``(path, first_record, count)`` runs of valid records, oldest
+            first, for :class:`ArchiveSegments`.
+        """
+        self.flush()
+        candidates = [
+            entry[0] for entry in self._closed if entry[1] <= end and entry[2] >= start
+        ]
+        if self._count and self._first <= end and self._last >= start:
+            candidates.append(self._segment)
+
+        runs = []
+        for segment in candidates:
+            path = self._path(segment)
+            run_start = None
+            index = 0
+            with open(path, "rb") as f:
+                while True:
+                    record = f.read(RECORD_LENGTH)
+                    if len(record) < RECORD_LENGTH:
+                        break
+                    unpacked = unpack_record(record)
+                    wanted = unpacked is not None and start <= unpacked[0] <= end
+                    if wanted and run_start is None:
+                        run_start = index
+                    elif not wanted and run_start is not None:
+                        runs.append((path, run_start, index - run_start))
+                        run_start = None
+                    index += 1
+            if run_start is not None:
+                runs.append((path, run_start, index - run_start))
+        return runs
+
+    def status(self) -> dict:
+        """Size, segment count and counters, for logging."""
+        status = self.stats.to_dict()
+        status["bytes"] = self.size()
+        status["segments"] = len(self._closed) + (1 if self._count else 0)
+        status["buffered"] = self._buffered
+        return status
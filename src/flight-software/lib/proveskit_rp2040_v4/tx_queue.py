@@ -0,0 +1,270 @@
+"""Priority transmit queue in front of the ``PacketManager``.
+
+Everything the satellite sends through the packet manager is queued in one of
+five classes and sent in strict priority order, so a command response never
+waits behind a beacon, and a beacon never waits behind bulk data:
+
+    PRIORITY_COMMAND: Responses to ground commands.
+    PRIORITY_BEACON: Beacons.
+    PRIORITY_TELEMETRY: Housekeeping telemetry.
+    PRIORITY_BULK: Logs, images and stored telemetry.
+    PRIORITY_REPEAT: Messages repeated for other stations, see ``repeater``.
+
+Each class has a byte budget for what it may hold queued. A beacon or
+telemetry message that does not fit pushes out the oldest of its class, since
+newer readings supersede older ones. A command response or bulk message that
+does not fit is refused, so the caller knows it was not sent. A message may
+carry a deadline; one still queued past its deadline is dropped rather than
+sent late.
+
+Callers get a :class:`QueueSender` per class, which looks like a packet
+manager, so the beacon and the command handler need no changes.
+
+Given an ``AirtimeMeter``, the queue tells it which class each message
+belongs to, and leaves a class queued while the meter's budgets do not allow
+it.
+"""
+
+import time
+
+PRIORITY_COMMAND = 0
+PRIORITY_BEACON = 1
+PRIORITY_TELEMETRY = 2
+PRIORITY_BULK = 3
+PRIORITY_REPEAT = 4
+
+CLASS_NAMES = ("command", "beacon", "telemetry", "bulk", "repeat")
+
+# Bytes each class may hold queued
+DEFAULT_BUDGETS = (2048, 1024, 4096, 8192, 1024)
+
+_DROP_OLDEST = (PRIORITY_BEACON, PRIORITY_TELEMETRY)
+
+
+class ClassStats:
+    """Counters for one priority class."""
+
+    def __init__(self) -> None:
+        self.queued: int = 0
+        self.sent: int = 0
+        self.failed: int = 0
+        self.bytes_sent: int = 0
+        self.expired: int = 0
+        self.dropped: int = 0
+        self.refused: int = 0
+        self.deferred: int = 0
+        self.wait_total: float = 0.0
+        self.wait_max: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "bytes_sent": self.bytes_sent,
+            "expired": self.expired,
+            "dropped": self.dropped,
+            "refused": self.refused,
+            "deferred": self.deferred,
+            "wait_avg": self.wait_total / self.sent if self.sent else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+
+class TxQueue:
+    """Queues outgoing messages by priority and sends them when asked.
+
+    Args:
+        logger: Logger instance.
+        packet_manager: Sends the messages.
+        budgets: Bytes each class may hold queued, indexed by priority.
+        meter: ``AirtimeMeter`` to charge airtime to and ask whether a class
+            may be sent, or None.
+        clock: Returns the time in seconds.
+    """
+
+    def __init__(
+        self,
+        logger,
+        packet_manager,
+        budgets: tuple = DEFAULT_BUDGETS,
+        meter=None,
+        clock=time.monotonic,
+    ) -> None:
+        self._log = logger
+        self._packet_manager = packet_manager
+        self._meter = meter
+        self._clock = clock
+        self.budgets: tuple = budgets
+        # Per class, a list of [enqueued_at, deadline, data, deferred], oldest
+        # first, where deferred is whether the message was counted as deferred
+        self._queues: list = [[] for _ in CLASS_NAMES]
+        self._bytes: list = [0] * len(CLASS_NAMES)
+        self.class_stats: list = [ClassStats() for _ in CLASS_NAMES]
+
+    def enqueue(
+        self, data: bytes, priority: int, deadline: float | None = None
+    ) -> bool:
+        """Queue a message.
+
+        Args:
+            data: The message. Anything but ``bytes``, such as a view of a
+                pooled slab, is copied, since the caller may reuse it.
+            priority: One of the ``PRIORITY_*`` classes.
+            deadline: Seconds from now after which the message is not worth
+                sending, or None to keep it until sent.
+
+        Returns:
+            Whether the message was queued.
+        """
+        stats = self.class_stats[priority]
+        queue = self._queues[priority]
+        budget = self.budgets[priority]
+
+        if len(data) > budget:
+            stats.refused += 1
+            return False
+
+        if self._bytes[priority] + len(data) > budget:
+            if priority not in _DROP_OLDEST:
+                stats.refused += 1
+                return False
+            while self._bytes[priority] + len(data) > budget:
+                self._bytes[priority] -= len(queue.pop(0)[2])
+                stats.dropped += 1
+
+        now = self._clock()
+        data = bytes(data)
+        queue.append([now, None if deadline is None else now + deadline, data, False])
+        self._bytes[priority] += len(data)
+        stats.queued += 1
+        return True
+
+    def _next(self, max_priority: int) -> tuple:
+        """Pop the next message worth sending, dropping expired ones."""
+        now = self._clock()
+        for priority in range(max_priority + 1):
+            queue = self._queues[priority]
+            if queue and self._meter is not None and not self._meter.allows(priority):
+                for entry in queue:
+                    if not entry[3]:
+                        entry[3] = True
+                        self.class_stats[priority].deferred += 1
+                continue
+            while queue:
+                enqueued_at, deadline, data, _ = queue.pop(0)
+                self._bytes[priority] -= len(data)
+                if deadline is not None and now > deadline:
+                    self.class_stats[priority].expired += 1
+                    continue
+                return priority, enqueued_at, data
+        return None, None, None
+
+    def pump(self, max_priority: int = PRIORITY_REPEAT) -> int:
+        """Send queued messages, highest priority first, until none are left.
+
+        Args:
+            max_priority: Leave classes of lower priority than this queued.
+
+        A message the packet manager fails to send is counted as failed and
+        not retried.
+
+        Returns:
+            The number of messages the packet manager reported as sent.
+        """
+        sent = 0
+        while True:
+            priority, enqueued_at, data = self._next(max_priority)
+            if data is None:
+                return sent
+
+            wait = self._clock() - enqueued_at
+            stats = self.class_stats[priority]
+
+            if self._meter is not None:
+                previous = self._meter.message_class
+                self._meter.message_class = priority
+            try:
+                ok = self._packet_manager.send(data)
+            except Exception as e:
+                self._log.error("Failed to send queued message", e)
+                ok = False
+            finally:
+                if self._meter is not None:
+                    self._meter.message_class = previous
+
+            if not ok:
+                stats.failed += 1
+                continue
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+            stats.sent += 1
+            stats.bytes_sent += len(data)
+            sent += 1
+
+    def depth(self, priority: int) -> int:
+        return len(self._queues[priority])
+
+    def pending(self) -> bool:
+        return any(self._queues)
+
+    def stats(self) -> dict:
+        """Depth, bytes queued and counters of every class, for logging."""
+        return {
+            name: dict(
+                depth=len(self._queues[priority]),
+                bytes=self._bytes[priority],
+                **self.class_stats[priority].to_dict(),
+            )
+            for priority, name in enumerate(CLASS_NAMES)
+        }
+
+    def sender(
+        self, priority: int, deadline: float | None = None, immediate: bool = False
+    ) -> "QueueSender":
+        """A packet manager look-alike that queues at ``priority``."""
+        return QueueSender(self, priority, deadline, immediate)
+
+
+class QueueSender:
+    """Queues ``send`` calls in one class of a :class:`TxQueue`.
+
+    Anything other than ``send`` is passed through to the queue's packet
+    manager, so this can be used wherever a ``PacketManager`` is expected.
+
+    Args:
+        tx_queue: The queue.
+        priority: Class the messages are queued in.
+        deadline: Seconds after queuing that messages expire, or None.
+        immediate: Send straight away, along with anything queued at the same
+            or a higher priority, instead of waiting for the next pump.
+    """
+
+    def __init__(
+        self,
+        tx_queue: TxQueue,
+        priority: int,
+        deadline: float | None = None,
+        immediate: bool = False,
+    ) -> None:
+        self._tx_queue = tx_queue
+        self.priority: int = priority
+        self.deadline: float | None = deadline
+        self.immediate: bool = immediate
+
+    def __getattr__(self, name: str):
+        return getattr(self._tx_queue._packet_manager, name)
+
+    def send(self, data: bytes) -> bool:
+        """Queue a message, and send it straight away if ``immediate``.
+
+        Returns:
+            Whether the message was queued, which unlike
+            ``PacketManager.send`` does not mean it went out: a queued
+            message may still expire, be pushed out or fail to send, which
+            the queue's ``class_stats`` count.
+        """
+        queued = self._tx_queue.enqueue(data, self.priority, self.deadline)
+        if queued and self.immediate:
+            self._tx_queue.pump(self.priority)
+        return queued
@@ -0,0 +1,397 @@
+"""Resumable uplink of files to the satellite's flash.
+
+The reverse of a ``bulk_transfer`` downlink: the ground station runs a
+``SelectiveRepeatSender`` and the satellite answers it with
+:class:`UplinkReceiver`, using the same DATA and ACK packets.
+
+A transfer starts with the ``upload`` command, which carries the transfer
+id, the file's size, its CRC-32, the chunk size and the destination path.
+The satellite answers with its status as JSON, where ``have`` is how many
+chunks it already holds in order; the ground station starts sending from
+there. When the transfer ends, complete or not, the satellite sends its
+status again with ``committed``, ``seconds`` and ``rate`` in bytes per
+second. ``upload_status`` asks for the status without transferring.
+
+Staging:
+    Chunks are written at their offset in ``STAGING_NAME`` as they arrive,
+    and which ones have arrived is kept in a bitmap written to ``MAP_NAME``
+    at every poll. A transfer cut short by the end of a pass or a reset
+    carries on where it stopped when the ground station starts it again with
+    the same parameters. Different parameters discard what was staged.
+
+Commit:
+    Once every chunk is in, the CRC-32 of the staged file is checked. The
+    destination is renamed to ``.old``, the staged file renamed to the
+    destination and ``.old`` removed. A reset in between is rolled back at
+    start-up by renaming ``.old`` back, since FAT has no atomic replace.
+
+Map file:
+    ``MAP_FORMAT`` header (transfer id, size, CRC-32, chunk size, path
+    length), the path, the bitmap with bit ``i % 8`` of byte ``i // 8`` for
+    chunk ``i``, and the CRC-16 of everything before it.
+"""
+
+import binascii
+import os
+import struct
+import time
+
+from .bulk_transfer import (
+    ACK_FORMAT,
+    DATA_FORMAT,
+    DATA_HEADER_LENGTH,
+    FLAG_POLL,
+    TYPE_ACK,
+    TYPE_DATA,
+    file_crc,
+)
+from .commands import UPLOAD_IDLE_TIMEOUT
+
+MAP_FORMAT = "<BIIHB"
+MAP_HEADER_LENGTH = struct.calcsize(MAP_FORMAT)
+
+STAGING_NAME = "staged.part"
+MAP_NAME = "staged.map"
+
+_OLD_SUFFIX = ".old"
+
+
+def _crc16(data: bytes) -> int:
+    return binascii.crc32(data) & 0xFFFF
+
+
+def _exists(path: str) -> bool:
+    try:
+        os.stat(path)
+    except OSError:
+        return False
+    return True
+
+
+class UplinkStats:
+    """Counters for an :class:`UplinkReceiver`."""
+
+    def __init__(self) -> None:
+        self.packets: int = 0
+        self.duplicates: int = 0
+        self.rejected: int = 0
+        self.committed: int = 0
+        self.crc_failures: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "packets": self.packets,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "committed": self.committed,
+            "crc_failures": self.crc_failures,
+        }
+
+
+class UplinkReceiver:
+    """Receives uploads into a staging directory and commits them.
+
+    Args:
+        logger: Logger instance.
+        directory: Where the staged file and its bitmap are kept. Created if
+            it does not exist.
+    """
+
+    def __init__(self, logger, directory: str = "/uplink") -> None:
+        self._log = logger
+        self.directory: str = directory.rstrip("/")
+        self.stats: UplinkStats = UplinkStats()
+
+        # The staged upload, if any
+        self.transfer_id: int | None = None
+        self.path: str | None = None
+        self.size: int = 0
+        self.crc: int = 0
+        self.chunk_size: int = 0
+        self.total: int = 0
+        self._bitmap: bytearray = bytearray()
+        # Chunks held in order, and in all
+        self.cumulative: int = 0
+        self.received: int = 0
+        self._file = None
+
+        try:
+            os.listdir(self.directory)
+        except OSError:
+            try:
+                os.mkdir(self.directory)
+            except OSError as e:
+                self._log.error("Cannot create uplink staging directory", e)
+        self._load()
+
+    def _staging_path(self) -> str:
+        return self.directory + "/" + STAGING_NAME
+
+    def _map_path(self) -> str:
+        return self.directory + "/" + MAP_NAME
+
+    @property
+    def done(self) -> bool:
+        return self.transfer_id is not None and self.cumulative >= self.total
+
+    def _has(self, chunk: int) -> bool:
+        return bool(self._bitmap[chunk >> 3] & (1 << (chunk & 7)))
+
+    def _advance(self) -> None:
+        while self.cumulative < self.total and self._has(self.cumulative):
+            self.cumulative += 1
+
+    def _load(self) -> None:
+        """Pick up a staged upload, and finish or roll back an interrupted
+        commit."""
+        try:
+            with open(self._map_path(), "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+
+        body = data[:-2]
+        valid = len(data) >= MAP_HEADER_LENGTH + 2
+        if valid:
+            (crc16,) = struct.unpack_from("<H", data, len(body))
+            transfer_id, size, crc, chunk_size, path_length = struct.unpack_from(
+                MAP_FORMAT, body
+            )
+            valid = crc16 == _crc16(body) and chunk_size > 0
+        if not valid:
+            self._log.info("Discarding corrupt uplink bitmap")
+            self.discard()
+            return
+
+        path = bytes(body[MAP_HEADER_LENGTH : MAP_HEADER_LENGTH + path_length])
+        self.path = path.decode("utf-8")
+        old = self.path + _OLD_SUFFIX
+        if _exists(old):
+            if _exists(self.path):
+                # Reset after the staged file replaced the destination
+                os.remove(old)
+            else:
+                os.rename(old, self.path)
+                self._log.info("Rolled back interrupted upload", path=self.path)
+
+        if not _exists(self._staging_path()):
+            self.discard()
+            return
+
+        self.transfer_id = transfer_id
+        self.size = size
+        self.crc = crc
+        self.chunk_size = chunk_size
+        self.total = (size + chunk_size - 1) // chunk_size
+        self._bitmap = bytearray(body[MAP_HEADER_LENGTH + path_length :])
+        if len(self._bitmap) != (self.total + 7) // 8:
+            self.discard()
+            return
+        self.received = sum(self._has(chunk) for chunk in range(self.total))
+        self._advance()
+
+    def _persist(self) -> None:
+        path = self.path.encode("utf-8")
+        body = (
+            struct.pack(
+                MAP_FORMAT,
+                self.transfer_id,
+                self.size,
+                self.crc,
+                self.chunk_size,
+                len(path),
+            )
+            + path
+            + self._bitmap
+        )
+        with open(self._map_path(), "wb") as f:
+            f.write(body + struct.pack("<H", _crc16(body)))
+
+    def begin(
+        self, transfer_id: int, size: int, crc: int, chunk_size: int, path: str
+    ) -> dict:
+        """Start an upload, or resume the staged one if it has the same
+        parameters.
+
+        Returns:
+            The status to send to the ground station.
+
+        Raises:
+            ValueError: If the parameters are not usable.
+            OSError: If the staging directory cannot be written.
+        """
+        if chunk_size <= 0 or not path or len(path.encode("utf-8")) > 0xFF:
+            raise ValueError("bad upload parameters")
+        total = (size + chunk_size - 1) // chunk_size
+        if total > 0xFFFF:
+            raise ValueError("too many chunks")
+
+        if (transfer_id, size, crc, chunk_size, path) != (
+            self.transfer_id,
+            self.size,
+            self.crc,
+            self.chunk_size,
+            self.path,
+        ):
+            self.discard()
+            self.transfer_id = transfer_id
+            self.size = size
+            self.crc = crc
+            self.chunk_size = chunk_size
+            self.path = path
+            self.total = total
+            self._bitmap = bytearray((total + 7) // 8)
+            # Truncate whatever was staged before
+            with open(self._staging_path(), "wb"):
+                pass
+            self._persist()
+
+        if self._file is None:
+            self._file = open(self._staging_path(), "r+b")
+        return self.status()
+
+    def on_packet(self, packet: bytes) -> bytes | None:
+        """Handle a data packet.
+
+        Returns:
+            The acknowledgement to send back, if the packet asked for one.
+        """
+        if (
+            self._file is None
+            or len(packet) < DATA_HEADER_LENGTH
+            or packet[0] != TYPE_DATA
+        ):
+            return None
+        _, transfer_id, chunk, total, flags = struct.unpack(
+            DATA_FORMAT, packet[:DATA_HEADER_LENGTH]
+        )
+        if transfer_id != self.transfer_id or total != self.total:
+            return None
+
+        data = packet[DATA_HEADER_LENGTH:]
+        expected = min(self.chunk_size, self.size - chunk * self.chunk_size)
+        if chunk >= self.total or len(data) != expected:
+            self.stats.rejected += 1
+        elif self._has(chunk):
+            self.stats.duplicates += 1
+        else:
+            self._file.seek(chunk * self.chunk_size)
+            self._file.write(data)
+            self._bitmap[chunk >> 3] |= 1 << (chunk & 7)
+            self.received += 1
+            self.stats.packets += 1
+            self._advance()
+
+        if not flags & FLAG_POLL:
+            return None
+        # What the bitmap records must already be in the staged file
+        self._file.flush()
+        self._persist()
+        bitmap = 0
+        for i in range(32):
+            chunk_after = self.cumulative + 1 + i
+            if chunk_after < self.total and self._has(chunk_after):
+                bitmap |= 1 << i
+        return struct.pack(
+            ACK_FORMAT, TYPE_ACK, self.transfer_id, self.cumulative, bitmap, chunk
+        )
+
+    def run(
+        self,
+        link,
+        watchdog=None,
+        idle_timeout: float = UPLOAD_IDLE_TIMEOUT,
+        linger: float = 5.0,
+    ) -> bool:
+        """Receive chunks over a radio until the upload is complete or the
+        ground station goes quiet.
+
+        After the last chunk, keeps answering polls for ``linger`` seconds in
+        case the final acknowledgement was lost.
+
+        Args:
+            link: Anything with ``send(bytes)`` and ``receive(timeout)``.
+            watchdog: Petted on every iteration, if given.
+            idle_timeout: Give up after this many seconds without a packet.
+            linger: Seconds to keep listening once the upload is complete.
+
+        Returns:
+            Whether every chunk is staged.
+        """
+        last_heard = time.monotonic()
+        while time.monotonic() - last_heard < (linger if self.done else idle_timeout):
+            if watchdog is not None:
+                watchdog.pet()
+            packet = link.receive(timeout=1)
+            if packet is None:
+                continue
+            last_heard = time.monotonic()
+            ack = self.on_packet(packet)
+            if ack is not None:
+                link.send(ack)
+        return self.done
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def commit(self) -> bool:
+        """Check the staged file's CRC and move it to its destination.
+
+        A staged file that fails the check is discarded.
+
+        Returns:
+            Whether the destination was replaced.
+        """
+        if not self.done:
+            return False
+        self.close()
+        if file_crc(self._staging_path()) != self.crc:
+            self.stats.crc_failures += 1
+            self._log.error(
+                "Uplinked file failed its CRC check",
+                ValueError("CRC mismatch"),
+                path=self.path,
+            )
+            self.discard()
+            return False
+
+        old = self.path + _OLD_SUFFIX
+        replacing = _exists(self.path)
+        if replacing:
+            os.rename(self.path, old)
+        os.rename(self._staging_path(), self.path)
+        if replacing:
+            os.remove(old)
+        self.stats.committed += 1
+        self._log.info("Committed uplinked file", path=self.path, bytes=self.size)
+        self.discard()
+        return True
+
+    def discard(self) -> None:
+        """Forget the staged upload and delete its files."""
+        self.close()
+        for path in (self._map_path(), self._staging_path()):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.transfer_id = None
+        self.path = None
+        self.size = self.crc = self.chunk_size = self.total = 0
+        self._bitmap = bytearray()
+        self.cumulative = self.received = 0
+
+    def status(self) -> dict:
+        """The staged upload and counters, for the ground station and for
+        logging."""
+        status = self.stats.to_dict()
+        status.update(
+            upload=self.transfer_id,
+            path=self.path,
+            have=self.cumulative,
+            received=self.received,
+            total=self.total,
+        )
+        return status
@@ -6,149 +6,43 @@
 Built for the PySquared FC Board
 Version: 2.0.0
 Published: Nov 19, 2024
+
+The flight logic lives in lib/proveskit_rp2040_v4/flight.py so that it ships
+precompiled to .mpy. Keep this file as small as possible: CircuitPython
+compiles it from source on every boot.
 """
 
-import gc
-import os
 import time
 
-import digitalio
-import microcontroller
-from busio import SPI
-
-try:
-    from board_definitions import proveskit_rp2040_v4 as board
-except ImportError:
-    import board
-
-from lib.proveskit_rp2040_v4.register import Register
-from lib.pysquared.beacon import Beacon
-from lib.pysquared.cdh import CommandDataHandler
-from lib.pysquared.config.config import Config
-from lib.pysquared.hardware.busio import _spi_init, initialize_i2c_bus
-from lib.pysquared.hardware.digitalio import initialize_pin
-from lib.pysquared.hardware.imu.manager.lsm6dsox import LSM6DSOXManager
-from lib.pysquared.hardware.magnetometer.manager.lis2mdl import LIS2MDLManager
-from lib.pysquared.hardware.radio.manager.rfm9x import RFM9xManager
-from lib.pysquared.hardware.radio.packetizer.packet_manager import PacketManager
-from lib.pysquared.logger import Logger, LogLevel
-from lib.pysquared.nvm.counter import Counter
-from lib.pysquared.rtc.manager.microcontroller import MicrocontrollerManager
-from lib.pysquared.sleep_helper import SleepHelper
-from lib.pysquared.watchdog import Watchdog
-from version import __version__
-
+# Taken before anything else is imported, so that boot timing and the boot
+# time in beacons include every import
+boot_started: float = time.monotonic()
 boot_time: float = time.time()
 
-rtc = MicrocontrollerManager()
-
-(boot_count := Counter(index=Register.boot_count)).increment()
-error_count: Counter = Counter(index=Register.error_count)
-
-logger: Logger = Logger(
-    error_counter=error_count,
-    colorized=False,
-    log_level=LogLevel.INFO,
-)
-
-logger.info(
-    "Booting",
-    hardware_version=os.uname().version,
-    software_version=__version__,
-)
-
-try:
-    loiter_time: int = 5
-    for i in range(loiter_time):
-        logger.info(f"Code Starting in {loiter_time-i} seconds")
-        time.sleep(1)
-
-    watchdog = Watchdog(logger, board.WDT_WDI)
-    watchdog.pet()
-
-    logger.debug("Initializing Config")
-    config: Config = Config("config.json")
+import gc  # noqa: E402
 
-    # TODO(nateinaction): fix spi init
-    spi0: SPI = _spi_init(
-        logger,
-        board.SPI0_SCK,
-        board.SPI0_MOSI,
-        board.SPI0_MISO,
-    )
+heap_at_boot: int = gc.mem_alloc()
 
-    radio = RFM9xManager(
-        logger,
-        config.radio,
-        spi0,
-        initialize_pin(logger, board.SPI0_CS0, digitalio.Direction.OUTPUT, True),
-        initialize_pin(logger, board.RF1_RST, digitalio.Direction.OUTPUT, True),
-    )
+# Hold off garbage collection until the imports are done, so that the heap
+# they allocate is logged as its peak. For development only: with collection
+# held off, a heap the imports would fit after collecting runs out of memory.
+MEASURE_IMPORT_PEAK = False
+if MEASURE_IMPORT_PEAK:
+    gc.disable()
 
-    packet_manager = PacketManager(
-        logger,
-        radio,
-        config.radio.license,
-        Counter(Register.message_count),
-        0.2,
-    )
+from lib.proveskit_rp2040_v4.ota import boot_check  # noqa: E402
 
-    i2c1 = initialize_i2c_bus(
-        logger,
-        board.I2C1_SCL,
-        board.I2C1_SDA,
-        100000,
-    )
+# Count this boot against an over-the-air update on trial, or roll it back
+update = boot_check()
 
-    magnetometer = LIS2MDLManager(logger, i2c1)
-
-    imu = LSM6DSOXManager(logger, i2c1, 0x6B)
-
-    sleep_helper = SleepHelper(logger, config, watchdog)
-
-    cdh = CommandDataHandler(logger, config, packet_manager)
-
-    beacon = Beacon(
-        logger,
-        config.cubesat_name,
-        packet_manager,
-        boot_time,
-        imu,
-        magnetometer,
-        radio,
-        error_count,
-        boot_count,
-    )
-
-    def nominal_power_loop():
-        logger.debug(
-            "FC Board Stats",
-            bytes_remaining=gc.mem_free(),
-        )
-
-        packet_manager.send(config.radio.license.encode("utf-8"))
-
-        beacon.send()
-
-        cdh.listen_for_commands(10)
-
-        beacon.send()
-
-        cdh.listen_for_commands(config.sleep_duration)
-
-    try:
-        logger.info("Entering main loop")
-        while True:
-            # TODO(nateinaction): Modify behavior based on power state
-            nominal_power_loop()
+try:
+    from lib.proveskit_rp2040_v4.flight import run  # noqa: E402
+except Exception:
+    if update is None:
+        raise
+    # The update broke an import; reset until boot_check rolls it back
+    import microcontroller
 
-    except Exception as e:
-        logger.critical("Critical in Main Loop", e)
-        time.sleep(10)
-        microcontroller.on_next_reset(microcontroller.RunMode.NORMAL)
-        microcontroller.reset()
-    finally:
-        logger.info("Going Neutral!")
+    microcontroller.reset()
 
-except Exception as e:
-    logger.critical("An exception occured within main.py", e)
+run(boot_started, boot_time, heap_at_boot)
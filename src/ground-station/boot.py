@@ -0,0 +1,25 @@
+"""Decide whether the ground station or the USB host may write to flash.
+
+CircuitPython lets either code or the USB host write to CIRCUITPY, never
+both, and gives it to the host unless boot.py remounts it. The host keeps
+it by default so that ``make install`` works on a fresh or reset board.
+
+The ground station writes what it receives and the images it reassembles to
+flash, which needs ``code_write``: install with ``make
+install-ground-station CODE_WRITE=1``, or create it from the host, and
+reset. To hand write access back to the host, from the REPL run
+``import os; os.remove("/code_write")`` and reset.
+"""
+
+import os
+
+import storage
+
+CODE_WRITE = "/code_write"
+
+try:
+    os.stat(CODE_WRITE)
+except OSError:
+    pass
+else:
+    storage.remount("/", readonly=False)
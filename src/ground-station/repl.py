@@ -1,3 +1,7 @@
+import asyncio
+import json
+import time
+
 import digitalio
 from busio import SPI
 
@@ -7,6 +11,46 @@ except ImportError:
     import board
 
 from lib.proveskit_ground_station.proveskit_ground_station import GroundStation
+from lib.proveskit_rp2040_v4.bulk_transfer import (
+    DATA_HEADER_LENGTH,
+    DEFAULT_WINDOW,
+    FileSegments,
+    SelectiveRepeatReceiver,
+    SelectiveRepeatSender,
+    TransferError,
+    file_crc,
+)
+from lib.proveskit_rp2040_v4.cad_listen import WakePreamble
+from lib.proveskit_rp2040_v4.commands import (
+    COMMAND_APPLY_UPDATE,
+    COMMAND_DOWNLINK,
+    COMMAND_DOWNLINK_IMAGE,
+    COMMAND_UPLOAD,
+    COMMAND_UPLOAD_STATUS,
+    DOWNLINK_ARGS,
+    DOWNLINK_IMAGE_ARGS,
+    OPCODE_APPLY_UPDATE,
+    OPCODE_DOWNLINK,
+    OPCODE_DOWNLINK_IMAGE,
+    OPCODE_UPLOAD,
+    UPDATE_DIRECTORY,
+    UPLOAD_ARGS,
+    UPLOAD_IDLE_TIMEOUT,
+    CommandBatcher,
+    json_command,
+    opcode_command,
+)
+from lib.proveskit_rp2040_v4.fec import FECRadio
+from lib.proveskit_rp2040_v4.framing import FramedPacketManager, IdentifiedRadio
+from lib.proveskit_rp2040_v4.ground_pipeline import (
+    Console,
+    DecodedPacketManager,
+    MessageDecoder,
+    Pipeline,
+)
+from lib.proveskit_rp2040_v4.image_downlink import RANGE_LENGTH, pack_ranges
+from lib.proveskit_rp2040_v4.image_reassembly import ImageReassembler
+from lib.proveskit_rp2040_v4.link_control import LinkController, RFM9xModem
 from lib.pysquared.cdh import CommandDataHandler
 from lib.pysquared.config.config import Config
 from lib.pysquared.hardware.busio import _spi_init
@@ -37,12 +81,65 @@ radio = RFM9xManager(
     initialize_pin(logger, board.RF1_RST, digitalio.Direction.OUTPUT, True),
 )
 
-packet_manager = PacketManager(
+# Must match FEC_CODE_RATE, ADAPTIVE_LINK and CAD_PROBE_INTERVAL in the flight
+# software
+FEC_CODE_RATE = None
+ADAPTIVE_LINK = False
+CAD_PROBE_INTERVAL = None
+
+# Receive through the asyncio pipeline instead of GroundStation.run, see
+# ground_pipeline. Commands are typed on the serial console, see
+# run_console_command.
+PIPELINE = True
+
+# Where the pipeline appends what it receives, one JSON record per line, a
+# gap between bursts' worth at a time.
+# CircuitPython only lets code write to its filesystem once boot.py has
+# remounted it, which it does when /code_write is there.
+RECEIVED_LOG = "/received.jsonl"
+
+# Where downlinked images are put together, see image_reassembly
+IMAGE_DIRECTORY = "/images"
+
+# Seconds the pipeline's receive waits for a packet before the other stages
+# get a turn
+RX_TIMEOUT = 0.05
+
+# Seconds between pipeline stats in the log
+PIPELINE_STATS_INTERVAL = 60.0
+
+link = radio
+if CAD_PROBE_INTERVAL:
+    link = WakePreamble(link, radio._radio, CAD_PROBE_INTERVAL)
+if FEC_CODE_RATE:
+    link = FECRadio(logger, link, FEC_CODE_RATE)
+if ADAPTIVE_LINK:
+    # The ground station follows the satellite's proposals
+    link = LinkController(
+        logger,
+        link,
+        RFM9xModem(radio._radio),
+        (config.radio.lora.spreading_factor, config.radio.lora.coding_rate),
+        propose=False,
+    )
+# Identifies what the ground station sends past the packet manager, such as
+# uploads and acknowledgements, and drops the satellite's ID frames
+link = IdentifiedRadio(logger, link, config.radio.license)
+
+# Undoes the flight software's message framing, such as compression, before
+# the ground station sees a message, and identifies the ground station's own
+# transmissions
+packet_manager = FramedPacketManager(
     logger,
-    radio,
-    config.radio.license,
-    Counter(2),
-    0.2,
+    PacketManager(
+        logger,
+        link,
+        config.radio.license,
+        Counter(2),
+        0.2,
+    ),
+    callsign=config.radio.license,
+    identified_radio=link,
 )
 
 cdh = CommandDataHandler(
@@ -51,11 +148,292 @@ cdh = CommandDataHandler(
     packet_manager,
 )
 
+
+def receive_file(path: str, idle_timeout: float = 30.0) -> bool:
+    """Receive a file the satellite sends with ``Satellite.send_file``."""
+    with open(path, "wb") as f:
+        receiver = SelectiveRepeatReceiver(f.write)
+        done = receiver.run(link, idle_timeout)
+
+    logger.info(
+        "Bulk transfer complete" if done else "Bulk transfer incomplete",
+        path=path,
+        packets=receiver.cumulative,
+        total=receiver.total,
+        duplicates=receiver.duplicates,
+    )
+    return done
+
+
+def receive_archive(start: int, end: int, path: str) -> bool:
+    """Ask the satellite for its archived telemetry stamped from ``start`` to
+    ``end`` and receive it into ``path``.
+
+    The file holds whole archive records, see
+    ``telemetry_archive.unpack_record``.
+    """
+    packet_manager.send(
+        opcode_command(config, OPCODE_DOWNLINK, DOWNLINK_ARGS, start, end)
+    )
+    return receive_file(path)
+
+
+def _upload_status(timeout: float, key: str = "upload") -> dict | None:
+    """Wait up to ``timeout`` seconds for the satellite's status reply that
+    has ``key``, its upload status by default."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        message = packet_manager.listen(deadline - time.monotonic())
+        if message is None:
+            continue
+        try:
+            status = json.loads(bytes(message).decode("utf-8"))
+        except (ValueError, UnicodeError):
+            continue
+        if isinstance(status, dict) and key in status:
+            return status
+    return None
+
+
+def upload_file(
+    local_path: str,
+    remote_path: str,
+    window: int = DEFAULT_WINDOW,
+    timeout: float = 10.0,
+) -> bool:
+    """Send a file to ``remote_path`` on the satellite, carrying on from
+    where an earlier attempt at the same file stopped.
+
+    Returns:
+        Whether the satellite received the whole file and committed it.
+    """
+    chunk_size = link.get_max_packet_size() - DATA_HEADER_LENGTH
+    crc = file_crc(local_path)
+    # The same file gets the same id, so the satellite resumes it
+    transfer_id = crc & 0xFF
+    segments = FileSegments(local_path, chunk_size)
+    try:
+        packet_manager.send(
+            opcode_command(
+                config,
+                OPCODE_UPLOAD,
+                UPLOAD_ARGS,
+                transfer_id,
+                segments.size,
+                crc,
+                chunk_size,
+                tail=remote_path.encode("utf-8"),
+            )
+        )
+        status = _upload_status(timeout)
+        if status is None or status["upload"] != transfer_id:
+            logger.info("Satellite did not start the upload", path=remote_path)
+            return False
+
+        sender = SelectiveRepeatSender(
+            segments, transfer_id, window, start=status["have"]
+        )
+        try:
+            sender.run(
+                link,
+                between_bursts=lambda: logger.debug(
+                    "Upload progress", acked=sender.base, total=sender.total
+                ),
+            )
+        except TransferError as e:
+            logger.error("Upload failed", e, path=remote_path)
+        # After a failure the satellite reports once it gives up waiting
+        status = _upload_status(
+            timeout if sender.done else timeout + UPLOAD_IDLE_TIMEOUT
+        )
+    finally:
+        segments.close()
+
+    logger.info("Upload ended", path=remote_path, status=status)
+    return bool(status and status.get("committed"))
+
+
+def update_software(
+    bundle_path: str,
+    remote_path: str = UPDATE_DIRECTORY + "/update.ota",
+    timeout: float = 30.0,
+) -> bool:
+    """Upload an update bundle built with ``scripts/make_patch.py`` and have
+    the satellite apply it.
+
+    The satellite resets into the update once it is installed, and rolls it
+    back by itself if the new software does not reach its main loop.
+
+    Returns:
+        Whether the satellite installed the update.
+    """
+    if not upload_file(bundle_path, remote_path):
+        return False
+    packet_manager.send(
+        opcode_command(config, OPCODE_APPLY_UPDATE, tail=remote_path.encode("utf-8"))
+    )
+    status = _upload_status(timeout, "update")
+    logger.info("Update ended", path=remote_path, status=status)
+    return bool(status and status.get("installed"))
+
+
+# Batches fit one packet after the PacketManager's 4 byte header, and carry
+# only the commands the flight software registers with its CommandRouter
+batcher = CommandBatcher(
+    config,
+    link.get_max_packet_size() - 4,
+    commands=(
+        COMMAND_DOWNLINK,
+        COMMAND_UPLOAD,
+        COMMAND_UPLOAD_STATUS,
+        COMMAND_DOWNLINK_IMAGE,
+        COMMAND_APPLY_UPDATE,
+    ),
+)
+
+
+def send_batch(commands: list, timeout: float = 5.0, retries: int = 5) -> dict:
+    """Send ``(command, args)`` pairs to the satellite in batches.
+
+    Returns:
+        ``(code, value)`` results by sequence number, see ``commands``.
+
+    Raises:
+        ValueError: If a command is not one the satellite batches; nothing
+            is sent then.
+    """
+    for command, _ in commands:
+        batcher.check(command)
+    sequences = [batcher.add(command, args) for command, args in commands]
+    attempts = 0
+    while batcher.pending() and attempts <= retries:
+        packet_manager.send(batcher.envelope())
+        response = packet_manager.listen(timeout)
+        if response is None or not batcher.on_response(response):
+            attempts += 1
+        else:
+            attempts = 0
+
+    results = {sequence: batcher.results.get(sequence) for sequence in sequences}
+    logger.info("Batch complete", pending=batcher.pending(), results=results)
+    return results
+
+
+def repeat(message: str) -> bool:
+    """Ask the satellite to repeat ``message``, signed with our callsign.
+
+    The satellite limits how often it repeats for one callsign, see
+    ``repeater``.
+    """
+    return packet_manager.send(
+        f"{config.repeat_code}{config.radio.license}:{message}".encode("utf-8")
+    )
+
+
+images = ImageReassembler(logger, IMAGE_DIRECTORY)
+
+
+def request_image(image_id: int) -> bool:
+    """Ask the satellite for the chunks of image ``image_id`` not yet
+    received, or the whole image the first time.
+
+    The chunks come in through the pipeline, or ``GroundStation.run``; run
+    this again on the next pass until the image is complete.
+
+    Returns:
+        Whether anything was asked for.
+    """
+    prefix = opcode_command(config, OPCODE_DOWNLINK_IMAGE, DOWNLINK_IMAGE_ARGS, 0, 0)
+    # The command fits one packet after the PacketManager's 4 byte header
+    max_ranges = (link.get_max_packet_size() - 4 - len(prefix)) // RANGE_LENGTH
+    request = images.resend_ranges(image_id, max_ranges)
+    if request is None:
+        logger.info("Image already complete", image=image_id)
+        return False
+    chunk_size, ranges = request
+    logger.info("Requesting image", image=image_id, ranges=ranges)
+    return packet_manager.send(
+        opcode_command(
+            config,
+            OPCODE_DOWNLINK_IMAGE,
+            DOWNLINK_IMAGE_ARGS,
+            image_id,
+            chunk_size,
+            tail=pack_ranges(ranges),
+        )
+    )
+
+
+def store_records(records: list) -> None:
+    with open(RECEIVED_LOG, "a") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def show_record(record: dict) -> None:
+    logger.info("Received", **record)
+
+
+def _console_arg(word: str):
+    try:
+        return json.loads(word)
+    except ValueError:
+        return word
+
+
+# Console commands run on the ground station; anything else is sent to the
+# satellite as a command. Transfers hold the pipeline until they end.
+CONSOLE_ACTIONS = {
+    "archive": receive_archive,
+    "upload": upload_file,
+    "update": update_software,
+    "image": request_image,
+    "repeat": lambda *words: repeat(" ".join(str(word) for word in words)),
+}
+
+
+def run_console_command(line: str) -> None:
+    """Run a line typed while the pipeline runs: a command name and its
+    arguments separated by spaces, each read as JSON if it can be, such as
+    ``image 3`` or ``downlink_archive 1700000000 1700003600``."""
+    words = line.split()
+    command, args = words[0], [_console_arg(word) for word in words[1:]]
+    action = CONSOLE_ACTIONS.get(command)
+    if action is not None:
+        action(*args)
+        return
+    packet_manager.send(json_command(config, command, args))
+    logger.info("Sent command", command=command, args=args)
+
+
+pipeline = Pipeline(logger, lambda: packet_manager.listen(RX_TIMEOUT))
+pipeline.add("decode", MessageDecoder())
+# Writes wait for a gap between bursts and store everything waiting at once,
+# see ground_pipeline
+pipeline.add(
+    "persist", store_records, after="decode", queue_size=64, defer=0.5, batch=True
+)
+pipeline.add("display", show_record, after="decode")
+pipeline.add("images", images.on_packet, queue_size=64, defer=0.5)
+
+
+async def run_pipeline() -> None:
+    asyncio.create_task(pipeline.run())
+    asyncio.create_task(Console(logger, run_console_command).run())
+    while True:
+        await asyncio.sleep(PIPELINE_STATS_INTERVAL)
+        logger.info("Pipeline stats", images=images.status(), **pipeline.status())
+
+
+# GroundStation.run cannot read binary beacons or put images together itself
 ground_station = GroundStation(
     logger,
     config,
-    packet_manager,
+    DecodedPacketManager(packet_manager, on_chunk=images.on_packet),
     cdh,
 )
 
-ground_station.run()
+if PIPELINE:
+    asyncio.run(run_pipeline())
+else:
+    ground_station.run()